@@ -0,0 +1,198 @@
+"""
+Admission control in front of the database pool: every database.Pool has
+an `AdmissionController` that its acquire() goes through.
+
+A request holds an admission slot while it holds a connection; there are
+as many slots as pooled connections (DB_POOL_MAX_SIZE), so the pool itself
+never queues. Every acquire runs at the priority of the current request
+(a contextvar, set per route by the `high_priority` / `low_priority`
+dependencies and by background loops with `set_priority()`; the default
+is normal):
+
+- high: swipe decisions, duel results and the vote flusher. May use every
+  connection and waits up to ADMISSION_WAIT_HIGH seconds.
+- normal: may use all but ADMISSION_RESERVED_HIGH connections, waits up to
+  ADMISSION_WAIT_NORMAL.
+- low: listings, leaderboards, imports, partition maintenance and the
+  session janitor. May use at most ADMISSION_LOW_SHARE of the connections,
+  waits up to ADMISSION_WAIT_LOW.
+
+A freed slot goes to the oldest waiter of the highest priority; lower
+priorities never overtake a higher one. When the wait runs out, or more
+than ADMISSION_MAX_QUEUE requests are already waiting (high priority is
+never turned away for that), `Overloaded` is raised: a 503 with
+Retry-After: ADMISSION_RETRY_AFTER, instead of an unbounded queue inside
+the server.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+
+from fastapi import HTTPException
+
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+ADMISSION_RESERVED_HIGH = int(os.getenv("ADMISSION_RESERVED_HIGH", "2"))
+ADMISSION_LOW_SHARE = float(os.getenv("ADMISSION_LOW_SHARE", "0.5"))
+ADMISSION_WAIT_HIGH = float(os.getenv("ADMISSION_WAIT_HIGH", "5"))
+ADMISSION_WAIT_NORMAL = float(os.getenv("ADMISSION_WAIT_NORMAL", "2"))
+ADMISSION_WAIT_LOW = float(os.getenv("ADMISSION_WAIT_LOW", "0.5"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+current_priority = contextvars.ContextVar("admission_priority", default=NORMAL)
+
+
+class Overloaded(HTTPException):
+    def __init__(self, priority: str, reason: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Server is busy ({reason}), retry later",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+        )
+        self.priority = priority
+        self.reason = reason
+
+
+def set_priority(priority: str):
+    """Priority of the pool acquires in the current task from now on."""
+    current_priority.set(priority)
+
+
+# Route dependencies: dependencies=[Depends(admission.high_priority)].
+# FastAPI awaits async dependencies in the request's own task, so the
+# contextvar set here is what the handler's db.acquire() sees.
+async def high_priority():
+    set_priority(HIGH)
+
+
+async def low_priority():
+    set_priority(LOW)
+
+
+class _PriorityStats:
+    def __init__(self):
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+
+    def to_dict(self, waiting: int, limit: int) -> dict:
+        return {
+            "limit": limit,
+            "waiting": waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            # Over the requests that had to wait
+            "avg_wait_ms": round(self.wait_ms_total / self.queued, 2) if self.queued else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+class AdmissionController:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.limits = {
+            HIGH: capacity,
+            NORMAL: max(1, capacity - ADMISSION_RESERVED_HIGH),
+            LOW: max(1, min(capacity - ADMISSION_RESERVED_HIGH, int(capacity * ADMISSION_LOW_SHARE))),
+        }
+        self.waits = {HIGH: ADMISSION_WAIT_HIGH, NORMAL: ADMISSION_WAIT_NORMAL, LOW: ADMISSION_WAIT_LOW}
+        self.in_use = 0
+        self.max_in_use = 0
+        self._waiters = {priority: deque() for priority in PRIORITIES}
+        self._stats = {priority: _PriorityStats() for priority in PRIORITIES}
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def enter(self, priority: str = None):
+        """Takes a slot for the current priority or raises Overloaded."""
+        priority = priority or current_priority.get()
+        stats = self._stats[priority]
+        if self.in_use < self.limits[priority] and not self._waiting_at_or_above(priority):
+            self._take()
+            stats.admitted += 1
+            return
+        if priority != HIGH and self.waiting >= ADMISSION_MAX_QUEUE:
+            stats.rejected_queue_full += 1
+            raise Overloaded(priority, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        stats.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.waits[priority])
+        except asyncio.TimeoutError:
+            self._forget(priority, waiter)
+            stats.rejected_timeout += 1
+            raise Overloaded(priority, "timed out waiting for a database connection")
+        except asyncio.CancelledError:
+            # Client went away: give back a slot handed over in the meantime
+            self._forget(priority, waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.leave()
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - started) * 1000
+            stats.wait_ms_total += wait_ms
+            stats.max_wait_ms = max(stats.max_wait_ms, wait_ms)
+        stats.admitted += 1
+
+    def leave(self):
+        self.in_use -= 1
+        self._wake()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "waiting": self.waiting,
+            "priorities": {
+                priority: self._stats[priority].to_dict(len(self._waiters[priority]), self.limits[priority])
+                for priority in PRIORITIES
+            },
+        }
+
+    def _take(self):
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def _waiting_at_or_above(self, priority: str) -> bool:
+        for other in PRIORITIES:
+            if self._waiters[other]:
+                return True
+            if other == priority:
+                return False
+        return False
+
+    def _forget(self, priority: str, waiter):
+        try:
+            self._waiters[priority].remove(waiter)
+        except ValueError:
+            pass
+
+    def _wake(self):
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self.in_use < self.limits[priority]:
+                waiter = waiters.popleft()
+                if waiter.done():
+                    continue
+                self._take()
+                waiter.set_result(None)
+            if waiters:
+                # Limits only shrink further down: nothing lower may overtake
+                return
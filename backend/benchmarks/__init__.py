@@ -0,0 +1 @@
+# Microbenchmarks
@@ -0,0 +1,72 @@
+"""
+Benchmark: Bradley–Terry fit time against the number of duel votes
+(ratings.py, the core of jobs/fit_ratings.py).
+
+For each size, synthetic duels are drawn from known card strengths and
+fed to DuelCounts in cursor-sized chunks, then fitted. Reported per size:
+accumulation time, fit time, iterations, the pair table size (what stays
+in memory) and the correlation of the fitted ratings with the true ones.
+No database is needed.
+
+Run from backend/: python -m benchmarks.bench_ratings [--cards 500] [--votes 10000,100000,1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratings  # noqa: E402
+
+CHUNK = 50_000
+
+
+def make_duels(rng, strengths: np.ndarray, duels: int):
+    size = len(strengths)
+    first = rng.integers(0, size, duels)
+    # A different opponent for every duel
+    second = (first + rng.integers(1, size, duels)) % size
+    p_first = 1.0 / (1.0 + np.exp(strengths[second] - strengths[first]))
+    first_won = rng.random(duels) < p_first
+    return np.where(first_won, first, second), np.where(first_won, second, first)
+
+
+def bench(rng, cards: int, votes: int):
+    strengths = rng.normal(0.0, 1.0, cards)
+    # Every duel is two votes (winner smash, loser pass)
+    winners, losers = make_duels(rng, strengths, votes // 2)
+
+    started = time.perf_counter()
+    counts = ratings.DuelCounts(range(cards))
+    for start in range(0, len(winners), CHUNK):
+        counts.add(winners[start:start + CHUNK], losers[start:start + CHUNK])
+    accumulated = time.perf_counter()
+    fitted, iterations = ratings.fit(counts)
+    finished = time.perf_counter()
+
+    pairs = len(counts.pairs()[0])
+    correlation = np.corrcoef(fitted, strengths)[0, 1]
+    print(
+        f"{votes:>12,} votes  accumulate {accumulated - started:7.3f}s  fit {finished - accumulated:7.3f}s  "
+        f"{iterations:4d} iterations  {pairs:>9,} pairs  r={correlation:.4f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=500, help="cards in the deck")
+    parser.add_argument("--votes", default="10000,100000,1000000,10000000", help="comma-separated vote counts")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{args.cards} cards, chunks of {CHUNK} duels")
+    for votes in (int(v) for v in args.votes.split(",")):
+        bench(rng, args.cards, votes)
+
+
+if __name__ == "__main__":
+    main()
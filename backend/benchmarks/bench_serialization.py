@@ -0,0 +1,172 @@
+"""
+Microbenchmark: CPU per request spent turning rows into a response body for
+GET /cards/deck/{id} and GET /sessions/{id}/state, before and after the
+serialization layer (serialization.py).
+
+"before" is the old path: copy each row into a dict, json.loads the
+metadata text, then FastAPI's jsonable_encoder + JSONResponse. "after" is
+the orjson jsonb codec (its decode cost is included) and FastJSONResponse
+rendering the objects as they are. No database is needed; rows are
+synthetic dicts shaped like the real ones.
+
+Run from backend/: python -m benchmarks.bench_serialization [--cards 50]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import FastJSONResponse  # noqa: E402
+
+
+def make_cards(count: int):
+    now = datetime.now(timezone.utc)
+    deck_id = uuid.uuid4()
+    cards = []
+    for i in range(count):
+        metadata = {"tags": ["tag-a", "tag-b"], "source": "import", "rank": i}
+        cards.append({
+            "id": uuid.uuid4(),
+            "deck_id": deck_id,
+            "title": f"Card {i}",
+            "description": "Lorem ipsum dolor sit amet " * 3,
+            "image_url": f"https://example.com/images/{i}.jpg",
+            "metadata": metadata,
+            "position": i,
+            "created_at": now,
+            "updated_at": now,
+        })
+    return cards
+
+
+def as_text_rows(cards):
+    """Rows as asyncpg returned them without a codec: metadata is JSON text."""
+    return [{**card, "metadata": json.dumps(card["metadata"])} for card in cards]
+
+
+def as_wire_metadata(cards):
+    """jsonb payloads as the binary codec receives them."""
+    return [b"\x01" + orjson.dumps(card["metadata"]) for card in cards]
+
+
+def old_decode(rows):
+    result = []
+    for row in rows:
+        card = {k: v for k, v in row.items()}
+        if isinstance(card.get("metadata"), str):
+            try:
+                card["metadata"] = json.loads(card["metadata"])
+            except ValueError:
+                card["metadata"] = {}
+        result.append(card)
+    return result
+
+
+def old_render(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def new_decode(cards, wire):
+    # The codec decodes each jsonb value while the rows are read
+    for data in wire:
+        orjson.loads(data[1:])
+    return cards
+
+
+def new_render(content) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def bench_get_cards(count: int, number: int):
+    cards = make_cards(count)
+    rows = as_text_rows(cards)
+    wire = as_wire_metadata(cards)
+
+    def before():
+        return old_render(old_decode(rows))
+
+    def after():
+        return new_render(new_decode(cards, wire))
+
+    assert orjson.loads(before()) == orjson.loads(after())
+    return timeit.timeit(before, number=number), timeit.timeit(after, number=number)
+
+
+def bench_session_state(count: int, number: int):
+    cards = make_cards(count)
+    remaining, passed = cards[: count // 2], cards[count // 2:]
+    now = datetime.now(timezone.utc)
+    session = {
+        "id": uuid.uuid4(),
+        "deck_id": cards[0]["deck_id"],
+        "user_id": None,
+        "mode": "swipe",
+        "status": "active",
+        "card_seq": count,
+        "duel_scheduler": "bracket",
+        "created_at": now,
+        "updated_at": now,
+        "remaining_cards": [str(card["id"]) for card in remaining],
+        "passed_cards": [str(card["id"]) for card in passed],
+        "smashed_cards": [],
+    }
+    text_session = {
+        **session,
+        **{field: json.dumps(session[field]) for field in ("remaining_cards", "passed_cards", "smashed_cards")},
+    }
+    remaining_rows, passed_rows = as_text_rows(remaining), as_text_rows(passed)
+    list_wire = [b"\x01" + orjson.dumps(session[field]) for field in ("remaining_cards", "passed_cards", "smashed_cards")]
+    card_wire = as_wire_metadata(cards)
+
+    def before():
+        state = dict(text_session)
+        for field in ("remaining_cards", "passed_cards", "smashed_cards"):
+            json.loads(state[field])
+        state["remainingCards"] = old_decode(remaining_rows)
+        state["passedCards"] = old_decode(passed_rows)
+        state["smashedCards"] = json.loads(state["smashed_cards"])
+        return old_render(state)
+
+    def after():
+        for data in list_wire:
+            orjson.loads(data[1:])
+        state = dict(session)
+        state["remainingCards"] = new_decode(remaining, card_wire[: len(remaining)])
+        state["passedCards"] = new_decode(passed, card_wire[len(remaining):])
+        state["smashedCards"] = state["smashed_cards"]
+        return new_render(state)
+
+    return timeit.timeit(before, number=number), timeit.timeit(after, number=number)
+
+
+def report(name: str, before: float, after: float, number: int):
+    before_us = before / number * 1e6
+    after_us = after / number * 1e6
+    print(
+        f"{name:<22} before {before_us:9.1f} us/req   after {after_us:9.1f} us/req   "
+        f"saved {before_us - after_us:9.1f} us/req ({(1 - after / before) * 100:.0f}%)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=50, help="cards per deck / session")
+    parser.add_argument("--number", type=int, default=2000, help="iterations per case")
+    args = parser.parse_args()
+
+    print(f"{args.cards} cards, {args.number} iterations")
+    report("get_cards", *bench_get_cards(args.cards, args.number), args.number)
+    report("get_session_state", *bench_session_state(args.cards, args.number), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+In-process cache of decoded card objects.
+
+Cards are cached by ID (bounded LRU with a TTL) and grouped per deck, so a
+whole deck can be dropped at once. Deck listings only read the ordered page
+of IDs from the database (an index-only scan, see routes/cards.py) and take
+the card bodies from here. Card writes call `invalidate()`, which clears the local entries and
+publishes the same invalidation on Redis so every uvicorn worker drops them
+too (`listen_for_invalidations()` runs in each worker's lifespan). If the
+pub/sub link is lost, the TTL bounds how stale another worker can be.
+
+A fetch that overlaps an invalidation (local or from another worker) does
+not fill the cache: `epoch` counts invalidations, and rows read before the
+latest one may be the old version.
+
+The cache must only be filled from the primary database: readers on the
+read replica pass `fill=False`, so a lagging replica cannot put back a
+card that was just invalidated.
+
+Cached card dicts are handed out as-is (no per-request copy), so callers
+must treat them as read-only.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "10000"))
+CARD_CACHE_TTL = float(os.getenv("CARD_CACHE_TTL", "300"))
+INVALIDATION_CHANNEL = "pickme:cards:invalidate"
+CARDS_BY_ID_SQL = "SELECT * FROM cards WHERE id = ANY($1::uuid[])"
+
+# Lets a worker skip its own invalidation messages
+WORKER_ID = uuid.uuid4().hex
+
+
+def normalize_ids(card_ids: Iterable) -> List[str]:
+    out = []
+    for cid in card_ids:
+        try:
+            out.append(str(cid if isinstance(cid, uuid.UUID) else uuid.UUID(str(cid))))
+        except ValueError:
+            continue
+    return out
+
+
+class CardCache:
+    def __init__(self, max_cards: int, ttl: float):
+        self.max_cards = max_cards
+        self.ttl = ttl
+        self._cards: "OrderedDict[str, tuple]" = OrderedDict()
+        self._deck_members: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every invalidate()/clear(), see put()
+        self.epoch = 0
+        self.stale_fills = 0
+
+    def get(self, card_id: str) -> Optional[dict]:
+        entry = self._cards.get(card_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop_card(card_id)
+            self.misses += 1
+            return None
+        self._cards.move_to_end(card_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, card: dict, epoch: Optional[int] = None):
+        """Caches a card read from the database; `epoch` is self.epoch as it was before the read."""
+        if epoch is not None and epoch != self.epoch:
+            self.stale_fills += 1
+            return
+        card_id = str(card["id"])
+        deck_id = str(card["deck_id"]) if card.get("deck_id") else None
+        self._drop_card(card_id)
+        self._cards[card_id] = (time.monotonic() + self.ttl, card, deck_id)
+        if deck_id:
+            self._deck_members.setdefault(deck_id, set()).add(card_id)
+        while len(self._cards) > self.max_cards:
+            oldest = next(iter(self._cards))
+            self._drop_card(oldest)
+            self.evictions += 1
+
+    def invalidate(self, card_ids: Iterable[str] = (), deck_ids: Iterable[str] = ()):
+        for card_id in card_ids:
+            self._drop_card(card_id)
+        for deck_id in deck_ids:
+            for card_id in list(self._deck_members.get(deck_id, ())):
+                self._drop_card(card_id)
+        self.invalidations += 1
+        self.epoch += 1
+
+    def clear(self):
+        self._cards.clear()
+        self._deck_members.clear()
+        self.epoch += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cards": len(self._cards),
+            "decks": len(self._deck_members),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_fills": self.stale_fills,
+        }
+
+    def _drop_card(self, card_id: str):
+        entry = self._cards.pop(card_id, None)
+        if entry is not None and entry[2]:
+            members = self._deck_members.get(entry[2])
+            if members is not None:
+                members.discard(card_id)
+                if not members:
+                    del self._deck_members[entry[2]]
+
+
+cache = CardCache(CARD_CACHE_SIZE, CARD_CACHE_TTL)
+
+
+async def get_cards(conn, card_ids: Iterable, fill: bool = True) -> List[dict]:
+    """Cards for the given IDs in the same order; unknown IDs are skipped. fill=False: read-only use of the cache."""
+    ids = normalize_ids(card_ids)
+    found = {}
+    missing = []
+    for card_id in ids:
+        card = cache.get(card_id)
+        if card is None:
+            missing.append(card_id)
+        else:
+            found[card_id] = card
+    if missing:
+        epoch = cache.epoch
+        rows = await conn.fetch(CARDS_BY_ID_SQL, [uuid.UUID(card_id) for card_id in missing])
+        for row in rows:
+            card = dict(row)
+            if fill:
+                cache.put(card, epoch)
+            found[str(card["id"])] = card
+    return [found[card_id] for card_id in ids if card_id in found]
+
+
+async def get_card(conn, card_id, fill: bool = True) -> Optional[dict]:
+    cards = await get_cards(conn, [card_id], fill)
+    return cards[0] if cards else None
+
+
+async def invalidate(redis_client, card_ids: Iterable = (), deck_ids: Iterable = ()):
+    """Drops cards and deck groups here and on every other worker."""
+    card_ids = [str(cid) for cid in card_ids]
+    deck_ids = [str(did) for did in deck_ids]
+    cache.invalidate(card_ids, deck_ids)
+    if redis_client is None:
+        return
+    try:
+        await redis_client.publish(
+            INVALIDATION_CHANNEL,
+            json.dumps({"origin": WORKER_ID, "cards": card_ids, "decks": deck_ids})
+        )
+    except Exception as e:
+        print(f"Card cache invalidation publish failed: {e}")
+
+
+async def listen_for_invalidations(redis_client, retry_delay: float = 5.0):
+    """Applies invalidations published by other workers until cancelled."""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Messages may have been missed while disconnected
+            cache.clear()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = json.loads(message["data"])
+                if data.get("origin") == WORKER_ID:
+                    continue
+                cache.invalidate(data.get("cards", ()), data.get("decks", ()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Card cache invalidation listener error (retrying): {e}")
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(retry_delay)
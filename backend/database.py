@@ -0,0 +1,216 @@
+"""
+The asyncpg pool: settings from the environment and the connection `init`
+hook.
+
+- DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE: pool size per worker.
+- DB_STATEMENT_CACHE_SIZE: prepared statements kept per connection.
+- DB_POOL_MAX_INACTIVE_LIFETIME: seconds before an idle connection is closed
+  (0 keeps them open).
+- DB_POOL_MAX_QUERIES: queries after which a connection is replaced.
+- DB_ACQUIRE_TIMEOUT: default wait for a free connection in `acquire()`.
+
+acquire() first takes an admission slot (admission.py): bounded waits by
+route priority and a 503 when the pool is saturated, instead of an
+unbounded queue.
+
+`init_connection()` runs once per new connection: the JSON codecs
+(serialization.init_connection), then the hot queries of the routes are
+prepared (Connection.prepare). The pool's `Connection` runs fetch/fetchrow/
+fetchval of the same query text through those statements, so their first
+execution on a fresh connection skips parse/plan setup; other queries use
+asyncpg's statement cache. create_pool() returns once min_size
+connections are open and initialized, before the app starts serving.
+"""
+import os
+import time
+from functools import partial
+from typing import Iterable
+
+import asyncpg
+import asyncpg.pool
+
+import admission
+import serialization
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+
+
+def connect_kwargs() -> dict:
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": int(os.getenv("DB_PORT", "5432")),
+        "user": os.getenv("DB_USER", "pickme"),
+        "password": os.getenv("DB_PASSWORD", "pickme_password"),
+        "database": os.getenv("DB_NAME", "pickme_db"),
+    }
+
+
+class Pool:
+    """
+    An asyncpg pool behind admission control. It wraps the pool rather than
+    subclassing it, so only asyncpg's public pool API is used. acquire()
+    waits at most DB_ACQUIRE_TIMEOUT by default; the query shortcuts
+    (fetch/fetchrow/fetchval/execute) go through acquire() too.
+    """
+
+    def __init__(self, pool: asyncpg.pool.Pool):
+        self.pool = pool
+        self.admission = admission.AdmissionController(pool.get_max_size())
+        self._admitted = set()
+
+    def acquire(self, *, timeout=None):
+        return AdmittedAcquire(self, DB_ACQUIRE_TIMEOUT if timeout is None else timeout)
+
+    async def release(self, connection, *, timeout=None):
+        try:
+            await self.pool.release(connection, timeout=timeout)
+        finally:
+            if connection in self._admitted:
+                self._admitted.discard(connection)
+                self.admission.leave()
+
+    async def fetch(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+    async def execute(self, query, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def close(self):
+        await self.pool.close()
+
+    def terminate(self):
+        self.pool.terminate()
+
+    async def _acquire_admitted(self, timeout):
+        await self.admission.enter()
+        try:
+            connection = await self.pool.acquire(timeout=timeout)
+        except BaseException:
+            self.admission.leave()
+            raise
+        self._admitted.add(connection)
+        return connection
+
+
+class AdmittedAcquire:
+    """Same use as asyncpg's PoolAcquireContext: `async with` or `await`."""
+
+    __slots__ = ("pool", "timeout", "connection")
+
+    def __init__(self, pool: Pool, timeout):
+        self.pool = pool
+        self.timeout = timeout
+        self.connection = None
+
+    async def __aenter__(self):
+        self.connection = await self.pool._acquire_admitted(self.timeout)
+        return self.connection
+
+    async def __aexit__(self, *exc):
+        connection, self.connection = self.connection, None
+        await self.pool.release(connection)
+
+    def __await__(self):
+        return self.pool._acquire_admitted(self.timeout).__await__()
+
+
+class Connection(asyncpg.Connection):
+    """Runs the queries prepared in `init_connection()` through their prepared statements."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = {}
+
+    def _statement(self, query, record_class):
+        return self.prepared.get(query) if record_class is None else None
+
+    async def _run_prepared(self, query, method: str, *args, **kwargs):
+        try:
+            return await getattr(self.prepared[query], method)(*args, **kwargs)
+        except asyncpg.InvalidCachedStatementError:
+            # The schema changed under the statement: drop it and, as asyncpg
+            # does for its own cache, retry only outside a transaction
+            self.prepared.pop(query, None)
+            if self.is_in_transaction():
+                raise
+            return await getattr(super(), method)(query, *args, **kwargs)
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        if self._statement(query, record_class) is None:
+            return await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+        return await self._run_prepared(query, "fetch", *args, timeout=timeout)
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        if self._statement(query, record_class) is None:
+            return await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+        return await self._run_prepared(query, "fetchrow", *args, timeout=timeout)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        if self._statement(query, None) is None:
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+        return await self._run_prepared(query, "fetchval", *args, column=column, timeout=timeout)
+
+
+async def prepare_cached(conn, query: str):
+    conn.prepared[query] = await conn.prepare(query)
+
+
+async def init_connection(conn, prepared_queries: Iterable[str] = ()):
+    await serialization.init_connection(conn)
+    for query in prepared_queries:
+        try:
+            await prepare_cached(conn, query)
+        except asyncpg.PostgresError as e:
+            # e.g. a migration not applied yet: the route will fail on its own, the pool should not
+            print(f"Could not prepare query ({e}): {query.strip().splitlines()[0]}")
+
+
+async def create_pool(prepared_queries: Iterable[str] = (), server_settings: dict = None, connect: dict = None) -> Pool:
+    """The primary's pool; `connect` overrides the connection settings (e.g. the read replica)."""
+    settings = connect or connect_kwargs()
+    print(
+        f"Connecting to database: host={settings['host']}, port={settings['port']}, "
+        f"user={settings['user']}, database={settings['database']}, "
+        f"pool={DB_POOL_MIN_SIZE}..{DB_POOL_MAX_SIZE}"
+    )
+    started = time.perf_counter()
+    # min_size connections are opened and initialized (init_connection) before this returns
+    pool = await asyncpg.create_pool(
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_queries=DB_POOL_MAX_QUERIES,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        init=partial(init_connection, prepared_queries=list(prepared_queries)),
+        connection_class=Connection,
+        record_class=asyncpg.Record,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        server_settings=server_settings or {},
+        **settings,
+    )
+    print(f"Database pool ready: {pool.get_size()} connections in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return Pool(pool)
+
+
+def stats(pool: Pool) -> dict:
+    return {
+        "size": pool.pool.get_size(),
+        "idle": pool.pool.get_idle_size(),
+        "min_size": pool.pool.get_min_size(),
+        "max_size": pool.pool.get_max_size(),
+        "admission": pool.admission.stats(),
+    }
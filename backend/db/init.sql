@@ -18,6 +18,10 @@ CREATE TABLE IF NOT EXISTS decks (
     title VARCHAR(255) NOT NULL,
     description TEXT,
     privacy VARCHAR(20) DEFAULT 'public',
+    -- maintained by the cards_deck_stats_* triggers
+    card_count INTEGER NOT NULL DEFAULT 0,
+    cover_image_url VARCHAR(500),
+    cards_version BIGINT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -40,23 +44,84 @@ CREATE TABLE IF NOT EXISTS sessions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     deck_id UUID REFERENCES decks(id) ON DELETE CASCADE,
     user_id UUID REFERENCES users(id) ON DELETE SET NULL,
-    remaining_cards JSONB DEFAULT '[]',
-    passed_cards JSONB DEFAULT '[]',
-    smashed_cards JSONB DEFAULT '[]',
     mode VARCHAR(20) DEFAULT 'swipe',
     status VARCHAR(20) DEFAULT 'active',
+    card_seq INTEGER NOT NULL DEFAULT 0,
+    duel_scheduler VARCHAR(20) NOT NULL DEFAULT 'bracket',
+    -- bumped on every update (sessions_version trigger), used for compare-and-swap
+    version INTEGER NOT NULL DEFAULT 0,
+    -- set by the session janitor: finished for being idle, then card state dropped
+    expired_at TIMESTAMP,
+    compacted_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Votes/Decisions table
+-- Per-session card state: one row per (session, card)
+-- state: remaining | passed | smashed | dropped
+-- smashed_position is set while the card is in the smashed list
+-- (in duel mode a chosen card stays 'remaining' and only gets smashed_position)
+CREATE TABLE IF NOT EXISTS session_cards (
+    session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+    card_id UUID REFERENCES cards(id) ON DELETE CASCADE,
+    state VARCHAR(20) NOT NULL DEFAULT 'remaining',
+    position INTEGER NOT NULL,
+    smashed_position INTEGER,
+    PRIMARY KEY (session_id, card_id)
+);
+
+-- Votes/Decisions table, range-partitioned by month on timestamp
+-- (votes_yYYYYmMM, created ahead by votes_create_partitions(); old ones are
+-- detached and archived by the backend, see vote_partitions.py).
+-- votes_default only catches rows outside the created months.
 CREATE TABLE IF NOT EXISTS votes (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID DEFAULT uuid_generate_v4(),
     session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
     card_id UUID REFERENCES cards(id) ON DELETE CASCADE,
     decision VARCHAR(20) NOT NULL,
     round INTEGER DEFAULT 1,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    -- session mode when the vote was cast (swipe | duel)
+    mode VARCHAR(20),
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS votes_default PARTITION OF votes DEFAULT;
+
+-- Leaderboard rollups over votes, maintained by the votes_stats_insert
+-- trigger. Swipe votes count as smashes/passes, duel votes as wins/losses;
+-- seen is every vote on the card.
+CREATE TABLE IF NOT EXISTS card_vote_stats (
+    card_id UUID PRIMARY KEY REFERENCES cards(id) ON DELETE CASCADE,
+    deck_id UUID NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    seen BIGINT NOT NULL DEFAULT 0,
+    smashes BIGINT NOT NULL DEFAULT 0,
+    passes BIGINT NOT NULL DEFAULT 0,
+    duel_wins BIGINT NOT NULL DEFAULT 0,
+    duel_losses BIGINT NOT NULL DEFAULT 0,
+    last_vote_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS deck_vote_stats (
+    deck_id UUID PRIMARY KEY REFERENCES decks(id) ON DELETE CASCADE,
+    votes BIGINT NOT NULL DEFAULT 0,
+    smashes BIGINT NOT NULL DEFAULT 0,
+    passes BIGINT NOT NULL DEFAULT 0,
+    duels BIGINT NOT NULL DEFAULT 0,
+    last_vote_at TIMESTAMP,
+    -- bumped on every change, part of the leaderboard ETag
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Bradley-Terry ratings (Elo scale) of the cards that played duels,
+-- replaced per deck by the ranking job (backend/jobs/fit_ratings.py)
+CREATE TABLE IF NOT EXISTS card_ratings (
+    card_id UUID PRIMARY KEY REFERENCES cards(id) ON DELETE CASCADE,
+    deck_id UUID NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    rating DOUBLE PRECISION NOT NULL,
+    duels INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Indexes for performance
@@ -65,6 +130,592 @@ CREATE INDEX IF NOT EXISTS idx_cards_deck_id ON cards(deck_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_deck_id ON sessions(deck_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status);
+-- Latest unfinished session of a deck (get_active_session, create_session,
+-- deck_summary_view) and the janitor's scans for idle/expired sessions
+CREATE INDEX IF NOT EXISTS idx_sessions_active_deck ON sessions(deck_id, created_at DESC)
+    WHERE status != 'finished';
+CREATE INDEX IF NOT EXISTS idx_sessions_active_updated_at ON sessions(updated_at)
+    WHERE status != 'finished';
+CREATE INDEX IF NOT EXISTS idx_sessions_expired_at ON sessions(expired_at)
+    WHERE expired_at IS NOT NULL AND compacted_at IS NULL;
 CREATE INDEX IF NOT EXISTS idx_votes_session_id ON votes(session_id);
 CREATE INDEX IF NOT EXISTS idx_votes_card_id ON votes(card_id);
+CREATE INDEX IF NOT EXISTS idx_card_vote_stats_deck_id ON card_vote_stats(deck_id);
+CREATE INDEX IF NOT EXISTS idx_card_ratings_deck_id ON card_ratings(deck_id);
+CREATE INDEX IF NOT EXISTS idx_session_cards_state ON session_cards(session_id, state, position);
+CREATE INDEX IF NOT EXISTS idx_session_cards_smashed ON session_cards(session_id, smashed_position)
+    WHERE smashed_position IS NOT NULL;
+-- Keyset pagination: GET /decks/ (newest first) and GET /cards/deck/{id}
+-- (deck order, NULL positions last); the cards index covers the page query
+CREATE INDEX IF NOT EXISTS idx_decks_created_at ON decks(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_decks_user_created_at ON decks(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_cards_deck_order ON cards(deck_id, (COALESCE(position, 2147483647)), created_at, id);
+
+-- Session rows with the card lists assembled from session_cards,
+-- in the same JSON array form the API has always returned
+CREATE OR REPLACE VIEW session_view AS
+SELECT s.*,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'remaining'), '[]'::jsonb) AS remaining_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'passed'), '[]'::jsonb) AS passed_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.smashed_position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.smashed_position IS NOT NULL), '[]'::jsonb) AS smashed_cards
+FROM sessions s;
+
+-- Every update of a session row bumps its version, so writers that read,
+-- validated and then update with "WHERE version = <read version>" notice
+-- concurrent changes instead of overwriting them.
+CREATE OR REPLACE FUNCTION sessions_bump_version() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sessions_version ON sessions;
+CREATE TRIGGER sessions_version
+    BEFORE UPDATE ON sessions
+    FOR EACH ROW EXECUTE FUNCTION sessions_bump_version();
+
+-- Moves one card according to a decision (the transition rules shared by
+-- single and batch decisions). p_seq is the next sessions.card_seq value.
+CREATE OR REPLACE FUNCTION session_card_transition(
+    p_session_id UUID, p_mode TEXT, p_card_id UUID, p_decision TEXT, p_seq INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    IF p_decision = 'pass' THEN
+        INSERT INTO session_cards (session_id, card_id, state, position)
+        VALUES (p_session_id, p_card_id, 'passed', p_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = 'passed', position = EXCLUDED.position;
+    ELSIF p_mode = 'duel' THEN
+        -- the chosen card stays in remaining and is kept in smashed for history;
+        -- it moves to the back of the remaining queue (next bracket round)
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', p_seq, p_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET position = EXCLUDED.position,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    ELSE
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', p_seq, p_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = CASE WHEN session_cards.state = 'passed' THEN 'passed' ELSE 'smashed' END,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Session status after a card moved.
+CREATE OR REPLACE FUNCTION session_status_after_decision(
+    p_session_id UUID, p_mode TEXT, p_status TEXT
+) RETURNS TEXT AS $$
+DECLARE
+    v_remaining INTEGER;
+    v_smashed INTEGER;
+BEGIN
+    SELECT count(*) FILTER (WHERE state = 'remaining'),
+           count(*) FILTER (WHERE smashed_position IS NOT NULL)
+    INTO v_remaining, v_smashed
+    FROM session_cards
+    WHERE session_id = p_session_id;
+
+    -- after the last swipe the session is over unless there is something to duel
+    IF v_remaining = 0 AND p_mode = 'swipe' THEN
+        RETURN CASE WHEN v_smashed < 2 THEN 'finished' ELSE 'active' END;
+    END IF;
+    -- in duel mode the last remaining card is the winner
+    IF p_mode = 'duel' AND v_remaining = 1 THEN
+        RETURN 'finished';
+    END IF;
+    RETURN p_status;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Write-behind mode (VOTE_WRITE_BEHIND in the backend): pool connections set
+-- pickme.defer_votes = on and the backend batches the votes rows itself.
+CREATE OR REPLACE FUNCTION session_votes_deferred() RETURNS BOOLEAN AS $$
+    SELECT COALESCE(current_setting('pickme.defer_votes', true), '') = 'on';
+$$ LANGUAGE sql STABLE;
+
+-- Applies one swipe/duel decision to a session: locks the session row,
+-- moves the card, records the vote and updates the status.
+-- Returns NULL on success, otherwise 'not_found' or 'finished'.
+CREATE OR REPLACE FUNCTION session_apply_decision(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS TEXT AS $$
+DECLARE
+    s sessions%ROWTYPE;
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN 'not_found';
+    END IF;
+    IF s.status = 'finished' THEN
+        RETURN 'finished';
+    END IF;
+
+    PERFORM session_card_transition(p_session_id, s.mode, p_card_id, p_decision, s.card_seq + 1);
+
+    IF NOT session_votes_deferred() THEN
+        INSERT INTO votes (id, session_id, card_id, decision, round, mode)
+        VALUES (uuid_generate_v4(), p_session_id, p_card_id, p_decision, p_round, s.mode);
+    END IF;
+
+    UPDATE sessions
+    SET card_seq = s.card_seq + 1,
+        status = session_status_after_decision(p_session_id, s.mode, s.status),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_session_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Applies an ordered batch of decisions
+-- (JSON array of {index, card_id, decision, round}) under one session lock:
+-- one sessions update and one multi-row votes insert for the whole batch.
+-- Items that no longer apply are skipped and reported, not fatal.
+CREATE OR REPLACE FUNCTION session_apply_decisions(
+    p_session_id UUID, p_decisions JSONB
+) RETURNS JSONB AS $$
+DECLARE
+    s sessions%ROWTYPE;
+    r RECORD;
+    v_seq INTEGER;
+    v_status TEXT;
+    v_card_id UUID;
+    v_state TEXT;
+    v_reason TEXT;
+    v_applied INTEGER := 0;
+    v_rejected JSONB := '[]'::jsonb;
+    v_vote_cards UUID[] := '{}';
+    v_vote_decisions TEXT[] := '{}';
+    v_vote_rounds INTEGER[] := '{}';
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    END IF;
+
+    v_seq := s.card_seq;
+    v_status := s.status;
+
+    FOR r IN SELECT value AS item FROM jsonb_array_elements(p_decisions) LOOP
+        v_card_id := (r.item->>'card_id')::uuid;
+        v_reason := NULL;
+
+        IF v_status = 'finished' THEN
+            v_reason := 'session_finished';
+        ELSE
+            SELECT state INTO v_state FROM session_cards
+            WHERE session_id = p_session_id AND card_id = v_card_id;
+            IF NOT FOUND THEN
+                v_reason := 'not_in_session';
+            ELSIF v_state = 'passed' THEN
+                v_reason := 'already_passed';
+            ELSIF v_state <> 'remaining' THEN
+                v_reason := 'already_decided';
+            END IF;
+        END IF;
+
+        IF v_reason IS NOT NULL THEN
+            v_rejected := v_rejected || jsonb_build_object(
+                'index', r.item->'index', 'card_id', r.item->'card_id', 'reason', v_reason
+            );
+            CONTINUE;
+        END IF;
+
+        v_seq := v_seq + 1;
+        PERFORM session_card_transition(p_session_id, s.mode, v_card_id, r.item->>'decision', v_seq);
+        v_status := session_status_after_decision(p_session_id, s.mode, v_status);
+
+        v_vote_cards := v_vote_cards || v_card_id;
+        v_vote_decisions := v_vote_decisions || (r.item->>'decision');
+        v_vote_rounds := v_vote_rounds || COALESCE((r.item->>'round')::integer, 1);
+        v_applied := v_applied + 1;
+    END LOOP;
+
+    IF v_applied > 0 THEN
+        IF NOT session_votes_deferred() THEN
+            INSERT INTO votes (id, session_id, card_id, decision, round, mode)
+            SELECT uuid_generate_v4(), p_session_id, t.card_id, t.decision, t.round, s.mode
+            FROM unnest(v_vote_cards, v_vote_decisions, v_vote_rounds) AS t(card_id, decision, round);
+        END IF;
+
+        UPDATE sessions
+        SET card_seq = v_seq, status = v_status, updated_at = CURRENT_TIMESTAMP
+        WHERE id = p_session_id;
+    END IF;
+
+    RETURN jsonb_build_object('applied', v_applied, 'rejected', v_rejected);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Automatic winner after a decision: the only smashed card (swipe)
+-- or the last remaining one (duel). NULL while the session is running.
+CREATE OR REPLACE FUNCTION session_decision_winner(
+    p_session_id UUID, p_mode TEXT, p_status TEXT
+) RETURNS JSONB AS $$
+DECLARE
+    v_ids UUID[];
+    v_winner JSONB;
+BEGIN
+    IF p_status <> 'finished' THEN
+        RETURN NULL;
+    END IF;
+
+    IF p_mode = 'swipe' THEN
+        SELECT array_agg(card_id) INTO v_ids FROM (
+            SELECT card_id FROM session_cards
+            WHERE session_id = p_session_id AND smashed_position IS NOT NULL
+            LIMIT 2
+        ) t;
+    ELSIF p_mode = 'duel' THEN
+        SELECT array_agg(card_id) INTO v_ids FROM (
+            SELECT card_id FROM session_cards
+            WHERE session_id = p_session_id AND state = 'remaining'
+            LIMIT 2
+        ) t;
+    END IF;
+
+    IF cardinality(v_ids) = 1 THEN
+        SELECT to_jsonb(c) INTO v_winner FROM cards c WHERE c.id = v_ids[1];
+    END IF;
+    RETURN v_winner;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Full POST /sessions/{id}/decision in one round trip: applies the decision
+-- and returns the hydrated response (or an error object) as JSONB.
+CREATE OR REPLACE FUNCTION session_decide(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS JSONB AS $$
+DECLARE
+    v_error TEXT;
+    v session_view%ROWTYPE;
+    v_result JSONB;
+    v_winner JSONB;
+BEGIN
+    v_error := session_apply_decision(p_session_id, p_card_id, p_decision, p_round);
+    IF v_error = 'not_found' THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    ELSIF v_error = 'finished' THEN
+        RETURN jsonb_build_object('error', 'Session already finished', 'status_code', 400);
+    END IF;
+
+    SELECT * INTO v FROM session_view WHERE id = p_session_id;
+
+    v_result := to_jsonb(v) || jsonb_build_object(
+        'remainingCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'remaining'), '[]'::jsonb),
+        'passedCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'passed'), '[]'::jsonb),
+        'smashedCards', v.smashed_cards
+    );
+
+    v_winner := session_decision_winner(p_session_id, v.mode, v.status);
+    IF v_winner IS NOT NULL THEN
+        v_result := v_result || jsonb_build_object('winner', v_winner);
+    END IF;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Compact variant of session_decide() for swipe clients: instead of the whole
+-- deck it returns the changed card, list counts and the next p_next cards.
+CREATE OR REPLACE FUNCTION session_decide_compact(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER, p_next INTEGER
+) RETURNS JSONB AS $$
+DECLARE
+    v_error TEXT;
+    s sessions%ROWTYPE;
+    v_result JSONB;
+    v_winner JSONB;
+BEGIN
+    v_error := session_apply_decision(p_session_id, p_card_id, p_decision, p_round);
+    IF v_error = 'not_found' THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    ELSIF v_error = 'finished' THEN
+        RETURN jsonb_build_object('error', 'Session already finished', 'status_code', 400);
+    END IF;
+
+    SELECT * INTO s FROM sessions WHERE id = p_session_id;
+
+    v_result := jsonb_build_object(
+        'id', s.id,
+        'deck_id', s.deck_id,
+        'mode', s.mode,
+        'status', s.status,
+        'updated_at', s.updated_at,
+        'changedCards', jsonb_build_array(p_card_id),
+        'counts', (
+            SELECT jsonb_build_object(
+                'remaining', count(*) FILTER (WHERE state = 'remaining'),
+                'passed', count(*) FILTER (WHERE state = 'passed'),
+                'smashed', count(*) FILTER (WHERE smashed_position IS NOT NULL))
+            FROM session_cards WHERE session_id = p_session_id),
+        'nextCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY n.position)
+            FROM (
+                SELECT card_id, position FROM session_cards
+                WHERE session_id = p_session_id AND state = 'remaining'
+                ORDER BY position
+                LIMIT p_next
+            ) n
+            JOIN cards c ON c.id = n.card_id), '[]'::jsonb)
+    );
+
+    v_winner := session_decision_winner(p_session_id, s.mode, s.status);
+    IF v_winner IS NOT NULL THEN
+        v_result := v_result || jsonb_build_object('winner', v_winner);
+    END IF;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+-- First card image in deck order, used as the deck cover.
+CREATE OR REPLACE FUNCTION deck_cover_image(p_deck_id UUID) RETURNS VARCHAR AS $$
+    SELECT image_url FROM cards
+    WHERE deck_id = p_deck_id AND image_url IS NOT NULL AND image_url <> ''
+    ORDER BY COALESCE(position, 2147483647), created_at, id
+    LIMIT 1
+$$ LANGUAGE sql STABLE;
+
+-- Keeps decks.card_count and decks.cover_image_url in step with cards and
+-- bumps decks.cards_version (the ETag version of the deck's card content).
+-- Statement-level, so a bulk insert or COPY touches each deck once.
+CREATE OR REPLACE FUNCTION deck_stats_sync() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE decks d
+        SET card_count = d.card_count + n.cnt, cover_image_url = deck_cover_image(d.id),
+            cards_version = d.cards_version + 1
+        FROM (SELECT deck_id, count(*) AS cnt FROM new_cards GROUP BY deck_id) n
+        WHERE d.id = n.deck_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE decks d
+        SET card_count = GREATEST(d.card_count - o.cnt, 0), cover_image_url = deck_cover_image(d.id),
+            cards_version = d.cards_version + 1
+        FROM (SELECT deck_id, count(*) AS cnt FROM old_cards GROUP BY deck_id) o
+        WHERE d.id = o.deck_id;
+    ELSE
+        UPDATE decks d
+        SET card_count = GREATEST(d.card_count + t.diff, 0), cover_image_url = deck_cover_image(d.id),
+            cards_version = d.cards_version + 1
+        FROM (
+            SELECT deck_id, sum(diff) AS diff FROM (
+                SELECT deck_id, 1 AS diff FROM new_cards
+                UNION ALL
+                SELECT deck_id, -1 FROM old_cards
+            ) c GROUP BY deck_id
+        ) t
+        WHERE d.id = t.deck_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cards_deck_stats_insert ON cards;
+CREATE TRIGGER cards_deck_stats_insert
+    AFTER INSERT ON cards REFERENCING NEW TABLE AS new_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION deck_stats_sync();
+
+DROP TRIGGER IF EXISTS cards_deck_stats_delete ON cards;
+CREATE TRIGGER cards_deck_stats_delete
+    AFTER DELETE ON cards REFERENCING OLD TABLE AS old_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION deck_stats_sync();
+
+DROP TRIGGER IF EXISTS cards_deck_stats_update ON cards;
+CREATE TRIGGER cards_deck_stats_update
+    AFTER UPDATE ON cards REFERENCING OLD TABLE AS old_cards NEW TABLE AS new_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION deck_stats_sync();
+
+-- GET /decks/summary: deck row with its maintained counters and the progress
+-- of the latest unfinished session (counted on session_cards, never on cards).
+CREATE OR REPLACE VIEW deck_summary_view AS
+SELECT d.*,
+    a.id AS session_id,
+    a.mode AS session_mode,
+    a.remaining_count,
+    a.smashed_count
+FROM decks d
+LEFT JOIN LATERAL (
+    SELECT s.id, s.mode,
+        count(sc.card_id) FILTER (WHERE sc.state = 'remaining') AS remaining_count,
+        count(sc.card_id) FILTER (WHERE sc.smashed_position IS NOT NULL) AS smashed_count
+    FROM (
+        SELECT id, mode FROM sessions
+        WHERE deck_id = d.id AND status != 'finished'
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) s
+    LEFT JOIN session_cards sc ON sc.session_id = s.id
+    GROUP BY s.id, s.mode
+) a ON true;
+
+-- Adds a batch of new votes to card_vote_stats/deck_vote_stats.
+-- Statement-level, so a multi-row insert or a COPY from the vote writer
+-- costs one upsert per card and per deck. Rows are upserted in key order
+-- so concurrent batches lock them in the same order.
+CREATE OR REPLACE FUNCTION vote_stats_sync() RETURNS TRIGGER AS $$
+BEGIN
+    WITH v AS (
+        SELECT n.card_id, c.deck_id,
+            count(*) AS seen,
+            count(*) FILTER (WHERE n.mode IS DISTINCT FROM 'duel' AND n.decision <> 'pass') AS smashes,
+            count(*) FILTER (WHERE n.mode IS DISTINCT FROM 'duel' AND n.decision = 'pass') AS passes,
+            count(*) FILTER (WHERE n.mode = 'duel' AND n.decision <> 'pass') AS duel_wins,
+            count(*) FILTER (WHERE n.mode = 'duel' AND n.decision = 'pass') AS duel_losses,
+            max(n.timestamp) AS last_vote_at
+        FROM new_votes n
+        JOIN cards c ON c.id = n.card_id
+        GROUP BY n.card_id, c.deck_id
+    ), card_rows AS (
+        INSERT INTO card_vote_stats AS cs
+            (card_id, deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at)
+        SELECT card_id, deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at
+        FROM v ORDER BY card_id
+        ON CONFLICT (card_id) DO UPDATE
+        SET seen = cs.seen + EXCLUDED.seen,
+            smashes = cs.smashes + EXCLUDED.smashes,
+            passes = cs.passes + EXCLUDED.passes,
+            duel_wins = cs.duel_wins + EXCLUDED.duel_wins,
+            duel_losses = cs.duel_losses + EXCLUDED.duel_losses,
+            last_vote_at = GREATEST(cs.last_vote_at, EXCLUDED.last_vote_at)
+    )
+    INSERT INTO deck_vote_stats AS ds (deck_id, votes, smashes, passes, duels, last_vote_at, version)
+    SELECT deck_id, sum(seen), sum(smashes), sum(passes), sum(duel_wins), max(last_vote_at), 1
+    FROM v GROUP BY deck_id ORDER BY deck_id
+    ON CONFLICT (deck_id) DO UPDATE
+    SET votes = ds.votes + EXCLUDED.votes,
+        smashes = ds.smashes + EXCLUDED.smashes,
+        passes = ds.passes + EXCLUDED.passes,
+        duels = ds.duels + EXCLUDED.duels,
+        last_vote_at = GREATEST(ds.last_vote_at, EXCLUDED.last_vote_at),
+        version = ds.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS votes_stats_insert ON votes;
+CREATE TRIGGER votes_stats_insert
+    AFTER INSERT ON votes REFERENCING NEW TABLE AS new_votes
+    FOR EACH STATEMENT EXECUTE FUNCTION vote_stats_sync();
+
+-- Recomputes the rollups of one deck from votes (backfill of historical
+-- votes, or repair). The stats tables are locked against the trigger for
+-- the duration, so no vote is counted twice or lost; votes cast before
+-- votes.mode existed take the mode of their session. Returns the vote count.
+-- Rollups only grow: votes deleted with their session or archived with an
+-- old partition stay counted until the deck is rebuilt.
+CREATE OR REPLACE FUNCTION vote_stats_rebuild(p_deck_id UUID) RETURNS BIGINT AS $$
+DECLARE
+    v_votes BIGINT;
+BEGIN
+    LOCK TABLE card_vote_stats, deck_vote_stats IN SHARE ROW EXCLUSIVE MODE;
+
+    CREATE TEMP TABLE vote_stats_rebuild_rows ON COMMIT DROP AS
+    SELECT v.card_id,
+        count(*) AS seen,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) IS DISTINCT FROM 'duel' AND v.decision <> 'pass') AS smashes,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) IS DISTINCT FROM 'duel' AND v.decision = 'pass') AS passes,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) = 'duel' AND v.decision <> 'pass') AS duel_wins,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) = 'duel' AND v.decision = 'pass') AS duel_losses,
+        max(v.timestamp) AS last_vote_at
+    FROM cards c
+    JOIN votes v ON v.card_id = c.id
+    LEFT JOIN sessions s ON s.id = v.session_id
+    WHERE c.deck_id = p_deck_id
+    GROUP BY v.card_id;
+
+    DELETE FROM card_vote_stats
+    WHERE deck_id = p_deck_id
+      AND card_id NOT IN (SELECT card_id FROM vote_stats_rebuild_rows);
+
+    INSERT INTO card_vote_stats AS cs
+        (card_id, deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at)
+    SELECT card_id, p_deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at
+    FROM vote_stats_rebuild_rows
+    ON CONFLICT (card_id) DO UPDATE
+    SET seen = EXCLUDED.seen, smashes = EXCLUDED.smashes, passes = EXCLUDED.passes,
+        duel_wins = EXCLUDED.duel_wins, duel_losses = EXCLUDED.duel_losses,
+        last_vote_at = EXCLUDED.last_vote_at;
+
+    INSERT INTO deck_vote_stats AS ds (deck_id, votes, smashes, passes, duels, last_vote_at, version)
+    SELECT p_deck_id, COALESCE(sum(seen), 0), COALESCE(sum(smashes), 0), COALESCE(sum(passes), 0),
+        COALESCE(sum(duel_wins), 0), max(last_vote_at), 1
+    FROM vote_stats_rebuild_rows
+    ON CONFLICT (deck_id) DO UPDATE
+    SET votes = EXCLUDED.votes, smashes = EXCLUDED.smashes, passes = EXCLUDED.passes,
+        duels = EXCLUDED.duels, last_vote_at = EXCLUDED.last_vote_at,
+        version = ds.version + 1
+    RETURNING votes INTO v_votes;
+
+    DROP TABLE vote_stats_rebuild_rows;
+    RETURN v_votes;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions of votes with their time ranges (range_start is NULL for a
+-- partition that starts at MINVALUE; is_default marks votes_default).
+CREATE OR REPLACE VIEW votes_partitions AS
+SELECT c.relname AS name,
+    substring(pg_get_expr(c.relpartbound, c.oid) FROM 'FROM \(''([^'']+)''\)')::timestamp AS range_start,
+    substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \(''([^'']+)''\)')::timestamp AS range_end,
+    pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT' AS is_default
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'votes'::regclass;
+
+-- Creates the monthly partitions of votes from the current month to
+-- p_months_ahead months ahead; months already covered are skipped. Rows of a
+-- new month that landed in votes_default are moved into its partition.
+-- Returns the number of partitions created.
+CREATE OR REPLACE FUNCTION votes_create_partitions(p_months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    v_start DATE;
+    v_end DATE;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    -- one creator at a time (every backend worker runs this)
+    PERFORM pg_advisory_xact_lock(hashtext('votes_create_partitions'));
+
+    FOR i IN 0..p_months_ahead LOOP
+        v_start := (date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => i))::date;
+        v_end := (v_start + interval '1 month')::date;
+        CONTINUE WHEN EXISTS (
+            SELECT 1 FROM votes_partitions
+            WHERE NOT is_default
+              AND COALESCE(range_start, '-infinity') < v_end
+              AND range_end > v_start
+        );
+
+        v_name := format('votes_y%sm%s', to_char(v_start, 'YYYY'), to_char(v_start, 'MM'));
+        EXECUTE format('CREATE TABLE %I (LIKE votes INCLUDING DEFAULTS)', v_name);
+        EXECUTE format(
+            'WITH moved AS (
+                DELETE FROM votes_default WHERE timestamp >= %L AND timestamp < %L
+                RETURNING id, session_id, card_id, decision, round, mode, timestamp
+            )
+            INSERT INTO %I (id, session_id, card_id, decision, round, mode, timestamp)
+            SELECT id, session_id, card_id, decision, round, mode, timestamp FROM moved',
+            v_start, v_end, v_name
+        );
+        EXECUTE format('ALTER TABLE votes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', v_name, v_start, v_end);
+        v_created := v_created + 1;
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
 
+SELECT votes_create_partitions(3);
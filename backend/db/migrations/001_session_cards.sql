@@ -0,0 +1,86 @@
+-- Move session card lists from the JSONB arrays on sessions into session_cards.
+-- Safe to re-run: the backfill only happens while the old columns still exist.
+-- Apply with: make db-migrate MIGRATION=001_session_cards.sql
+
+BEGIN;
+
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS card_seq INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS session_cards (
+    session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+    card_id UUID REFERENCES cards(id) ON DELETE CASCADE,
+    state VARCHAR(20) NOT NULL DEFAULT 'remaining',
+    position INTEGER NOT NULL,
+    smashed_position INTEGER,
+    PRIMARY KEY (session_id, card_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_session_cards_state ON session_cards(session_id, state, position);
+CREATE INDEX IF NOT EXISTS idx_session_cards_smashed ON session_cards(session_id, smashed_position)
+    WHERE smashed_position IS NOT NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'sessions' AND column_name = 'remaining_cards'
+    ) THEN
+        RETURN;
+    END IF;
+
+    -- remaining first, in list order
+    INSERT INTO session_cards (session_id, card_id, state, position)
+    SELECT DISTINCT ON (s.id, e.card_id) s.id, e.card_id::uuid, 'remaining', e.ord
+    FROM sessions s
+    CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(s.remaining_cards, '[]')) WITH ORDINALITY AS e(card_id, ord)
+    JOIN cards c ON c.id = e.card_id::uuid
+    ORDER BY s.id, e.card_id, e.ord
+    ON CONFLICT (session_id, card_id) DO NOTHING;
+
+    -- then the trash, positioned after remaining
+    INSERT INTO session_cards (session_id, card_id, state, position)
+    SELECT DISTINCT ON (s.id, e.card_id) s.id, e.card_id::uuid, 'passed',
+           jsonb_array_length(COALESCE(s.remaining_cards, '[]')) + e.ord
+    FROM sessions s
+    CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(s.passed_cards, '[]')) WITH ORDINALITY AS e(card_id, ord)
+    JOIN cards c ON c.id = e.card_id::uuid
+    ORDER BY s.id, e.card_id, e.ord
+    ON CONFLICT (session_id, card_id) DO NOTHING;
+
+    -- smashed: cards already present (duel mode) only get smashed_position
+    INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+    SELECT DISTINCT ON (s.id, e.card_id) s.id, e.card_id::uuid, 'smashed', p.base + e.ord, p.base + e.ord
+    FROM sessions s
+    CROSS JOIN LATERAL (
+        SELECT jsonb_array_length(COALESCE(s.remaining_cards, '[]'))
+             + jsonb_array_length(COALESCE(s.passed_cards, '[]')) AS base
+    ) p
+    CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(s.smashed_cards, '[]')) WITH ORDINALITY AS e(card_id, ord)
+    JOIN cards c ON c.id = e.card_id::uuid
+    ORDER BY s.id, e.card_id, e.ord
+    ON CONFLICT (session_id, card_id) DO UPDATE
+    SET smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+
+    UPDATE sessions
+    SET card_seq = jsonb_array_length(COALESCE(remaining_cards, '[]'))
+                 + jsonb_array_length(COALESCE(passed_cards, '[]'))
+                 + jsonb_array_length(COALESCE(smashed_cards, '[]'));
+
+    DROP VIEW IF EXISTS session_view;
+    ALTER TABLE sessions
+        DROP COLUMN remaining_cards,
+        DROP COLUMN passed_cards,
+        DROP COLUMN smashed_cards;
+END $$;
+
+CREATE OR REPLACE VIEW session_view AS
+SELECT s.*,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'remaining'), '[]'::jsonb) AS remaining_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'passed'), '[]'::jsonb) AS passed_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.smashed_position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.smashed_position IS NOT NULL), '[]'::jsonb) AS smashed_cards
+FROM sessions s;
+
+COMMIT;
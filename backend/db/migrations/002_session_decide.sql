@@ -0,0 +1,129 @@
+-- Server-side decision path: session_apply_decision() and session_decide().
+-- Apply with: make db-migrate MIGRATION=002_session_decide.sql
+
+BEGIN;
+
+-- Applies one swipe/duel decision to a session: locks the session row,
+-- moves the card, records the vote and updates the status.
+-- Returns NULL on success, otherwise 'not_found' or 'finished'.
+CREATE OR REPLACE FUNCTION session_apply_decision(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS TEXT AS $$
+DECLARE
+    s sessions%ROWTYPE;
+    v_seq INTEGER;
+    v_remaining INTEGER;
+    v_smashed INTEGER;
+    v_status TEXT;
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN 'not_found';
+    END IF;
+    IF s.status = 'finished' THEN
+        RETURN 'finished';
+    END IF;
+
+    v_seq := s.card_seq + 1;
+
+    IF p_decision = 'pass' THEN
+        INSERT INTO session_cards (session_id, card_id, state, position)
+        VALUES (p_session_id, p_card_id, 'passed', v_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = 'passed', position = EXCLUDED.position;
+    ELSIF s.mode = 'duel' THEN
+        -- the chosen card stays in remaining and is kept in smashed for history
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', v_seq, v_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    ELSE
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', v_seq, v_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = CASE WHEN session_cards.state = 'passed' THEN 'passed' ELSE 'smashed' END,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    END IF;
+
+    INSERT INTO votes (id, session_id, card_id, decision, round)
+    VALUES (uuid_generate_v4(), p_session_id, p_card_id, p_decision, p_round);
+
+    SELECT count(*) FILTER (WHERE state = 'remaining'),
+           count(*) FILTER (WHERE smashed_position IS NOT NULL)
+    INTO v_remaining, v_smashed
+    FROM session_cards
+    WHERE session_id = p_session_id;
+
+    v_status := s.status;
+    -- after the last swipe the session is over unless there is something to duel
+    IF v_remaining = 0 AND s.mode = 'swipe' THEN
+        v_status := CASE WHEN v_smashed < 2 THEN 'finished' ELSE 'active' END;
+    END IF;
+    -- in duel mode the last remaining card is the winner
+    IF s.mode = 'duel' AND v_remaining = 1 THEN
+        v_status := 'finished';
+    END IF;
+
+    UPDATE sessions
+    SET card_seq = v_seq, status = v_status, updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_session_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Full POST /sessions/{id}/decision in one round trip: applies the decision
+-- and returns the hydrated response (or an error object) as JSONB.
+CREATE OR REPLACE FUNCTION session_decide(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS JSONB AS $$
+DECLARE
+    v_error TEXT;
+    v session_view%ROWTYPE;
+    v_result JSONB;
+    v_winner_id UUID;
+    v_winner JSONB;
+BEGIN
+    v_error := session_apply_decision(p_session_id, p_card_id, p_decision, p_round);
+    IF v_error = 'not_found' THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    ELSIF v_error = 'finished' THEN
+        RETURN jsonb_build_object('error', 'Session already finished', 'status_code', 400);
+    END IF;
+
+    SELECT * INTO v FROM session_view WHERE id = p_session_id;
+
+    -- card lists stay JSON text, exactly as asyncpg returns them for the view
+    v_result := to_jsonb(v) || jsonb_build_object(
+        'remaining_cards', v.remaining_cards::text,
+        'passed_cards', v.passed_cards::text,
+        'smashed_cards', v.smashed_cards::text,
+        'remainingCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'remaining'), '[]'::jsonb),
+        'passedCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'passed'), '[]'::jsonb),
+        'smashedCards', v.smashed_cards
+    );
+
+    -- automatic winner: the only smashed card (swipe) or the last remaining one (duel)
+    IF v.status = 'finished' AND v.mode = 'swipe' AND jsonb_array_length(v.smashed_cards) = 1 THEN
+        v_winner_id := (v.smashed_cards->>0)::uuid;
+    ELSIF v.status = 'finished' AND v.mode = 'duel' AND jsonb_array_length(v.remaining_cards) = 1 THEN
+        v_winner_id := (v.remaining_cards->>0)::uuid;
+    END IF;
+    IF v_winner_id IS NOT NULL THEN
+        SELECT to_jsonb(c) INTO v_winner FROM cards c WHERE c.id = v_winner_id;
+        IF FOUND THEN
+            v_result := v_result || jsonb_build_object('winner', v_winner);
+        END IF;
+    END IF;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
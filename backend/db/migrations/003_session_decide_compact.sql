@@ -0,0 +1,139 @@
+-- Compact decision responses: session_decide_compact(), plus the shared
+-- session_decision_winner() helper now also used by session_decide().
+-- Apply with: make db-migrate MIGRATION=003_session_decide_compact.sql
+
+BEGIN;
+
+-- Automatic winner after a decision: the only smashed card (swipe)
+-- or the last remaining one (duel). NULL while the session is running.
+CREATE OR REPLACE FUNCTION session_decision_winner(
+    p_session_id UUID, p_mode TEXT, p_status TEXT
+) RETURNS JSONB AS $$
+DECLARE
+    v_ids UUID[];
+    v_winner JSONB;
+BEGIN
+    IF p_status <> 'finished' THEN
+        RETURN NULL;
+    END IF;
+
+    IF p_mode = 'swipe' THEN
+        SELECT array_agg(card_id) INTO v_ids FROM (
+            SELECT card_id FROM session_cards
+            WHERE session_id = p_session_id AND smashed_position IS NOT NULL
+            LIMIT 2
+        ) t;
+    ELSIF p_mode = 'duel' THEN
+        SELECT array_agg(card_id) INTO v_ids FROM (
+            SELECT card_id FROM session_cards
+            WHERE session_id = p_session_id AND state = 'remaining'
+            LIMIT 2
+        ) t;
+    END IF;
+
+    IF cardinality(v_ids) = 1 THEN
+        SELECT to_jsonb(c) INTO v_winner FROM cards c WHERE c.id = v_ids[1];
+    END IF;
+    RETURN v_winner;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Full POST /sessions/{id}/decision in one round trip: applies the decision
+-- and returns the hydrated response (or an error object) as JSONB.
+CREATE OR REPLACE FUNCTION session_decide(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS JSONB AS $$
+DECLARE
+    v_error TEXT;
+    v session_view%ROWTYPE;
+    v_result JSONB;
+    v_winner JSONB;
+BEGIN
+    v_error := session_apply_decision(p_session_id, p_card_id, p_decision, p_round);
+    IF v_error = 'not_found' THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    ELSIF v_error = 'finished' THEN
+        RETURN jsonb_build_object('error', 'Session already finished', 'status_code', 400);
+    END IF;
+
+    SELECT * INTO v FROM session_view WHERE id = p_session_id;
+
+    -- card lists stay JSON text, exactly as asyncpg returns them for the view
+    v_result := to_jsonb(v) || jsonb_build_object(
+        'remaining_cards', v.remaining_cards::text,
+        'passed_cards', v.passed_cards::text,
+        'smashed_cards', v.smashed_cards::text,
+        'remainingCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'remaining'), '[]'::jsonb),
+        'passedCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'passed'), '[]'::jsonb),
+        'smashedCards', v.smashed_cards
+    );
+
+    v_winner := session_decision_winner(p_session_id, v.mode, v.status);
+    IF v_winner IS NOT NULL THEN
+        v_result := v_result || jsonb_build_object('winner', v_winner);
+    END IF;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Compact variant of session_decide() for swipe clients: instead of the whole
+-- deck it returns the changed card, list counts and the next p_next cards.
+CREATE OR REPLACE FUNCTION session_decide_compact(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER, p_next INTEGER
+) RETURNS JSONB AS $$
+DECLARE
+    v_error TEXT;
+    s sessions%ROWTYPE;
+    v_result JSONB;
+    v_winner JSONB;
+BEGIN
+    v_error := session_apply_decision(p_session_id, p_card_id, p_decision, p_round);
+    IF v_error = 'not_found' THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    ELSIF v_error = 'finished' THEN
+        RETURN jsonb_build_object('error', 'Session already finished', 'status_code', 400);
+    END IF;
+
+    SELECT * INTO s FROM sessions WHERE id = p_session_id;
+
+    v_result := jsonb_build_object(
+        'id', s.id,
+        'deck_id', s.deck_id,
+        'mode', s.mode,
+        'status', s.status,
+        'updated_at', s.updated_at,
+        'changedCards', jsonb_build_array(p_card_id),
+        'counts', (
+            SELECT jsonb_build_object(
+                'remaining', count(*) FILTER (WHERE state = 'remaining'),
+                'passed', count(*) FILTER (WHERE state = 'passed'),
+                'smashed', count(*) FILTER (WHERE smashed_position IS NOT NULL))
+            FROM session_cards WHERE session_id = p_session_id),
+        'nextCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY n.position)
+            FROM (
+                SELECT card_id, position FROM session_cards
+                WHERE session_id = p_session_id AND state = 'remaining'
+                ORDER BY position
+                LIMIT p_next
+            ) n
+            JOIN cards c ON c.id = n.card_id), '[]'::jsonb)
+    );
+
+    v_winner := session_decision_winner(p_session_id, s.mode, s.status);
+    IF v_winner IS NOT NULL THEN
+        v_result := v_result || jsonb_build_object('winner', v_winner);
+    END IF;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,95 @@
+-- Per-session duel scheduler (sessions.duel_scheduler) and bracket ordering:
+-- a duel winner moves to the back of the remaining queue.
+-- Apply with: make db-migrate MIGRATION=004_duel_scheduler.sql
+
+BEGIN;
+
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS duel_scheduler VARCHAR(20) NOT NULL DEFAULT 'bracket';
+
+-- s.* changed, so the view has to be rebuilt rather than replaced
+DROP VIEW IF EXISTS session_view;
+
+-- Session rows with the card lists assembled from session_cards,
+-- in the same JSON array form the API has always returned
+CREATE OR REPLACE VIEW session_view AS
+SELECT s.*,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'remaining'), '[]'::jsonb) AS remaining_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'passed'), '[]'::jsonb) AS passed_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.smashed_position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.smashed_position IS NOT NULL), '[]'::jsonb) AS smashed_cards
+FROM sessions s;
+
+-- Applies one swipe/duel decision to a session: locks the session row,
+-- moves the card, records the vote and updates the status.
+-- Returns NULL on success, otherwise 'not_found' or 'finished'.
+CREATE OR REPLACE FUNCTION session_apply_decision(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS TEXT AS $$
+DECLARE
+    s sessions%ROWTYPE;
+    v_seq INTEGER;
+    v_remaining INTEGER;
+    v_smashed INTEGER;
+    v_status TEXT;
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN 'not_found';
+    END IF;
+    IF s.status = 'finished' THEN
+        RETURN 'finished';
+    END IF;
+
+    v_seq := s.card_seq + 1;
+
+    IF p_decision = 'pass' THEN
+        INSERT INTO session_cards (session_id, card_id, state, position)
+        VALUES (p_session_id, p_card_id, 'passed', v_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = 'passed', position = EXCLUDED.position;
+    ELSIF s.mode = 'duel' THEN
+        -- the chosen card stays in remaining and is kept in smashed for history;
+        -- it moves to the back of the remaining queue (next bracket round)
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', v_seq, v_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET position = EXCLUDED.position,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    ELSE
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', v_seq, v_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = CASE WHEN session_cards.state = 'passed' THEN 'passed' ELSE 'smashed' END,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    END IF;
+
+    INSERT INTO votes (id, session_id, card_id, decision, round)
+    VALUES (uuid_generate_v4(), p_session_id, p_card_id, p_decision, p_round);
+
+    SELECT count(*) FILTER (WHERE state = 'remaining'),
+           count(*) FILTER (WHERE smashed_position IS NOT NULL)
+    INTO v_remaining, v_smashed
+    FROM session_cards
+    WHERE session_id = p_session_id;
+
+    v_status := s.status;
+    -- after the last swipe the session is over unless there is something to duel
+    IF v_remaining = 0 AND s.mode = 'swipe' THEN
+        v_status := CASE WHEN v_smashed < 2 THEN 'finished' ELSE 'active' END;
+    END IF;
+    -- in duel mode the last remaining card is the winner
+    IF s.mode = 'duel' AND v_remaining = 1 THEN
+        v_status := 'finished';
+    END IF;
+
+    UPDATE sessions
+    SET card_seq = v_seq, status = v_status, updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_session_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
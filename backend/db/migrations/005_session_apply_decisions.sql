@@ -0,0 +1,172 @@
+-- Batch decisions: session_apply_decisions(), with the card transition and
+-- status rules split out of session_apply_decision() so both share them.
+-- Apply with: make db-migrate MIGRATION=005_session_apply_decisions.sql
+
+BEGIN;
+
+-- Moves one card according to a decision (the transition rules shared by
+-- single and batch decisions). p_seq is the next sessions.card_seq value.
+CREATE OR REPLACE FUNCTION session_card_transition(
+    p_session_id UUID, p_mode TEXT, p_card_id UUID, p_decision TEXT, p_seq INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    IF p_decision = 'pass' THEN
+        INSERT INTO session_cards (session_id, card_id, state, position)
+        VALUES (p_session_id, p_card_id, 'passed', p_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = 'passed', position = EXCLUDED.position;
+    ELSIF p_mode = 'duel' THEN
+        -- the chosen card stays in remaining and is kept in smashed for history;
+        -- it moves to the back of the remaining queue (next bracket round)
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', p_seq, p_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET position = EXCLUDED.position,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    ELSE
+        INSERT INTO session_cards (session_id, card_id, state, position, smashed_position)
+        VALUES (p_session_id, p_card_id, 'smashed', p_seq, p_seq)
+        ON CONFLICT (session_id, card_id) DO UPDATE
+        SET state = CASE WHEN session_cards.state = 'passed' THEN 'passed' ELSE 'smashed' END,
+            smashed_position = COALESCE(session_cards.smashed_position, EXCLUDED.smashed_position);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Session status after a card moved.
+CREATE OR REPLACE FUNCTION session_status_after_decision(
+    p_session_id UUID, p_mode TEXT, p_status TEXT
+) RETURNS TEXT AS $$
+DECLARE
+    v_remaining INTEGER;
+    v_smashed INTEGER;
+BEGIN
+    SELECT count(*) FILTER (WHERE state = 'remaining'),
+           count(*) FILTER (WHERE smashed_position IS NOT NULL)
+    INTO v_remaining, v_smashed
+    FROM session_cards
+    WHERE session_id = p_session_id;
+
+    -- after the last swipe the session is over unless there is something to duel
+    IF v_remaining = 0 AND p_mode = 'swipe' THEN
+        RETURN CASE WHEN v_smashed < 2 THEN 'finished' ELSE 'active' END;
+    END IF;
+    -- in duel mode the last remaining card is the winner
+    IF p_mode = 'duel' AND v_remaining = 1 THEN
+        RETURN 'finished';
+    END IF;
+    RETURN p_status;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Applies one swipe/duel decision to a session: locks the session row,
+-- moves the card, records the vote and updates the status.
+-- Returns NULL on success, otherwise 'not_found' or 'finished'.
+CREATE OR REPLACE FUNCTION session_apply_decision(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS TEXT AS $$
+DECLARE
+    s sessions%ROWTYPE;
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN 'not_found';
+    END IF;
+    IF s.status = 'finished' THEN
+        RETURN 'finished';
+    END IF;
+
+    PERFORM session_card_transition(p_session_id, s.mode, p_card_id, p_decision, s.card_seq + 1);
+
+    INSERT INTO votes (id, session_id, card_id, decision, round)
+    VALUES (uuid_generate_v4(), p_session_id, p_card_id, p_decision, p_round);
+
+    UPDATE sessions
+    SET card_seq = s.card_seq + 1,
+        status = session_status_after_decision(p_session_id, s.mode, s.status),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_session_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Applies an ordered batch of decisions
+-- (JSON array of {index, card_id, decision, round}) under one session lock:
+-- one sessions update and one multi-row votes insert for the whole batch.
+-- Items that no longer apply are skipped and reported, not fatal.
+CREATE OR REPLACE FUNCTION session_apply_decisions(
+    p_session_id UUID, p_decisions JSONB
+) RETURNS JSONB AS $$
+DECLARE
+    s sessions%ROWTYPE;
+    r RECORD;
+    v_seq INTEGER;
+    v_status TEXT;
+    v_card_id UUID;
+    v_state TEXT;
+    v_reason TEXT;
+    v_applied INTEGER := 0;
+    v_rejected JSONB := '[]'::jsonb;
+    v_vote_cards UUID[] := '{}';
+    v_vote_decisions TEXT[] := '{}';
+    v_vote_rounds INTEGER[] := '{}';
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    END IF;
+
+    v_seq := s.card_seq;
+    v_status := s.status;
+
+    FOR r IN SELECT value AS item FROM jsonb_array_elements(p_decisions) LOOP
+        v_card_id := (r.item->>'card_id')::uuid;
+        v_reason := NULL;
+
+        IF v_status = 'finished' THEN
+            v_reason := 'session_finished';
+        ELSE
+            SELECT state INTO v_state FROM session_cards
+            WHERE session_id = p_session_id AND card_id = v_card_id;
+            IF NOT FOUND THEN
+                v_reason := 'not_in_session';
+            ELSIF v_state = 'passed' THEN
+                v_reason := 'already_passed';
+            ELSIF v_state <> 'remaining' THEN
+                v_reason := 'already_decided';
+            END IF;
+        END IF;
+
+        IF v_reason IS NOT NULL THEN
+            v_rejected := v_rejected || jsonb_build_object(
+                'index', r.item->'index', 'card_id', r.item->'card_id', 'reason', v_reason
+            );
+            CONTINUE;
+        END IF;
+
+        v_seq := v_seq + 1;
+        PERFORM session_card_transition(p_session_id, s.mode, v_card_id, r.item->>'decision', v_seq);
+        v_status := session_status_after_decision(p_session_id, s.mode, v_status);
+
+        v_vote_cards := v_vote_cards || v_card_id;
+        v_vote_decisions := v_vote_decisions || (r.item->>'decision');
+        v_vote_rounds := v_vote_rounds || COALESCE((r.item->>'round')::integer, 1);
+        v_applied := v_applied + 1;
+    END LOOP;
+
+    IF v_applied > 0 THEN
+        INSERT INTO votes (id, session_id, card_id, decision, round)
+        SELECT uuid_generate_v4(), p_session_id, t.card_id, t.decision, t.round
+        FROM unnest(v_vote_cards, v_vote_decisions, v_vote_rounds) AS t(card_id, decision, round);
+
+        UPDATE sessions
+        SET card_seq = v_seq, status = v_status, updated_at = CURRENT_TIMESTAMP
+        WHERE id = p_session_id;
+    END IF;
+
+    RETURN jsonb_build_object('applied', v_applied, 'rejected', v_rejected);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
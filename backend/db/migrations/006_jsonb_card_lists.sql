@@ -0,0 +1,46 @@
+-- session_decide() returns the card lists as JSON arrays, like session_view
+-- does now that the API decodes jsonb natively (see serialization.py).
+-- Apply with: make db-migrate MIGRATION=006_jsonb_card_lists.sql
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION session_decide(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS JSONB AS $$
+DECLARE
+    v_error TEXT;
+    v session_view%ROWTYPE;
+    v_result JSONB;
+    v_winner JSONB;
+BEGIN
+    v_error := session_apply_decision(p_session_id, p_card_id, p_decision, p_round);
+    IF v_error = 'not_found' THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    ELSIF v_error = 'finished' THEN
+        RETURN jsonb_build_object('error', 'Session already finished', 'status_code', 400);
+    END IF;
+
+    SELECT * INTO v FROM session_view WHERE id = p_session_id;
+
+    v_result := to_jsonb(v) || jsonb_build_object(
+        'remainingCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'remaining'), '[]'::jsonb),
+        'passedCards', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c) ORDER BY sc.position)
+            FROM session_cards sc JOIN cards c ON c.id = sc.card_id
+            WHERE sc.session_id = p_session_id AND sc.state = 'passed'), '[]'::jsonb),
+        'smashedCards', v.smashed_cards
+    );
+
+    v_winner := session_decision_winner(p_session_id, v.mode, v.status);
+    IF v_winner IS NOT NULL THEN
+        v_result := v_result || jsonb_build_object('winner', v_winner);
+    END IF;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Indexes for keyset pagination of GET /decks/ and GET /cards/deck/{id}.
+-- Built CONCURRENTLY so large tables stay writable; this cannot run inside
+-- a transaction, hence no BEGIN/COMMIT.
+-- Apply with: make db-migrate MIGRATION=007_listing_indexes.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_decks_created_at ON decks(created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_decks_user_created_at ON decks(user_id, created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cards_deck_order ON cards(deck_id, (COALESCE(position, 2147483647)), created_at, id);
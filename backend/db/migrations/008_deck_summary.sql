@@ -0,0 +1,90 @@
+-- Maintained deck counters (card_count, cover_image_url) and deck_summary_view
+-- for GET /decks/summary. Existing decks are backfilled once.
+-- Apply with: make db-migrate MIGRATION=008_deck_summary.sql
+
+BEGIN;
+
+ALTER TABLE decks ADD COLUMN IF NOT EXISTS card_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE decks ADD COLUMN IF NOT EXISTS cover_image_url VARCHAR(500);
+
+-- First card image in deck order, used as the deck cover.
+CREATE OR REPLACE FUNCTION deck_cover_image(p_deck_id UUID) RETURNS VARCHAR AS $$
+    SELECT image_url FROM cards
+    WHERE deck_id = p_deck_id AND image_url IS NOT NULL AND image_url <> ''
+    ORDER BY COALESCE(position, 2147483647), created_at, id
+    LIMIT 1
+$$ LANGUAGE sql STABLE;
+
+-- Keeps decks.card_count and decks.cover_image_url in step with cards.
+-- Statement-level, so a bulk insert or COPY touches each deck once.
+CREATE OR REPLACE FUNCTION deck_stats_sync() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE decks d
+        SET card_count = d.card_count + n.cnt, cover_image_url = deck_cover_image(d.id)
+        FROM (SELECT deck_id, count(*) AS cnt FROM new_cards GROUP BY deck_id) n
+        WHERE d.id = n.deck_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE decks d
+        SET card_count = GREATEST(d.card_count - o.cnt, 0), cover_image_url = deck_cover_image(d.id)
+        FROM (SELECT deck_id, count(*) AS cnt FROM old_cards GROUP BY deck_id) o
+        WHERE d.id = o.deck_id;
+    ELSE
+        UPDATE decks d
+        SET card_count = GREATEST(d.card_count + t.diff, 0), cover_image_url = deck_cover_image(d.id)
+        FROM (
+            SELECT deck_id, sum(diff) AS diff FROM (
+                SELECT deck_id, 1 AS diff FROM new_cards
+                UNION ALL
+                SELECT deck_id, -1 FROM old_cards
+            ) c GROUP BY deck_id
+        ) t
+        WHERE d.id = t.deck_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cards_deck_stats_insert ON cards;
+CREATE TRIGGER cards_deck_stats_insert
+    AFTER INSERT ON cards REFERENCING NEW TABLE AS new_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION deck_stats_sync();
+
+DROP TRIGGER IF EXISTS cards_deck_stats_delete ON cards;
+CREATE TRIGGER cards_deck_stats_delete
+    AFTER DELETE ON cards REFERENCING OLD TABLE AS old_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION deck_stats_sync();
+
+DROP TRIGGER IF EXISTS cards_deck_stats_update ON cards;
+CREATE TRIGGER cards_deck_stats_update
+    AFTER UPDATE ON cards REFERENCING OLD TABLE AS old_cards NEW TABLE AS new_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION deck_stats_sync();
+
+-- GET /decks/summary: deck row with its maintained counters and the progress
+-- of the latest unfinished session (counted on session_cards, never on cards).
+CREATE OR REPLACE VIEW deck_summary_view AS
+SELECT d.*,
+    a.id AS session_id,
+    a.mode AS session_mode,
+    a.remaining_count,
+    a.smashed_count
+FROM decks d
+LEFT JOIN LATERAL (
+    SELECT s.id, s.mode,
+        count(sc.card_id) FILTER (WHERE sc.state = 'remaining') AS remaining_count,
+        count(sc.card_id) FILTER (WHERE sc.smashed_position IS NOT NULL) AS smashed_count
+    FROM (
+        SELECT id, mode FROM sessions
+        WHERE deck_id = d.id AND status != 'finished'
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) s
+    LEFT JOIN session_cards sc ON sc.session_id = s.id
+    GROUP BY s.id, s.mode
+) a ON true;
+
+UPDATE decks d
+SET card_count = (SELECT count(*) FROM cards c WHERE c.deck_id = d.id),
+    cover_image_url = deck_cover_image(d.id);
+
+COMMIT;
@@ -0,0 +1,43 @@
+-- decks.cards_version: bumped on every card write, used for ETags of card
+-- listings and session state.
+-- Apply with: make db-migrate MIGRATION=009_cards_version.sql
+
+BEGIN;
+
+ALTER TABLE decks ADD COLUMN IF NOT EXISTS cards_version BIGINT NOT NULL DEFAULT 0;
+
+-- Keeps decks.card_count and decks.cover_image_url in step with cards and
+-- bumps decks.cards_version (the ETag version of the deck's card content).
+-- Statement-level, so a bulk insert or COPY touches each deck once.
+CREATE OR REPLACE FUNCTION deck_stats_sync() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE decks d
+        SET card_count = d.card_count + n.cnt, cover_image_url = deck_cover_image(d.id),
+            cards_version = d.cards_version + 1
+        FROM (SELECT deck_id, count(*) AS cnt FROM new_cards GROUP BY deck_id) n
+        WHERE d.id = n.deck_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE decks d
+        SET card_count = GREATEST(d.card_count - o.cnt, 0), cover_image_url = deck_cover_image(d.id),
+            cards_version = d.cards_version + 1
+        FROM (SELECT deck_id, count(*) AS cnt FROM old_cards GROUP BY deck_id) o
+        WHERE d.id = o.deck_id;
+    ELSE
+        UPDATE decks d
+        SET card_count = GREATEST(d.card_count + t.diff, 0), cover_image_url = deck_cover_image(d.id),
+            cards_version = d.cards_version + 1
+        FROM (
+            SELECT deck_id, sum(diff) AS diff FROM (
+                SELECT deck_id, 1 AS diff FROM new_cards
+                UNION ALL
+                SELECT deck_id, -1 FROM old_cards
+            ) c GROUP BY deck_id
+        ) t
+        WHERE d.id = t.deck_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
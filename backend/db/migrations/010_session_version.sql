@@ -0,0 +1,38 @@
+-- sessions.version for optimistic concurrency (compare-and-swap updates).
+-- Apply with: make db-migrate MIGRATION=010_session_version.sql
+
+BEGIN;
+
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
+
+-- Every update of a session row bumps its version, so writers that read,
+-- validated and then update with "WHERE version = <read version>" notice
+-- concurrent changes instead of overwriting them.
+CREATE OR REPLACE FUNCTION sessions_bump_version() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sessions_version ON sessions;
+CREATE TRIGGER sessions_version
+    BEFORE UPDATE ON sessions
+    FOR EACH ROW EXECUTE FUNCTION sessions_bump_version();
+
+-- s.* changed, so the view has to be rebuilt rather than replaced
+DROP VIEW IF EXISTS session_view;
+
+-- Session rows with the card lists assembled from session_cards,
+-- in the same JSON array form the API has always returned
+CREATE OR REPLACE VIEW session_view AS
+SELECT s.*,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'remaining'), '[]'::jsonb) AS remaining_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'passed'), '[]'::jsonb) AS passed_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.smashed_position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.smashed_position IS NOT NULL), '[]'::jsonb) AS smashed_cards
+FROM sessions s;
+
+COMMIT;
@@ -0,0 +1,127 @@
+-- Write-behind votes: session_apply_decision*() skip their votes insert when
+-- the connection sets pickme.defer_votes = on (see backend/vote_writer.py).
+-- Apply with: make db-migrate MIGRATION=011_deferred_votes.sql
+
+BEGIN;
+
+-- Write-behind mode (VOTE_WRITE_BEHIND in the backend): pool connections set
+-- pickme.defer_votes = on and the backend batches the votes rows itself.
+CREATE OR REPLACE FUNCTION session_votes_deferred() RETURNS BOOLEAN AS $$
+    SELECT COALESCE(current_setting('pickme.defer_votes', true), '') = 'on';
+$$ LANGUAGE sql STABLE;
+
+-- Applies one swipe/duel decision to a session: locks the session row,
+-- moves the card, records the vote and updates the status.
+-- Returns NULL on success, otherwise 'not_found' or 'finished'.
+CREATE OR REPLACE FUNCTION session_apply_decision(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS TEXT AS $$
+DECLARE
+    s sessions%ROWTYPE;
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN 'not_found';
+    END IF;
+    IF s.status = 'finished' THEN
+        RETURN 'finished';
+    END IF;
+
+    PERFORM session_card_transition(p_session_id, s.mode, p_card_id, p_decision, s.card_seq + 1);
+
+    IF NOT session_votes_deferred() THEN
+        INSERT INTO votes (id, session_id, card_id, decision, round)
+        VALUES (uuid_generate_v4(), p_session_id, p_card_id, p_decision, p_round);
+    END IF;
+
+    UPDATE sessions
+    SET card_seq = s.card_seq + 1,
+        status = session_status_after_decision(p_session_id, s.mode, s.status),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_session_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Applies an ordered batch of decisions
+-- (JSON array of {index, card_id, decision, round}) under one session lock:
+-- one sessions update and one multi-row votes insert for the whole batch.
+-- Items that no longer apply are skipped and reported, not fatal.
+CREATE OR REPLACE FUNCTION session_apply_decisions(
+    p_session_id UUID, p_decisions JSONB
+) RETURNS JSONB AS $$
+DECLARE
+    s sessions%ROWTYPE;
+    r RECORD;
+    v_seq INTEGER;
+    v_status TEXT;
+    v_card_id UUID;
+    v_state TEXT;
+    v_reason TEXT;
+    v_applied INTEGER := 0;
+    v_rejected JSONB := '[]'::jsonb;
+    v_vote_cards UUID[] := '{}';
+    v_vote_decisions TEXT[] := '{}';
+    v_vote_rounds INTEGER[] := '{}';
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    END IF;
+
+    v_seq := s.card_seq;
+    v_status := s.status;
+
+    FOR r IN SELECT value AS item FROM jsonb_array_elements(p_decisions) LOOP
+        v_card_id := (r.item->>'card_id')::uuid;
+        v_reason := NULL;
+
+        IF v_status = 'finished' THEN
+            v_reason := 'session_finished';
+        ELSE
+            SELECT state INTO v_state FROM session_cards
+            WHERE session_id = p_session_id AND card_id = v_card_id;
+            IF NOT FOUND THEN
+                v_reason := 'not_in_session';
+            ELSIF v_state = 'passed' THEN
+                v_reason := 'already_passed';
+            ELSIF v_state <> 'remaining' THEN
+                v_reason := 'already_decided';
+            END IF;
+        END IF;
+
+        IF v_reason IS NOT NULL THEN
+            v_rejected := v_rejected || jsonb_build_object(
+                'index', r.item->'index', 'card_id', r.item->'card_id', 'reason', v_reason
+            );
+            CONTINUE;
+        END IF;
+
+        v_seq := v_seq + 1;
+        PERFORM session_card_transition(p_session_id, s.mode, v_card_id, r.item->>'decision', v_seq);
+        v_status := session_status_after_decision(p_session_id, s.mode, v_status);
+
+        v_vote_cards := v_vote_cards || v_card_id;
+        v_vote_decisions := v_vote_decisions || (r.item->>'decision');
+        v_vote_rounds := v_vote_rounds || COALESCE((r.item->>'round')::integer, 1);
+        v_applied := v_applied + 1;
+    END LOOP;
+
+    IF v_applied > 0 THEN
+        IF NOT session_votes_deferred() THEN
+            INSERT INTO votes (id, session_id, card_id, decision, round)
+            SELECT uuid_generate_v4(), p_session_id, t.card_id, t.decision, t.round
+            FROM unnest(v_vote_cards, v_vote_decisions, v_vote_rounds) AS t(card_id, decision, round);
+        END IF;
+
+        UPDATE sessions
+        SET card_seq = v_seq, status = v_status, updated_at = CURRENT_TIMESTAMP
+        WHERE id = p_session_id;
+    END IF;
+
+    RETURN jsonb_build_object('applied', v_applied, 'rejected', v_rejected);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
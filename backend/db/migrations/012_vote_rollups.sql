@@ -0,0 +1,255 @@
+-- Leaderboard rollups: votes.mode, card_vote_stats/deck_vote_stats kept
+-- up to date by a statement-level trigger on votes, and vote_stats_rebuild()
+-- for the backfill of existing votes.
+-- Apply with: make db-migrate MIGRATION=012_vote_rollups.sql
+-- then: make leaderboard-backfill
+
+BEGIN;
+
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS mode VARCHAR(20);
+
+-- Leaderboard rollups over votes, maintained by the votes_stats_insert
+-- trigger. Swipe votes count as smashes/passes, duel votes as wins/losses;
+-- seen is every vote on the card.
+CREATE TABLE IF NOT EXISTS card_vote_stats (
+    card_id UUID PRIMARY KEY REFERENCES cards(id) ON DELETE CASCADE,
+    deck_id UUID NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    seen BIGINT NOT NULL DEFAULT 0,
+    smashes BIGINT NOT NULL DEFAULT 0,
+    passes BIGINT NOT NULL DEFAULT 0,
+    duel_wins BIGINT NOT NULL DEFAULT 0,
+    duel_losses BIGINT NOT NULL DEFAULT 0,
+    last_vote_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS deck_vote_stats (
+    deck_id UUID PRIMARY KEY REFERENCES decks(id) ON DELETE CASCADE,
+    votes BIGINT NOT NULL DEFAULT 0,
+    smashes BIGINT NOT NULL DEFAULT 0,
+    passes BIGINT NOT NULL DEFAULT 0,
+    duels BIGINT NOT NULL DEFAULT 0,
+    last_vote_at TIMESTAMP,
+    -- bumped on every change, part of the leaderboard ETag
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_card_vote_stats_deck_id ON card_vote_stats(deck_id);
+
+-- Applies one swipe/duel decision to a session: locks the session row,
+-- moves the card, records the vote and updates the status.
+-- Returns NULL on success, otherwise 'not_found' or 'finished'.
+CREATE OR REPLACE FUNCTION session_apply_decision(
+    p_session_id UUID, p_card_id UUID, p_decision TEXT, p_round INTEGER
+) RETURNS TEXT AS $$
+DECLARE
+    s sessions%ROWTYPE;
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN 'not_found';
+    END IF;
+    IF s.status = 'finished' THEN
+        RETURN 'finished';
+    END IF;
+
+    PERFORM session_card_transition(p_session_id, s.mode, p_card_id, p_decision, s.card_seq + 1);
+
+    IF NOT session_votes_deferred() THEN
+        INSERT INTO votes (id, session_id, card_id, decision, round, mode)
+        VALUES (uuid_generate_v4(), p_session_id, p_card_id, p_decision, p_round, s.mode);
+    END IF;
+
+    UPDATE sessions
+    SET card_seq = s.card_seq + 1,
+        status = session_status_after_decision(p_session_id, s.mode, s.status),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_session_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Applies an ordered batch of decisions
+-- (JSON array of {index, card_id, decision, round}) under one session lock:
+-- one sessions update and one multi-row votes insert for the whole batch.
+-- Items that no longer apply are skipped and reported, not fatal.
+CREATE OR REPLACE FUNCTION session_apply_decisions(
+    p_session_id UUID, p_decisions JSONB
+) RETURNS JSONB AS $$
+DECLARE
+    s sessions%ROWTYPE;
+    r RECORD;
+    v_seq INTEGER;
+    v_status TEXT;
+    v_card_id UUID;
+    v_state TEXT;
+    v_reason TEXT;
+    v_applied INTEGER := 0;
+    v_rejected JSONB := '[]'::jsonb;
+    v_vote_cards UUID[] := '{}';
+    v_vote_decisions TEXT[] := '{}';
+    v_vote_rounds INTEGER[] := '{}';
+BEGIN
+    SELECT * INTO s FROM sessions WHERE id = p_session_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'Session not found', 'status_code', 404);
+    END IF;
+
+    v_seq := s.card_seq;
+    v_status := s.status;
+
+    FOR r IN SELECT value AS item FROM jsonb_array_elements(p_decisions) LOOP
+        v_card_id := (r.item->>'card_id')::uuid;
+        v_reason := NULL;
+
+        IF v_status = 'finished' THEN
+            v_reason := 'session_finished';
+        ELSE
+            SELECT state INTO v_state FROM session_cards
+            WHERE session_id = p_session_id AND card_id = v_card_id;
+            IF NOT FOUND THEN
+                v_reason := 'not_in_session';
+            ELSIF v_state = 'passed' THEN
+                v_reason := 'already_passed';
+            ELSIF v_state <> 'remaining' THEN
+                v_reason := 'already_decided';
+            END IF;
+        END IF;
+
+        IF v_reason IS NOT NULL THEN
+            v_rejected := v_rejected || jsonb_build_object(
+                'index', r.item->'index', 'card_id', r.item->'card_id', 'reason', v_reason
+            );
+            CONTINUE;
+        END IF;
+
+        v_seq := v_seq + 1;
+        PERFORM session_card_transition(p_session_id, s.mode, v_card_id, r.item->>'decision', v_seq);
+        v_status := session_status_after_decision(p_session_id, s.mode, v_status);
+
+        v_vote_cards := v_vote_cards || v_card_id;
+        v_vote_decisions := v_vote_decisions || (r.item->>'decision');
+        v_vote_rounds := v_vote_rounds || COALESCE((r.item->>'round')::integer, 1);
+        v_applied := v_applied + 1;
+    END LOOP;
+
+    IF v_applied > 0 THEN
+        IF NOT session_votes_deferred() THEN
+            INSERT INTO votes (id, session_id, card_id, decision, round, mode)
+            SELECT uuid_generate_v4(), p_session_id, t.card_id, t.decision, t.round, s.mode
+            FROM unnest(v_vote_cards, v_vote_decisions, v_vote_rounds) AS t(card_id, decision, round);
+        END IF;
+
+        UPDATE sessions
+        SET card_seq = v_seq, status = v_status, updated_at = CURRENT_TIMESTAMP
+        WHERE id = p_session_id;
+    END IF;
+
+    RETURN jsonb_build_object('applied', v_applied, 'rejected', v_rejected);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Adds a batch of new votes to card_vote_stats/deck_vote_stats.
+-- Statement-level, so a multi-row insert or a COPY from the vote writer
+-- costs one upsert per card and per deck. Rows are upserted in key order
+-- so concurrent batches lock them in the same order.
+CREATE OR REPLACE FUNCTION vote_stats_sync() RETURNS TRIGGER AS $$
+BEGIN
+    WITH v AS (
+        SELECT n.card_id, c.deck_id,
+            count(*) AS seen,
+            count(*) FILTER (WHERE n.mode IS DISTINCT FROM 'duel' AND n.decision <> 'pass') AS smashes,
+            count(*) FILTER (WHERE n.mode IS DISTINCT FROM 'duel' AND n.decision = 'pass') AS passes,
+            count(*) FILTER (WHERE n.mode = 'duel' AND n.decision <> 'pass') AS duel_wins,
+            count(*) FILTER (WHERE n.mode = 'duel' AND n.decision = 'pass') AS duel_losses,
+            max(n.timestamp) AS last_vote_at
+        FROM new_votes n
+        JOIN cards c ON c.id = n.card_id
+        GROUP BY n.card_id, c.deck_id
+    ), card_rows AS (
+        INSERT INTO card_vote_stats AS cs
+            (card_id, deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at)
+        SELECT card_id, deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at
+        FROM v ORDER BY card_id
+        ON CONFLICT (card_id) DO UPDATE
+        SET seen = cs.seen + EXCLUDED.seen,
+            smashes = cs.smashes + EXCLUDED.smashes,
+            passes = cs.passes + EXCLUDED.passes,
+            duel_wins = cs.duel_wins + EXCLUDED.duel_wins,
+            duel_losses = cs.duel_losses + EXCLUDED.duel_losses,
+            last_vote_at = GREATEST(cs.last_vote_at, EXCLUDED.last_vote_at)
+    )
+    INSERT INTO deck_vote_stats AS ds (deck_id, votes, smashes, passes, duels, last_vote_at, version)
+    SELECT deck_id, sum(seen), sum(smashes), sum(passes), sum(duel_wins), max(last_vote_at), 1
+    FROM v GROUP BY deck_id ORDER BY deck_id
+    ON CONFLICT (deck_id) DO UPDATE
+    SET votes = ds.votes + EXCLUDED.votes,
+        smashes = ds.smashes + EXCLUDED.smashes,
+        passes = ds.passes + EXCLUDED.passes,
+        duels = ds.duels + EXCLUDED.duels,
+        last_vote_at = GREATEST(ds.last_vote_at, EXCLUDED.last_vote_at),
+        version = ds.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS votes_stats_insert ON votes;
+CREATE TRIGGER votes_stats_insert
+    AFTER INSERT ON votes REFERENCING NEW TABLE AS new_votes
+    FOR EACH STATEMENT EXECUTE FUNCTION vote_stats_sync();
+
+-- Recomputes the rollups of one deck from votes (backfill of historical
+-- votes, or repair). The stats tables are locked against the trigger for
+-- the duration, so no vote is counted twice or lost; votes cast before
+-- votes.mode existed take the mode of their session. Returns the vote count.
+-- Rollups only grow: votes deleted with their session stay counted until
+-- the deck is rebuilt.
+CREATE OR REPLACE FUNCTION vote_stats_rebuild(p_deck_id UUID) RETURNS BIGINT AS $$
+DECLARE
+    v_votes BIGINT;
+BEGIN
+    LOCK TABLE card_vote_stats, deck_vote_stats IN SHARE ROW EXCLUSIVE MODE;
+
+    CREATE TEMP TABLE vote_stats_rebuild_rows ON COMMIT DROP AS
+    SELECT v.card_id,
+        count(*) AS seen,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) IS DISTINCT FROM 'duel' AND v.decision <> 'pass') AS smashes,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) IS DISTINCT FROM 'duel' AND v.decision = 'pass') AS passes,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) = 'duel' AND v.decision <> 'pass') AS duel_wins,
+        count(*) FILTER (WHERE COALESCE(v.mode, s.mode) = 'duel' AND v.decision = 'pass') AS duel_losses,
+        max(v.timestamp) AS last_vote_at
+    FROM cards c
+    JOIN votes v ON v.card_id = c.id
+    LEFT JOIN sessions s ON s.id = v.session_id
+    WHERE c.deck_id = p_deck_id
+    GROUP BY v.card_id;
+
+    DELETE FROM card_vote_stats
+    WHERE deck_id = p_deck_id
+      AND card_id NOT IN (SELECT card_id FROM vote_stats_rebuild_rows);
+
+    INSERT INTO card_vote_stats AS cs
+        (card_id, deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at)
+    SELECT card_id, p_deck_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at
+    FROM vote_stats_rebuild_rows
+    ON CONFLICT (card_id) DO UPDATE
+    SET seen = EXCLUDED.seen, smashes = EXCLUDED.smashes, passes = EXCLUDED.passes,
+        duel_wins = EXCLUDED.duel_wins, duel_losses = EXCLUDED.duel_losses,
+        last_vote_at = EXCLUDED.last_vote_at;
+
+    INSERT INTO deck_vote_stats AS ds (deck_id, votes, smashes, passes, duels, last_vote_at, version)
+    SELECT p_deck_id, COALESCE(sum(seen), 0), COALESCE(sum(smashes), 0), COALESCE(sum(passes), 0),
+        COALESCE(sum(duel_wins), 0), max(last_vote_at), 1
+    FROM vote_stats_rebuild_rows
+    ON CONFLICT (deck_id) DO UPDATE
+    SET votes = EXCLUDED.votes, smashes = EXCLUDED.smashes, passes = EXCLUDED.passes,
+        duels = EXCLUDED.duels, last_vote_at = EXCLUDED.last_vote_at,
+        version = ds.version + 1
+    RETURNING votes INTO v_votes;
+
+    DROP TABLE vote_stats_rebuild_rows;
+    RETURN v_votes;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
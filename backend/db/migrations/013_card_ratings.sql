@@ -0,0 +1,20 @@
+-- Bradley-Terry card ratings written by the ranking job.
+-- Apply with: make db-migrate MIGRATION=013_card_ratings.sql
+-- then: make ratings
+
+BEGIN;
+
+-- Bradley-Terry ratings (Elo scale) of the cards that played duels,
+-- replaced per deck by the ranking job (backend/jobs/fit_ratings.py)
+CREATE TABLE IF NOT EXISTS card_ratings (
+    card_id UUID PRIMARY KEY REFERENCES cards(id) ON DELETE CASCADE,
+    deck_id UUID NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    rating DOUBLE PRECISION NOT NULL,
+    duels INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_card_ratings_deck_id ON card_ratings(deck_id);
+
+COMMIT;
@@ -0,0 +1,110 @@
+-- Monthly range partitioning of votes.
+-- The existing table becomes the partition votes_legacy (everything up to the
+-- end of the current month), so no rows are copied; new months get their own
+-- partitions. Rebuilding the primary key to (id, timestamp) and validating the
+-- range scan votes_legacy once while it is locked.
+-- Apply with: make db-migrate MIGRATION=014_partition_votes.sql
+
+BEGIN;
+
+LOCK TABLE votes IN ACCESS EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS votes_stats_insert ON votes;
+ALTER TABLE votes RENAME TO votes_legacy;
+ALTER INDEX idx_votes_session_id RENAME TO votes_legacy_session_id_idx;
+ALTER INDEX idx_votes_card_id RENAME TO votes_legacy_card_id_idx;
+
+UPDATE votes_legacy SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL;
+ALTER TABLE votes_legacy ALTER COLUMN timestamp SET NOT NULL;
+ALTER TABLE votes_legacy DROP CONSTRAINT votes_pkey;
+ALTER TABLE votes_legacy ADD CONSTRAINT votes_legacy_pkey PRIMARY KEY (id, timestamp);
+
+CREATE TABLE votes (
+    id UUID DEFAULT uuid_generate_v4(),
+    session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+    card_id UUID REFERENCES cards(id) ON DELETE CASCADE,
+    decision VARCHAR(20) NOT NULL,
+    round INTEGER DEFAULT 1,
+    -- session mode when the vote was cast (swipe | duel)
+    mode VARCHAR(20),
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- The existing indexes of votes_legacy are attached, not rebuilt
+CREATE INDEX idx_votes_session_id ON votes(session_id);
+CREATE INDEX idx_votes_card_id ON votes(card_id);
+
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE votes ATTACH PARTITION votes_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        (date_trunc('month', CURRENT_TIMESTAMP) + interval '1 month')::date
+    );
+END;
+$$;
+
+CREATE TABLE votes_default PARTITION OF votes DEFAULT;
+
+-- Partitions of votes with their time ranges (range_start is NULL for a
+-- partition that starts at MINVALUE; is_default marks votes_default).
+CREATE OR REPLACE VIEW votes_partitions AS
+SELECT c.relname AS name,
+    substring(pg_get_expr(c.relpartbound, c.oid) FROM 'FROM \(''([^'']+)''\)')::timestamp AS range_start,
+    substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \(''([^'']+)''\)')::timestamp AS range_end,
+    pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT' AS is_default
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'votes'::regclass;
+
+-- Creates the monthly partitions of votes from the current month to
+-- p_months_ahead months ahead; months already covered are skipped. Rows of a
+-- new month that landed in votes_default are moved into its partition.
+-- Returns the number of partitions created.
+CREATE OR REPLACE FUNCTION votes_create_partitions(p_months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    v_start DATE;
+    v_end DATE;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    -- one creator at a time (every backend worker runs this)
+    PERFORM pg_advisory_xact_lock(hashtext('votes_create_partitions'));
+
+    FOR i IN 0..p_months_ahead LOOP
+        v_start := (date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => i))::date;
+        v_end := (v_start + interval '1 month')::date;
+        CONTINUE WHEN EXISTS (
+            SELECT 1 FROM votes_partitions
+            WHERE NOT is_default
+              AND COALESCE(range_start, '-infinity') < v_end
+              AND range_end > v_start
+        );
+
+        v_name := format('votes_y%sm%s', to_char(v_start, 'YYYY'), to_char(v_start, 'MM'));
+        EXECUTE format('CREATE TABLE %I (LIKE votes INCLUDING DEFAULTS)', v_name);
+        EXECUTE format(
+            'WITH moved AS (
+                DELETE FROM votes_default WHERE timestamp >= %L AND timestamp < %L
+                RETURNING id, session_id, card_id, decision, round, mode, timestamp
+            )
+            INSERT INTO %I (id, session_id, card_id, decision, round, mode, timestamp)
+            SELECT id, session_id, card_id, decision, round, mode, timestamp FROM moved',
+            v_start, v_end, v_name
+        );
+        EXECUTE format('ALTER TABLE votes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', v_name, v_start, v_end);
+        v_created := v_created + 1;
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT votes_create_partitions(3);
+
+-- The rollup trigger moves to the partitioned table
+CREATE TRIGGER votes_stats_insert
+    AFTER INSERT ON votes REFERENCING NEW TABLE AS new_votes
+    FOR EACH STATEMENT EXECUTE FUNCTION vote_stats_sync();
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- Session janitor (backend/session_janitor.py): sessions.expired_at and
+-- compacted_at, plus partial indexes for active session lookups and the
+-- janitor's scans. The indexes are built CONCURRENTLY after the
+-- transaction, since that cannot run inside one.
+-- Apply with: make db-migrate MIGRATION=015_session_janitor.sql
+
+BEGIN;
+
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS expired_at TIMESTAMP;
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS compacted_at TIMESTAMP;
+
+-- s.* changed, so the view has to be rebuilt rather than replaced
+DROP VIEW IF EXISTS session_view;
+
+-- Session rows with the card lists assembled from session_cards,
+-- in the same JSON array form the API has always returned
+CREATE OR REPLACE VIEW session_view AS
+SELECT s.*,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'remaining'), '[]'::jsonb) AS remaining_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.state = 'passed'), '[]'::jsonb) AS passed_cards,
+    COALESCE((SELECT jsonb_agg(sc.card_id ORDER BY sc.smashed_position) FROM session_cards sc
+              WHERE sc.session_id = s.id AND sc.smashed_position IS NOT NULL), '[]'::jsonb) AS smashed_cards
+FROM sessions s;
+
+COMMIT;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_active_deck ON sessions(deck_id, created_at DESC)
+    WHERE status != 'finished';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_active_updated_at ON sessions(updated_at)
+    WHERE status != 'finished';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_expired_at ON sessions(expired_at)
+    WHERE expired_at IS NOT NULL AND compacted_at IS NULL;
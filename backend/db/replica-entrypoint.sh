@@ -0,0 +1,15 @@
+#!/bin/sh
+# Streaming standby of the primary for the `replica` compose profile (make up-replica).
+# The first start clones the primary with pg_basebackup -R (standby.signal and
+# primary_conninfo are written into the data directory); later starts just resume.
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    mkdir -p "$PGDATA"
+    chown postgres "$PGDATA"
+    chmod 700 "$PGDATA"
+    until pg_isready -h "$PRIMARY_HOST" -U "$PRIMARY_USER" -q; do sleep 1; done
+    su-exec postgres pg_basebackup -h "$PRIMARY_HOST" -U "$PRIMARY_USER" -D "$PGDATA" -R -X stream
+fi
+
+exec su-exec postgres postgres
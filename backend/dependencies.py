@@ -0,0 +1,16 @@
+"""
+Request dependencies shared by the routers: the resources the app factory
+(main.create_app) puts on app.state at startup, one set per worker process.
+"""
+from fastapi import HTTPException, Request
+
+
+async def get_db(request: Request):
+    db_pool = request.app.state.db_pool
+    if db_pool is None:
+        raise HTTPException(status_code=500, detail="Database not available")
+    return db_pool
+
+
+async def get_redis(request: Request):
+    return request.app.state.redis_client
@@ -0,0 +1,63 @@
+"""
+Conditional GET (ETag / If-None-Match) and Cache-Control for read endpoints.
+
+ETags are built from version columns only (updated_at, sessions.version,
+decks.cards_version), so a handler can answer 304 after a primary-key
+lookup, before any listing or card-hydration queries run.
+decks.cards_version is bumped by the cards_deck_stats_* triggers on every
+card write, which also covers card edits seen through a session.
+"""
+import hashlib
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Response
+
+CARD_HTTP_MAX_AGE = int(os.getenv("CARD_HTTP_MAX_AGE", "60"))
+
+# Card content: shared caches (CDN) may keep it briefly and revalidate with the ETag
+CARDS_CACHE_CONTROL = f"public, max-age={CARD_HTTP_MAX_AGE}, stale-while-revalidate={CARD_HTTP_MAX_AGE * 5}"
+# Deck rows: cacheable anywhere, but always revalidated
+DECK_CACHE_CONTROL = "public, no-cache"
+# Session state belongs to one player and changes on every decision
+SESSION_CACHE_CONTROL = "private, no-cache"
+
+
+def _part(value) -> str:
+    if isinstance(value, datetime):
+        return str(int(value.timestamp() * 1_000_000))
+    return "" if value is None else str(value)
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the given version parts (and request variants such as cursor/fields)."""
+    digest = hashlib.blake2b("|".join(_part(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are the same entity tag
+    tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
+
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified(if_none_match: Optional[str], etag: str, cache_control: str) -> Optional[Response]:
+    """304 response when the client already has this version, otherwise None."""
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers(etag, cache_control))
+    return None
@@ -0,0 +1,25 @@
+# Maintenance jobs, run from backend/: python -m jobs.<name>
+from typing import Dict
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Before the job's own imports read their settings (shards.SESSION_SHARDS, ...)
+load_dotenv()
+
+import database
+import serialization
+import shards
+
+
+async def connect(settings: dict = None) -> asyncpg.Connection:
+    """One connection with the same settings and codecs as the API pool (the catalog by default)."""
+    load_dotenv()
+    conn = await asyncpg.connect(**(settings or database.connect_kwargs()))
+    await serialization.init_connection(conn)
+    return conn
+
+
+def nodes() -> Dict[str, dict]:
+    """Connect settings of every session node (shards.py), the catalog ("main") first."""
+    return shards.node_settings()
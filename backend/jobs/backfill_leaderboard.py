@@ -0,0 +1,82 @@
+"""
+Backfill of the leaderboard rollups (card_vote_stats / deck_vote_stats)
+from the votes already stored: needed once after migration 012, and safe
+to rerun to repair a deck.
+
+Each deck is rebuilt by vote_stats_rebuild() in its own transaction. It
+locks the stats tables against the votes trigger while it runs, so votes
+keep arriving between decks and none is lost or counted twice. With
+session shards (shards.py) the rollups of every node are rebuilt from the
+votes on that node.
+
+Votes cast before migration 012 have no mode; the backfill sets it first.
+The legacy clients recorded a duel as two POST /decision calls (the chosen
+card smashed, the other passed) on a session already in duel mode, so a
+vote without mode counts as a duel vote when its session is in duel mode
+and the same card was smashed earlier in that session (every duel card
+won the swipe phase); any other such vote is a swipe. Duels of a session
+that went back to swipe mode (reswipe) stay swipes.
+
+Run from backend/: python -m jobs.backfill_leaderboard [--deck ID]
+"""
+import argparse
+import asyncio
+import time
+
+from jobs import connect, nodes
+
+BACKFILL_MODE_SQL = """
+UPDATE votes v
+SET mode = CASE
+    WHEN (SELECT s.mode FROM sessions s WHERE s.id = v.session_id) = 'duel'
+         AND EXISTS (
+             SELECT 1 FROM votes e
+             WHERE e.session_id = v.session_id AND e.card_id = v.card_id
+               AND e.decision <> 'pass' AND (e.timestamp, e.id) < (v.timestamp, v.id)
+         )
+    THEN 'duel' ELSE 'swipe' END
+FROM cards c
+WHERE c.id = v.card_id AND c.deck_id = $1 AND v.mode IS NULL
+"""
+
+
+async def backfill_node(node: str, settings: dict, deck_id=None, pause: float = 0.0):
+    conn = await connect(settings)
+    try:
+        if deck_id:
+            deck_ids = [deck_id]
+        else:
+            deck_ids = [row["id"] for row in await conn.fetch("SELECT id FROM decks ORDER BY id")]
+
+        started = time.perf_counter()
+        total = 0
+        for number, deck in enumerate(deck_ids, start=1):
+            async with conn.transaction():
+                status = await conn.execute(BACKFILL_MODE_SQL, deck)
+                votes = await conn.fetchval("SELECT vote_stats_rebuild($1)", deck)
+            total += votes
+            moded = int(status.split()[-1])
+            print(f"[{node} {number}/{len(deck_ids)}] deck {deck}: {votes} votes, mode set on {moded}")
+            if pause:
+                # Gives the writers blocked on the stats tables room between decks
+                await asyncio.sleep(pause)
+        print(f"{node}: rebuilt {len(deck_ids)} decks, {total} votes in {time.perf_counter() - started:.1f}s")
+    finally:
+        await conn.close()
+
+
+async def backfill(deck_id=None, pause: float = 0.0):
+    for node, settings in nodes().items():
+        await backfill_node(node, settings, deck_id, pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--deck", help="rebuild only this deck")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between decks")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.deck, args.pause))
+
+
+if __name__ == "__main__":
+    main()
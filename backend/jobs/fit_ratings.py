@@ -0,0 +1,151 @@
+"""
+Ranking job: fits Bradley–Terry ratings per deck from duel votes and
+stores them in card_ratings (read by GET /decks/{id}/leaderboard).
+
+Duels are assembled from votes by the database and streamed through a
+server-side cursor in chunks of --chunk rows into ratings.DuelCounts, so
+the process holds one chunk plus the per-pair counts, never the votes.
+Only decks with duels in deck_vote_stats are fitted. Run
+backfill_leaderboard first on a database with votes from before migration
+012: it sets the mode of the legacy duel votes, which are left out until then.
+
+With session shards (shards.py) the duels of a deck are read from every
+node and added to one DuelCounts over the catalog's cards: a node's card
+positions are mapped to the catalog's, duels of cards the catalog no
+longer has are dropped. The ratings are stored in the catalog.
+
+Run from backend/: python -m jobs.fit_ratings [--deck ID] [--chunk 50000]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import ratings
+from jobs import connect, nodes
+
+DECK_CARDS_SQL = "SELECT id FROM cards WHERE deck_id = $1 ORDER BY id"
+
+# One row per duel: the positions (in DECK_CARDS_SQL order) of the winner and
+# the loser. A duel is a win immediately followed, in the session's duel votes,
+# by a loss of the same round: POST /duel writes both with one timestamp (the
+# win sorts first), the legacy clients sent them as two POST /decision calls.
+# Votes without mode (before migration 012) count once backfill_leaderboard
+# has set it.
+DUELS_SQL = """
+WITH deck_cards AS (
+    SELECT id, (row_number() OVER (ORDER BY id) - 1)::int AS idx
+    FROM cards WHERE deck_id = $1
+),
+duel_votes AS (
+    SELECT dc.idx, v.decision, v.round,
+           lead(dc.idx) OVER w AS next_idx,
+           lead(v.decision) OVER w AS next_decision,
+           lead(v.round) OVER w AS next_round
+    FROM deck_cards dc
+    JOIN votes v ON v.card_id = dc.id
+    WHERE v.mode = 'duel'
+    WINDOW w AS (PARTITION BY v.session_id ORDER BY v.timestamp, v.decision = 'pass', v.id)
+)
+SELECT idx AS winner, next_idx AS loser
+FROM duel_votes
+WHERE decision <> 'pass' AND next_decision = 'pass' AND next_round IS NOT DISTINCT FROM round
+"""
+
+
+async def load_duels(conn, deck_id, chunk: int, counts: ratings.DuelCounts = None) -> ratings.DuelCounts:
+    """Duels of the deck on this connection's node, added to `counts` (new ones over its cards if None)."""
+    # One snapshot for the card list and the duels, so the positions agree
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        card_ids = [row["id"] for row in await conn.fetch(DECK_CARDS_SQL, deck_id)]
+        remap = None
+        if counts is None:
+            counts = ratings.DuelCounts(card_ids)
+        else:
+            index = {card_id: i for i, card_id in enumerate(counts.card_ids)}
+            remap = np.array([index.get(card_id, -1) for card_id in card_ids], dtype=np.int64)
+        cursor = await conn.cursor(DUELS_SQL, deck_id)
+        while True:
+            rows = await cursor.fetch(chunk)
+            if not rows:
+                break
+            winners = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            losers = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+            if remap is not None:
+                winners, losers = remap[winners], remap[losers]
+                known = (winners >= 0) & (losers >= 0)
+                winners, losers = winners[known], losers[known]
+            counts.add(winners, losers)
+    return counts
+
+
+async def store_ratings(conn, deck_id, counts: ratings.DuelCounts, strengths: np.ndarray):
+    played = np.flatnonzero(counts.games)
+    records = [
+        (counts.card_ids[i], deck_id, float(strengths[i]), int(counts.games[i]), int(counts.wins[i]))
+        for i in played
+    ]
+    async with conn.transaction():
+        await conn.execute("DELETE FROM card_ratings WHERE deck_id = $1", deck_id)
+        await conn.copy_records_to_table(
+            "card_ratings", records=records,
+            columns=["card_id", "deck_id", "rating", "duels", "wins"],
+        )
+        # New leaderboard ETag (the catalog may have no votes of its own for a sharded deck)
+        await conn.execute(
+            """
+            INSERT INTO deck_vote_stats AS ds (deck_id, version) VALUES ($1, 1)
+            ON CONFLICT (deck_id) DO UPDATE SET version = ds.version + 1
+            """,
+            deck_id,
+        )
+
+
+async def fit_decks(deck_id=None, chunk: int = 50_000):
+    # The catalog ("main") comes first: its cards are the positions of DuelCounts
+    connections = [await connect(settings) for settings in nodes().values()]
+    conn, node_conns = connections[0], connections[1:]
+    try:
+        if deck_id:
+            deck_ids = [deck_id]
+        else:
+            deck_ids = sorted({
+                row["deck_id"]
+                for node_conn in connections
+                for row in await node_conn.fetch("SELECT deck_id FROM deck_vote_stats WHERE duels > 0")
+            })
+            # A node may still hold the rollups of a deck deleted in the catalog
+            deck_ids = [row["id"] for row in await conn.fetch(
+                "SELECT id FROM decks WHERE id = ANY($1::uuid[]) ORDER BY id", deck_ids
+            )]
+
+        for number, deck in enumerate(deck_ids, start=1):
+            started = time.perf_counter()
+            counts = await load_duels(conn, deck, chunk)
+            for node_conn in node_conns:
+                await load_duels(node_conn, deck, chunk, counts)
+            loaded = time.perf_counter()
+            strengths, iterations = ratings.fit(counts)
+            fitted = time.perf_counter()
+            await store_ratings(conn, deck, counts, strengths)
+            print(
+                f"[{number}/{len(deck_ids)}] deck {deck}: {counts.duels} duels, "
+                f"{int(np.count_nonzero(counts.games))} cards, {iterations} iterations, "
+                f"load {loaded - started:.2f}s fit {fitted - loaded:.2f}s"
+            )
+    finally:
+        for node_conn in connections:
+            await node_conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--deck", help="fit only this deck")
+    parser.add_argument("--chunk", type=int, default=50_000, help="duels fetched per cursor round trip")
+    args = parser.parse_args()
+    asyncio.run(fit_decks(args.deck, args.chunk))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+One votes partition maintenance pass (what the API runs every
+VOTE_PARTITION_CHECK_INTERVAL): create partitions ahead, then detach,
+archive and drop the partitions past the retention period, on every
+session node (shards.py).
+
+Run from backend/: python -m jobs.maintain_votes [--retention-months N] [--archive-dir DIR]
+"""
+import argparse
+import asyncio
+
+import vote_partitions
+from jobs import connect, nodes
+
+
+async def maintain_node(node: str, settings: dict, retention_months: int, archive_dir: str):
+    conn = await connect(settings)
+    try:
+        result = await vote_partitions.maintain_once(conn, retention_months, archive_dir)
+        if not result:
+            print(f"{node}: another process is maintaining the votes partitions, nothing done")
+            return
+        print(f"{node}: created {result['created']} partitions, detached {len(result['detached'])}")
+        for path in result["archived"]:
+            print(f"Archived {path}")
+    finally:
+        await conn.close()
+
+
+async def maintain(retention_months: int, archive_dir: str):
+    for node, settings in nodes().items():
+        await maintain_node(node, settings, retention_months, vote_partitions.archive_dir_for(node, archive_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--retention-months", type=int, default=vote_partitions.VOTE_RETENTION_MONTHS,
+                        help="archive partitions that ended more than N months ago (0 = keep all)")
+    parser.add_argument("--archive-dir", default=vote_partitions.VOTE_ARCHIVE_DIR)
+    args = parser.parse_args()
+    asyncio.run(maintain(args.retention_months, args.archive_dir))
+
+
+if __name__ == "__main__":
+    main()
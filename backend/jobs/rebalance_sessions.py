@@ -0,0 +1,123 @@
+"""
+Moves sessions to the node the shard ring assigns them (shards.py), after
+SESSION_SHARDS changed: a node was added, or one is being retired.
+
+Run it while the API has SESSION_SHARDS_MIGRATING=1, so requests find a
+session on its old node until it is moved. Every node is scanned in
+batches of --batch sessions (keyset on id, --pause seconds between
+batches). A session whose owner on the new ring is another node is moved
+on its own: locked on the source (FOR UPDATE), its deck (and user) is
+mirrored onto the target, the sessions / session_cards / votes rows are
+copied there and the source rows are deleted. A session the target already
+has (a run stopped in between) is only deleted from the source, so the job
+can be rerun at any time.
+
+The votes triggers count the moved votes into the target's rollups; the
+source's rollups only grow, so they are rebuilt (vote_stats_rebuild) for
+every deck that lost sessions.
+
+Run from backend/: python -m jobs.rebalance_sessions [--dry-run] [--batch 100] [--pause 0.1]
+    [--retired name=host:port[/database],...]
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter, defaultdict
+
+import shards
+import vote_writer
+from jobs import connect, nodes
+
+SESSION_BATCH_SQL = "SELECT id FROM sessions WHERE $1::uuid IS NULL OR id > $1 ORDER BY id LIMIT $2"
+LOCK_SESSION_SQL = "SELECT * FROM sessions WHERE id = $1 FOR UPDATE"
+SESSION_CARDS_SQL = "SELECT * FROM session_cards WHERE session_id = $1"
+SESSION_VOTES_SQL = f"SELECT {', '.join(vote_writer.VOTE_COLUMNS)} FROM votes WHERE session_id = $1"
+
+
+async def move_session(catalog, source, target, session_id):
+    """Moves one session from source to target; returns its deck id (None if it is gone)."""
+    async with source.transaction():
+        session = await source.fetchrow(LOCK_SESSION_SQL, session_id)
+        if session is None:
+            return None
+        if not await target.fetchval(shards.SESSION_EXISTS_SQL, session_id):
+            await shards.mirror_deck(catalog, target, session["deck_id"])
+            await shards.mirror_user(catalog, target, session["user_id"])
+            session_cards = await source.fetch(SESSION_CARDS_SQL, session_id)
+            votes = await source.fetch(SESSION_VOTES_SQL, session_id)
+            async with target.transaction():
+                await target.copy_records_to_table(
+                    "sessions", records=[tuple(session)], columns=list(session.keys())
+                )
+                if session_cards:
+                    await target.copy_records_to_table(
+                        "session_cards", records=[tuple(row) for row in session_cards],
+                        columns=list(session_cards[0].keys()),
+                    )
+                if votes:
+                    # Votes of cards deleted since are dropped, as in the vote writer
+                    await vote_writer.insert_votes(target, [tuple(row) for row in votes])
+        # Cascades to session_cards and votes
+        await source.execute("DELETE FROM sessions WHERE id = $1", session_id)
+    return session["deck_id"]
+
+
+async def rebalance(dry_run: bool = False, batch: int = 100, pause: float = 0.0, retired: str = ""):
+    settings = nodes()
+    ring = shards.build_ring(settings)
+    # Retired nodes are only drained: they are not on the ring
+    settings.update(shards.parse_shards(retired))
+    conns = {name: await connect(node) for name, node in settings.items()}
+    catalog = conns[shards.MAIN_NODE]
+    print(f"Ring: {', '.join(ring.nodes)}")
+
+    moved = Counter()
+    touched = defaultdict(set)
+    started = time.perf_counter()
+    try:
+        for source, conn in conns.items():
+            last_id = None
+            while True:
+                rows = await conn.fetch(SESSION_BATCH_SQL, last_id, batch)
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                for row in rows:
+                    target = ring.node(shards.session_key(row["id"]))
+                    if target == source:
+                        continue
+                    if not dry_run:
+                        deck_id = await move_session(catalog, conn, conns[target], row["id"])
+                        if deck_id is None:
+                            continue
+                        touched[source].add(deck_id)
+                    moved[(source, target)] += 1
+                if pause:
+                    await asyncio.sleep(pause)
+            print(f"{source}: scanned")
+
+        for (source, target), count in sorted(moved.items()):
+            print(f"{source} -> {target}: {count} sessions{' (dry run)' if dry_run else ''}")
+        for source, deck_ids in touched.items():
+            for deck_id in sorted(deck_ids):
+                await conns[source].fetchval("SELECT vote_stats_rebuild($1)", deck_id)
+            print(f"{source}: rebuilt the rollups of {len(deck_ids)} decks")
+        print(f"Moved {sum(moved.values())} sessions in {time.perf_counter() - started:.1f}s")
+    finally:
+        for conn in conns.values():
+            await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="only count the sessions that would move")
+    parser.add_argument("--batch", type=int, default=100, help="sessions scanned per query")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--retired", default="",
+                        help="nodes removed from SESSION_SHARDS to drain, in the same name=host:port form")
+    args = parser.parse_args()
+    asyncio.run(rebalance(args.dry_run, args.batch, args.pause, args.retired))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,48 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
+import asyncio
 from dotenv import load_dotenv
-import asyncpg
 import redis.asyncio as redis
-from typing import Optional
 
+import card_cache
+import database
+import replica
+import serialization
+import session_events
+import session_janitor
+import shards
+import vote_partitions
+import vote_writer
+from dependencies import get_db, get_redis
 from routes import decks, cards, sessions
 
 load_dotenv()
 
-# Database connection pool
-db_pool: Optional[asyncpg.Pool] = None
-redis_client: Optional[redis.Redis] = None
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    global db_pool, redis_client
-    
-    # Get database connection parameters
-    db_host = os.getenv("DB_HOST", "localhost")
-    db_port = int(os.getenv("DB_PORT", "5432"))
-    db_user = os.getenv("DB_USER", "pickme")
-    db_password = os.getenv("DB_PASSWORD", "pickme_password")
-    db_name = os.getenv("DB_NAME", "pickme_db")
-    
-    # Debug: print database connection info (without password)
-    print(f"Connecting to database: host={db_host}, port={db_port}, user={db_user}, database={db_name}")
+    # Startup: runs in every worker process, so each worker has its own pool,
+    # Redis client and background loops; handlers get them from app.state
     
-    # Create database pool
-    db_pool = await asyncpg.create_pool(
-        host=db_host,
-        port=db_port,
-        user=db_user,
-        password=db_password,
-        database=db_name,
-        min_size=1,
-        max_size=10,
+    # Create database pool (sizes and timeouts from DB_POOL_* / DB_*, see database.py)
+    # with the hot queries of the routes prepared on every connection
+    db_pool = await database.create_pool(
+        prepared_queries=sessions.PREPARED_QUERIES + cards.PREPARED_QUERIES,
+        server_settings=vote_writer.server_settings(),
     )
+    app.state.db_pool = db_pool
+    # Read replica for read-only endpoints (DB_REPLICA_*, see replica.py)
+    await replica.replica.start(prepared_queries=cards.PREPARED_QUERIES + sessions.READ_QUERIES)
+    # Session shards: extra Postgres nodes for sessions and votes (SESSION_SHARDS, see shards.py)
+    await shards.router.start(
+        db_pool,
+        prepared_queries=sessions.PREPARED_QUERIES + cards.PREPARED_QUERIES,
+        server_settings=vote_writer.server_settings(),
+    )
+    if vote_writer.VOTE_WRITE_BEHIND:
+        await vote_writer.writer.start(db_pool, route=shards.router.pool_for)
     
     # Create Redis client
     try:
@@ -55,47 +57,43 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Redis connection failed (continuing without cache): {e}")
         redis_client = None
+    app.state.redis_client = redis_client
+
+    # Invalidations of the card cache and session deltas from other workers
+    listeners = []
+    if redis_client:
+        listeners.append(asyncio.create_task(card_cache.listen_for_invalidations(redis_client)))
+        listeners.append(asyncio.create_task(session_events.listen_for_events(redis_client)))
+    # Monthly votes partitions ahead, archival past VOTE_RETENTION_MONTHS
+    # on every session node
+    listeners.append(asyncio.create_task(vote_partitions.run_maintenance(shards.router.items())))
+    # Expiry/compaction of abandoned sessions
+    listeners.append(asyncio.create_task(
+        session_janitor.janitor.run([pool for _, pool in shards.router.items()], redis_client)
+    ))
     
     yield
     
     # Shutdown
-    if db_pool:
-        await db_pool.close()
+    for listener in listeners:
+        listener.cancel()
+        try:
+            await listener
+        except asyncio.CancelledError:
+            pass
+    # Flush queued votes while the pool is still open
+    await vote_writer.writer.stop()
+    await shards.router.stop()
+    await replica.replica.stop()
+    app.state.db_pool = None
+    app.state.redis_client = None
+    await db_pool.close()
     if redis_client:
         await redis_client.close()
 
 
-app = FastAPI(
-    title="PickMe API",
-    version="0.1.0",
-    lifespan=lifespan
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-# Dependency to get database pool
-async def get_db():
-    if db_pool is None:
-        raise HTTPException(status_code=500, detail="Database not available")
-    return db_pool
-
-
-# Dependency to get Redis client
-async def get_redis():
-    return redis_client
-
-
 # Health check
-@app.get("/health")
-async def health_check(db=Depends(get_db)):
+async def health_check(db=Depends(get_db), redis_client=Depends(get_redis)):
     try:
         async with db.acquire() as conn:
             await conn.fetchval("SELECT 1")
@@ -108,25 +106,81 @@ async def health_check(db=Depends(get_db)):
             except:
                 pass
         
+        replica_status = "disabled"
+        if replica.replica.configured:
+            replica_status = "healthy" if replica.replica.healthy else "unhealthy (reads on primary)"
+        
         return {
             "status": "ok",
             "db": "connected",
+            "replica": replica_status,
             "redis": redis_status
         }
+    except HTTPException:
+        # 503 from admission control (pool saturated) stays a 503
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Include routers
-app.include_router(decks.router, prefix="/api/v1/decks", tags=["decks"])
-app.include_router(cards.router, prefix="/api/v1/cards", tags=["cards"])
-app.include_router(sessions.router, prefix="/api/v1/sessions", tags=["sessions"])
+# Per-worker cache counters
+async def metrics(request: Request):
+    db_pool = request.app.state.db_pool
+    return {
+        "db_pool": database.stats(db_pool) if db_pool else None,
+        "replica": replica.replica.stats(),
+        "shards": shards.router.stats(),
+        "card_cache": card_cache.cache.stats(),
+        "session_events": session_events.hub.stats(),
+        "votes": vote_writer.writer.stats(),
+        "session_janitor": session_janitor.janitor.stats(),
+    }
+
+
+def create_app() -> FastAPI:
+    """
+    The application. The pool and the Redis client are created by the
+    lifespan and live on app.state (see dependencies.py); production runs
+    one app per worker process through serve.py.
+    """
+    app = FastAPI(
+        title="PickMe API",
+        version="0.1.0",
+        lifespan=lifespan,
+        default_response_class=serialization.FastJSONResponse,
+    )
+    app.state.db_pool = None
+    app.state.redis_client = None
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Retry-After"],
+    )
+
+    app.add_api_route("/health", health_check, methods=["GET"])
+    app.add_api_route("/metrics", metrics, methods=["GET"])
+
+    # Include routers
+    app.include_router(decks.router, prefix="/api/v1/decks", tags=["decks"])
+    app.include_router(cards.router, prefix="/api/v1/cards", tags=["cards"])
+    app.include_router(sessions.router, prefix="/api/v1/sessions", tags=["sessions"])
+    return app
+
+
+# For `uvicorn main:app` (development); production: python serve.py
+app = create_app()
 
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
-        "main:app",
+        "main:create_app",
+        factory=True,
         host="0.0.0.0",
         port=int(os.getenv("PORT", "3001")),
         reload=True
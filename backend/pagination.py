@@ -0,0 +1,69 @@
+"""
+Keyset pagination and field projection for list endpoints.
+
+A page is fetched with `WHERE (sort keys) > (cursor) ORDER BY sort keys
+LIMIT n + 1` on an index that matches the order, so every page costs the
+same however deep the client has scrolled. The cursor is the sort key of
+the last row, opaque to clients (urlsafe base64 of a JSON array). The next
+cursor goes into the X-Next-Cursor response header, so list bodies stay
+plain arrays; no header means the last page.
+"""
+import base64
+import binascii
+import os
+import uuid
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException
+
+DECK_PAGE_SIZE = int(os.getenv("DECK_PAGE_SIZE", "50"))
+CARD_PAGE_SIZE = int(os.getenv("CARD_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence) -> str:
+    payload = orjson.dumps(list(values))
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kinds: Sequence[type]) -> list:
+    """Cursor values converted to `kinds` (int, datetime, uuid.UUID, or None to keep as is)."""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            raise ValueError("wrong cursor length")
+        out = []
+        for value, kind in zip(values, kinds):
+            if value is None or kind is None:
+                out.append(value)
+            elif kind is datetime:
+                out.append(datetime.fromisoformat(value))
+            elif kind is uuid.UUID:
+                out.append(uuid.UUID(value))
+            else:
+                out.append(kind(value))
+        return out
+    except (ValueError, TypeError, binascii.Error, orjson.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str], required: Sequence[str] = ("id",)) -> Optional[List[str]]:
+    """`fields=title,image_url` -> column list (always including `required`); None means all columns."""
+    if not fields:
+        return None
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    columns = list(required)
+    for name in requested:
+        if name not in columns:
+            columns.append(name)
+    return columns
+
+
+def page_size(limit: Optional[int], default: int) -> int:
+    return max(1, min(limit or default, MAX_PAGE_SIZE))
@@ -0,0 +1,101 @@
+"""
+Bradley–Terry ratings of a deck's cards from duel outcomes, in NumPy.
+
+A duel is stored as two consecutive votes of one session with the same
+round (winner smash, loser pass; see resolve_duel). The ranking job
+(jobs/fit_ratings.py) streams those pairs in chunks into `DuelCounts`,
+which keeps only the sufficient statistics of the model: wins per card and
+games per (unordered) card pair. Memory is O(cards + distinct pairs), no
+matter how many votes the deck has.
+
+`fit()` runs the MM iteration of Hunter (2004), vectorized over the pair
+arrays, with a small prior (`PRIOR_GAMES` draws against an average card)
+so unbeaten and winless cards get finite ratings. Strengths are reported
+on the Elo scale: 1500 is average, +400 means 10:1 odds.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+BASE_RATING = 1500.0
+ELO_SCALE = 400.0
+PRIOR_GAMES = 1.0
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-6
+# Pending pair keys are merged once this many have been buffered
+COMPACT_EVERY = 1_000_000
+
+
+class DuelCounts:
+    """Wins per card and games per card pair, accumulated chunk by chunk."""
+
+    def __init__(self, card_ids: List):
+        self.card_ids = list(card_ids)
+        self.size = len(self.card_ids)
+        self.wins = np.zeros(self.size, dtype=np.float64)
+        self.games = np.zeros(self.size, dtype=np.int64)
+        self.duels = 0
+        self._pair_keys = np.empty(0, dtype=np.int64)
+        self._pair_counts = np.empty(0, dtype=np.int64)
+        self._pending: List[np.ndarray] = []
+        self._pending_size = 0
+
+    def add(self, winners: np.ndarray, losers: np.ndarray):
+        """Adds duels given as arrays of positions in `card_ids`."""
+        if len(winners) == 0:
+            return
+        won = np.bincount(winners, minlength=self.size)
+        self.duels += len(winners)
+        self.wins += won
+        self.games += won + np.bincount(losers, minlength=self.size)
+        low = np.minimum(winners, losers).astype(np.int64)
+        high = np.maximum(winners, losers).astype(np.int64)
+        self._pending.append(low * self.size + high)
+        self._pending_size += len(low)
+        if self._pending_size >= COMPACT_EVERY:
+            self._compact()
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(i, j, games between i and j) for every pair that met, i < j."""
+        self._compact()
+        return self._pair_keys // self.size, self._pair_keys % self.size, self._pair_counts
+
+    def _compact(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self._pair_keys] + self._pending)
+        counts = np.concatenate([self._pair_counts] + [np.ones(len(p), dtype=np.int64) for p in self._pending])
+        self._pair_keys, inverse = np.unique(keys, return_inverse=True)
+        self._pair_counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(self._pair_keys)).astype(np.int64)
+        self._pending = []
+        self._pending_size = 0
+
+
+def fit(counts: DuelCounts, max_iterations: int = MAX_ITERATIONS, tolerance: float = TOLERANCE) -> Tuple[np.ndarray, int]:
+    """Bradley–Terry strengths on the Elo scale and the number of iterations used."""
+    size = counts.size
+    if size == 0:
+        return np.empty(0), 0
+    first, second, games = counts.pairs()
+    games = games.astype(np.float64)
+    # The prior: PRIOR_GAMES games against a card of strength 1, half of them won
+    wins = counts.wins + PRIOR_GAMES / 2
+    strength = np.ones(size)
+
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        per_game = games / (strength[first] + strength[second])
+        denominator = (
+            np.bincount(first, weights=per_game, minlength=size)
+            + np.bincount(second, weights=per_game, minlength=size)
+            + PRIOR_GAMES / (strength + 1.0)
+        )
+        updated = wins / denominator
+        # Only ratios matter: keep the geometric mean at 1
+        updated /= np.exp(np.mean(np.log(updated)))
+        change = np.max(np.abs(np.log(updated) - np.log(strength)))
+        strength = updated
+        if change < tolerance:
+            break
+
+    return BASE_RATING + ELO_SCALE * np.log10(strength), iteration
@@ -0,0 +1,218 @@
+"""
+Read replica: a second asyncpg pool for read-only endpoints.
+
+Set DB_REPLICA_HOST (and DB_REPLICA_PORT if it differs) to enable it; user,
+password and database are the primary's. Routes opt in with the
+`get_read_db` / `get_session_read_db` dependencies; writes always go
+through the primary pool.
+
+A monitor checks the replica every DB_REPLICA_CHECK_INTERVAL seconds. The
+replica is used only while its last check succeeded and its replay lag is
+at most DB_REPLICA_MAX_LAG seconds (a standby whose WAL receiver is not
+streaming counts as unhealthy). Otherwise reads fall back to the primary
+until a later check passes. If the replica cannot be reached at startup,
+reads stay on the primary and the monitor keeps trying to connect.
+
+Read-your-writes: every session write marks the session in Redis (or in
+process, without Redis) for READ_YOUR_WRITES_WINDOW seconds, and the
+session's reads go to the primary during that time; card and deck writes
+mark the card and the deck the same way for the card and deck reads. The
+window must be longer than DB_REPLICA_MAX_LAG.
+
+The card cache (card_cache.py) and the session cache (session_cache.py)
+are filled only from the primary: a lagging replica would put back a row a
+write has just invalidated. Replica reads use cached entries but do not add
+to the caches (see `is_replica()`).
+
+Local setup with two Postgres instances: make up-replica (streaming
+standby from docker-compose's `replica` profile).
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Iterable
+
+import database
+
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", "")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "1.0"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "2.0"))
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", "1.0"))
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5.0"))
+
+# Lag 0 when everything received is replayed: an idle primary writes no WAL,
+# so the last replay timestamp alone would look like a growing lag
+HEALTH_SQL = """
+SELECT pg_is_in_recovery() AS in_recovery,
+       EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') AS streaming,
+       CASE
+           WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+           ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END::float8 AS lag
+"""
+
+
+def _written_key(kind: str, object_id) -> str:
+    return f"pickme:rw:{kind}:{object_id}"
+
+
+def connect_kwargs() -> dict:
+    settings = database.connect_kwargs()
+    settings["host"] = DB_REPLICA_HOST
+    if DB_REPLICA_PORT:
+        settings["port"] = int(DB_REPLICA_PORT)
+    return settings
+
+
+class Replica:
+    def __init__(self):
+        self.pool = None
+        self.healthy = False
+        self.lag = None
+        self.last_error = None
+        self.checks = 0
+        self.check_failures = 0
+        self.reads_replica = 0
+        self.reads_primary = 0
+        self.read_your_writes = 0
+        self._task = None
+        self._prepared_queries = []
+        # session_id -> monotonic deadline, when Redis is not available
+        self._written: Dict[str, float] = {}
+
+    @property
+    def configured(self) -> bool:
+        return bool(DB_REPLICA_HOST)
+
+    async def start(self, prepared_queries: Iterable[str] = ()):
+        if not self.configured:
+            return
+        self._prepared_queries = list(prepared_queries)
+        if await self._connect():
+            await self.check()
+        self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        self.healthy = False
+
+    async def check(self):
+        self.checks += 1
+        try:
+            async with self.pool.acquire(timeout=DB_REPLICA_CHECK_TIMEOUT) as conn:
+                row = await conn.fetchrow(HEALTH_SQL, timeout=DB_REPLICA_CHECK_TIMEOUT)
+        except Exception as e:
+            self.check_failures += 1
+            self._set_health(False, None, str(e) or type(e).__name__)
+            return
+        if row["in_recovery"] and not row["streaming"]:
+            self._set_health(False, row["lag"], "WAL receiver is not streaming")
+        elif row["lag"] > DB_REPLICA_MAX_LAG:
+            self._set_health(False, row["lag"], f"replay lag {row['lag']:.1f}s")
+        else:
+            self._set_health(True, row["lag"], None)
+
+    def pool_for_read(self, primary):
+        if self.pool is not None and self.healthy:
+            self.reads_replica += 1
+            return self.pool
+        self.reads_primary += 1
+        return primary
+
+    def is_replica(self, pool) -> bool:
+        """True for the pool pool_for_read() hands out when it picks the replica."""
+        return pool is not None and pool is self.pool
+
+    async def pool_for_session(self, primary, redis_client, session_id):
+        """Like pool_for_read, but the primary while the session was written recently."""
+        return await self.pool_for_written(primary, redis_client, session_id, "session")
+
+    async def pool_for_written(self, primary, redis_client, object_id, kind: str):
+        """Like pool_for_read, but the primary while the object (session, deck, card) was written recently."""
+        if self.pool is not None and self.healthy and await self.recently_written(redis_client, object_id, kind):
+            self.read_your_writes += 1
+            self.reads_primary += 1
+            return primary
+        return self.pool_for_read(primary)
+
+    async def mark_written(self, redis_client, object_id, kind: str = "session"):
+        # Marked whenever a replica is configured: other workers may be reading from it
+        if not self.configured or not object_id:
+            return
+        if redis_client is not None:
+            try:
+                await redis_client.set(_written_key(kind, object_id), 1, px=int(READ_YOUR_WRITES_WINDOW * 1000))
+                return
+            except Exception as e:
+                print(f"Read-your-writes mark in Redis failed (kept in process): {e}")
+        now = time.monotonic()
+        if len(self._written) > 10_000:
+            self._written = {key: deadline for key, deadline in self._written.items() if deadline > now}
+        self._written[f"{kind}:{object_id}"] = now + READ_YOUR_WRITES_WINDOW
+
+    async def recently_written(self, redis_client, object_id, kind: str = "session") -> bool:
+        deadline = self._written.get(f"{kind}:{object_id}")
+        if deadline is not None and deadline > time.monotonic():
+            return True
+        if redis_client is None:
+            return False
+        try:
+            return bool(await redis_client.exists(_written_key(kind, object_id)))
+        except Exception:
+            # Unknown: the primary is always correct
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "connected": self.pool is not None,
+            "healthy": self.healthy,
+            "lag_s": round(self.lag, 3) if self.lag is not None else None,
+            "last_error": self.last_error,
+            "checks": self.checks,
+            "check_failures": self.check_failures,
+            "reads_replica": self.reads_replica,
+            "reads_primary": self.reads_primary,
+            "read_your_writes": self.read_your_writes,
+            "pool": database.stats(self.pool) if self.pool is not None else None,
+        }
+
+    def _set_health(self, healthy: bool, lag, error):
+        if healthy != self.healthy:
+            print(f"Read replica {'healthy' if healthy else 'unhealthy'}{f': {error}' if error else ''}")
+        self.healthy = healthy
+        self.lag = lag
+        self.last_error = error
+
+    async def _connect(self) -> bool:
+        try:
+            self.pool = await database.create_pool(self._prepared_queries, connect=connect_kwargs())
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if error != self.last_error:
+                print(f"Read replica unavailable (reads go to the primary): {error}")
+            self.last_error = error
+            self.pool = None
+            return False
+        return True
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
+            # Not reachable at startup: keep trying to connect
+            if self.pool is None and not await self._connect():
+                continue
+            await self.check()
+
+
+replica = Replica()
@@ -1,12 +1,68 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query, Header
 import asyncpg
 import uuid
 import json
+import os
+import csv
+import codecs
+import time
+from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
+
+import admission
+import card_cache
+import http_cache
+import pagination
+import replica
+import session_cache
+import shards
+from dependencies import get_db, get_redis
+from serialization import FastJSONResponse
 
 router = APIRouter()
 
+# Потоковый импорт: сколько строк копировать в БД за раз и ограничения на память
+CARD_IMPORT_BATCH_SIZE = int(os.getenv("CARD_IMPORT_BATCH_SIZE", "1000"))
+MAX_IMPORT_LINE_LENGTH = 1024 * 1024
+MAX_REPORTED_IMPORT_ERRORS = 100
+CARD_COPY_COLUMNS = ["id", "deck_id", "title", "description", "image_url", "metadata", "position"]
+CARD_FIELDS = CARD_COPY_COLUMNS + ["created_at", "updated_at"]
+
+# Порядок карточек в колоде; NULL-позиции идут в конец, как при ORDER BY position ASC.
+# Совпадает с индексом idx_cards_deck_order, поэтому страница — index-only scan
+CARD_ORDER_KEY = "COALESCE(position, 2147483647)"
+
+
+def card_page_sql(columns: List[str], after: bool) -> str:
+    """
+    Страница карточек колоды: `columns` и ключи сортировки для курсора.
+    Имена колонок только из CARD_FIELDS
+    """
+    select = columns + [f"{CARD_ORDER_KEY} AS sort_position"]
+    if "created_at" not in columns:
+        select.append("created_at")
+    where = "deck_id = $1"
+    limit = "$2"
+    if after:
+        where += f" AND ({CARD_ORDER_KEY}, created_at, id) > ($2, $3, $4)"
+        limit = "$5"
+    return f"""
+SELECT {', '.join(select)} FROM cards
+WHERE {where}
+ORDER BY {CARD_ORDER_KEY}, created_at, id
+LIMIT {limit}
+"""
+
+
+# Горячие запросы (готовятся в init пула, см. database.init_connection):
+# страница ключей — первая и по курсору, версия карточек колоды
+CARD_PAGE_SQL = card_page_sql(["id"], after=False)
+CARD_PAGE_AFTER_SQL = card_page_sql(["id"], after=True)
+DECK_CARDS_VERSION_SQL = "SELECT cards_version FROM decks WHERE id = $1"
+
+PREPARED_QUERIES = [CARD_PAGE_SQL, CARD_PAGE_AFTER_SQL, DECK_CARDS_VERSION_SQL, card_cache.CARDS_BY_ID_SQL]
+
 
 class CardCreate(BaseModel):
     deck_id: str
@@ -29,51 +85,188 @@ class CardBulkCreate(BaseModel):
     cards: List[CardCreate]
 
 
-async def get_db():
-    from main import db_pool
-    if db_pool is None:
-        raise HTTPException(status_code=500, detail="Database not available")
-    return db_pool
+class CardImportRow(BaseModel):
+    # Ограничения колонок cards: одна битая строка не должна ронять весь COPY
+    title: str = Field(min_length=1, max_length=255)
+    description: Optional[str] = None
+    image_url: Optional[str] = Field(None, max_length=500)
+    metadata: dict = {}
+    position: Optional[int] = None
 
 
-@router.get("/deck/{deck_id}")
-async def get_cards(deck_id: str, db=Depends(get_db)):
+async def get_deck_read_db(deck_id: str, db=Depends(get_db), redis_client=Depends(get_redis)):
+    """
+    Пул для чтения карточек колоды: реплика, если она здорова и колоду не меняли
+    последние READ_YOUR_WRITES_WINDOW секунд, иначе основной (replica.py)
+    """
+    return await replica.replica.pool_for_written(db, redis_client, deck_id, "deck")
+
+
+async def get_card_read_db(card_id: str, db=Depends(get_db), redis_client=Depends(get_redis)):
+    """То же для одной карточки"""
+    return await replica.replica.pool_for_written(db, redis_client, card_id, "card")
+
+
+async def mark_cards_written(redis_client, deck_ids=(), card_ids=()):
+    """Чтения этих колод и карточек идут на основную БД, пока реплика не догонит запись"""
+    for deck_id in deck_ids:
+        await replica.replica.mark_written(redis_client, deck_id, "deck")
+    for card_id in card_ids:
+        await replica.replica.mark_written(redis_client, card_id, "card")
+
+
+def throughput(count: int, started: float) -> dict:
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "rows_per_second": round(count / elapsed) if elapsed > 0 else count,
+    }
+
+
+async def iter_body_lines(request: Request):
+    """Строки тела запроса по мере поступления, без чтения всего тела в память"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        if len(buffer) > MAX_IMPORT_LINE_LENGTH:
+            raise HTTPException(status_code=413, detail="Import line is too long")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_import_rows(request: Request, fmt: str):
+    """
+    Разбирает NDJSON (объект на строку) или CSV (первая строка — заголовок)
+    и отдает (номер строки, dict с полями карточки или None, ошибка или None)
+    """
+    line_no = 0
+    if fmt == "ndjson":
+        async for line in iter_body_lines(request):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line), None
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+        return
+
+    header = None
+    record = ""
+    async for line in iter_body_lines(request):
+        line_no += 1
+        record = f"{record}\n{line}" if record else line
+        # Поле в кавычках продолжается на следующей строке
+        if record.count('"') % 2:
+            if len(record) > MAX_IMPORT_LINE_LENGTH:
+                raise HTTPException(status_code=413, detail="Import line is too long")
+            continue
+        values, record = next(csv.reader([record])), ""
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if not any(values):
+            continue
+        row = {name: value for name, value in zip(header, values) if value != ""}
+        try:
+            if "metadata" in row:
+                row["metadata"] = json.loads(row["metadata"])
+        except ValueError as e:
+            yield line_no, None, f"Invalid metadata JSON: {e}"
+            continue
+        yield line_no, row, None
+
+
+async def copy_cards(db, records) -> int:
+    # Соединение берем только на время COPY, а не на всю загрузку
     async with db.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT * FROM cards WHERE deck_id = $1 ORDER BY position ASC, created_at ASC",
-            deck_id
+        await conn.copy_records_to_table("cards", records=records, columns=CARD_COPY_COLUMNS)
+    return len(records)
+
+
+# Списки и импорт уступают соединения решениям свайпа (admission.py)
+@router.get("/deck/{deck_id}", dependencies=[Depends(admission.low_priority)])
+async def get_cards(
+    deck_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Колонки через запятую, например id,title,image_url"),
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_deck_read_db),
+):
+    """
+    Карточки колоды по порядку (position, created_at), постранично.
+    Следующая страница — по курсору из заголовка X-Next-Cursor.
+    fields= выбирает только эти колонки прямо в SQL.
+    """
+    size = pagination.page_size(limit, pagination.CARD_PAGE_SIZE)
+    columns = pagination.parse_fields(fields, CARD_FIELDS)
+    try:
+        deck_uuid = uuid.UUID(deck_id)
+    except ValueError:
+        return FastJSONResponse([])
+
+    if columns:
+        query = card_page_sql(columns, after=bool(cursor))
+    else:
+        query = CARD_PAGE_AFTER_SQL if cursor else CARD_PAGE_SQL
+    values = [deck_uuid]
+    if cursor:
+        values.extend(pagination.decode_cursor(cursor, [int, datetime, uuid.UUID]))
+    values.append(size + 1)
+
+    async with db.acquire() as conn:
+        # Версия карточек колоды: если у клиента она уже есть — 304 без запроса страницы
+        version = await conn.fetchval(DECK_CARDS_VERSION_SQL, deck_uuid)
+        if version is None:
+            return FastJSONResponse([])
+        etag = http_cache.make_etag("cards", deck_uuid, version, cursor, size, fields)
+        cached = http_cache.not_modified(if_none_match, etag, http_cache.CARDS_CACHE_CONTROL)
+        if cached:
+            return cached
+
+        # С fields= нужные колонки приходят сразу; иначе сначала ключи страницы,
+        # а тела карточек — из кэша
+        rows = await conn.fetch(query, *values)
+        page = rows[:size]
+        if columns:
+            cards = [{name: row[name] for name in columns} for row in page]
+        else:
+            # С реплики кэш только читается: отстающая реплика не должна вернуть в него старые карточки
+            cards = await card_cache.get_cards(
+                conn, [row["id"] for row in page], fill=not replica.replica.is_replica(db)
+            )
+
+    headers = http_cache.cache_headers(etag, http_cache.CARDS_CACHE_CONTROL)
+    if len(rows) > size:
+        last = page[-1]
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor(
+            [last["sort_position"], last["created_at"], last["id"]]
         )
-        result = []
-        for row in rows:
-            card = {k: v for k, v in row.items()}
-            # Parse metadata if it's a string
-            if isinstance(card.get("metadata"), str):
-                try:
-                    card["metadata"] = json.loads(card["metadata"])
-                except:
-                    card["metadata"] = {}
-            result.append(card)
-        return result
+    return FastJSONResponse(cards, headers=headers)
 
 
 @router.get("/{card_id}")
-async def get_card(card_id: str, db=Depends(get_db)):
+async def get_card(card_id: str, if_none_match: Optional[str] = Header(None), db=Depends(get_card_read_db)):
     async with db.acquire() as conn:
-        row = await conn.fetchrow("SELECT * FROM cards WHERE id = $1", card_id)
-        if not row:
+        card = await card_cache.get_card(conn, card_id, fill=not replica.replica.is_replica(db))
+        if not card:
             raise HTTPException(status_code=404, detail="Card not found")
-        card = {k: v for k, v in row.items()}
-        # Parse metadata if it's a string
-        if isinstance(card.get("metadata"), str):
-            try:
-                card["metadata"] = json.loads(card["metadata"])
-            except:
-                card["metadata"] = {}
-        return card
+
+    etag = http_cache.make_etag("card", card["id"], card["updated_at"])
+    cached = http_cache.not_modified(if_none_match, etag, http_cache.CARDS_CACHE_CONTROL)
+    if cached:
+        return cached
+    return FastJSONResponse(card, headers=http_cache.cache_headers(etag, http_cache.CARDS_CACHE_CONTROL))
 
 
 @router.post("/")
-async def create_card(card: CardCreate, db=Depends(get_db)):
+async def create_card(card: CardCreate, db=Depends(get_db), redis_client=Depends(get_redis)):
     if not card.deck_id or not card.title:
         raise HTTPException(status_code=400, detail="deck_id and title are required")
     
@@ -81,46 +274,148 @@ async def create_card(card: CardCreate, db=Depends(get_db)):
     async with db.acquire() as conn:
         row = await conn.fetchrow(
             "INSERT INTO cards (id, deck_id, title, description, image_url, metadata, position) VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING *",
-            card_id, card.deck_id, card.title, card.description, card.image_url, json.dumps(card.metadata), card.position
+            card_id, card.deck_id, card.title, card.description, card.image_url, card.metadata, card.position
         )
-        result = {k: v for k, v in row.items()}
-        if isinstance(result.get("metadata"), str):
-            try:
-                result["metadata"] = json.loads(result["metadata"])
-            except:
-                result["metadata"] = {}
-        return result
-
-
-@router.post("/deck/{deck_id}/bulk")
-async def create_cards_bulk(deck_id: str, bulk: CardBulkCreate, db=Depends(get_db)):
+        result = dict(row)
+    await card_cache.invalidate(redis_client, deck_ids=[card.deck_id])
+    await mark_cards_written(redis_client, deck_ids=[card.deck_id], card_ids=[card_id])
+    # Копии колоды на узлах сессий (shards.py) — уже без соединения записи
+    await shards.router.sync_decks([card.deck_id])
+    return result
+
+
+@router.post("/deck/{deck_id}/bulk", dependencies=[Depends(admission.low_priority)])
+async def create_cards_bulk(
+    deck_id: str,
+    bulk: CardBulkCreate,
+    response: Response,
+    db=Depends(get_db),
+    redis_client=Depends(get_redis),
+):
     if not isinstance(bulk.cards, list):
         raise HTTPException(status_code=400, detail="cards must be an array")
     
-    inserted_cards = []
+    cards = [card for card in bulk.cards if card.title]
+    started = time.perf_counter()
+
+    # Одна вставка на весь пакет: массивы колонок разворачиваются через unnest
     async with db.acquire() as conn:
-        for card in bulk.cards:
-            if not card.title:
-                continue
-            
-            card_id = str(uuid.uuid4())
-            row = await conn.fetchrow(
-                "INSERT INTO cards (id, deck_id, title, description, image_url, metadata, position) VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING *",
-                card_id, deck_id, card.title, card.description, card.image_url, json.dumps(card.metadata), card.position
-            )
-            result = {k: v for k, v in row.items()}
-            if isinstance(result.get("metadata"), str):
-                try:
-                    result["metadata"] = json.loads(result["metadata"])
-                except:
-                    result["metadata"] = {}
-            inserted_cards.append(result)
-    
+        rows = await conn.fetch(
+            """
+            INSERT INTO cards (id, deck_id, title, description, image_url, metadata, position)
+            SELECT t.id, $1, t.title, t.description, t.image_url, t.metadata, t.position
+            FROM unnest($2::uuid[], $3::text[], $4::text[], $5::text[], $6::jsonb[], $7::int[])
+                AS t(id, title, description, image_url, metadata, position)
+            RETURNING *
+            """,
+            deck_id,
+            [uuid.uuid4() for _ in cards],
+            [card.title for card in cards],
+            [card.description for card in cards],
+            [card.image_url for card in cards],
+            [card.metadata for card in cards],
+            [card.position for card in cards],
+        )
+    inserted_cards = [dict(row) for row in rows]
+
+    await card_cache.invalidate(redis_client, deck_ids=[deck_id])
+    await mark_cards_written(redis_client, deck_ids=[deck_id])
+    await shards.router.sync_decks([deck_id])
+    stats = throughput(len(inserted_cards), started)
+    response.headers["X-Inserted-Count"] = str(len(inserted_cards))
+    response.headers["X-Insert-Elapsed-Ms"] = str(stats["elapsed_ms"])
+    response.headers["X-Insert-Rows-Per-Second"] = str(stats["rows_per_second"])
     return inserted_cards
 
 
+@router.post("/deck/{deck_id}/import", dependencies=[Depends(admission.low_priority)])
+async def import_cards(
+    deck_id: str,
+    request: Request,
+    format: Optional[str] = None,
+    db=Depends(get_db),
+    redis_client=Depends(get_redis),
+):
+    """
+    Потоковый импорт карточек из тела запроса: NDJSON (application/x-ndjson)
+    или CSV (text/csv, колонки title, description, image_url, metadata, position).
+    Строки разбираются по мере чтения и пишутся через COPY пачками
+    по CARD_IMPORT_BATCH_SIZE, так что память не зависит от размера файла.
+    Невалидные строки пропускаются и попадают в errors.
+    Каждая пачка фиксируется сразу: если импорт оборвался после первых пачек
+    (413, обрыв клиента, ошибка COPY), ответ с кодом ошибки несет тот же отчет
+    с partial: true и error — вставленные строки остаются в колоде.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    try:
+        deck_uuid = uuid.UUID(deck_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Deck not found")
+    async with db.acquire() as conn:
+        if not await conn.fetchval("SELECT 1 FROM decks WHERE id = $1", deck_uuid):
+            raise HTTPException(status_code=404, detail="Deck not found")
+
+    started = time.perf_counter()
+    inserted = 0
+    rejected = 0
+    errors = []
+    batch = []
+
+    failure = None
+
+    try:
+        async for line_no, data, error in iter_import_rows(request, fmt):
+            if error is None and not isinstance(data, dict):
+                error = "Row must be an object"
+            elif error is None:
+                try:
+                    card = CardImportRow(**data)
+                except ValidationError as e:
+                    error = f"{'.'.join(str(part) for part in e.errors()[0]['loc'])}: {e.errors()[0]['msg']}"
+            if error is not None:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+                    errors.append({"line": line_no, "error": error})
+                continue
+
+            batch.append((
+                uuid.uuid4(), deck_uuid, card.title, card.description,
+                card.image_url, card.metadata, card.position
+            ))
+            if len(batch) >= CARD_IMPORT_BATCH_SIZE:
+                inserted += await copy_cards(db, batch)
+                batch = []
+
+        if batch:
+            inserted += await copy_cards(db, batch)
+    except Exception as e:
+        # Ничего не вставлено — обычная ошибка; иначе отчет о том, что уже в колоде
+        if not inserted:
+            raise
+        failure = e
+    finally:
+        # Вставленные пачки уже зафиксированы: кэши, реплика и шарды должны их увидеть
+        if inserted:
+            await card_cache.invalidate(redis_client, deck_ids=[deck_id])
+            await mark_cards_written(redis_client, deck_ids=[deck_id])
+            await shards.router.sync_decks([deck_id])
+
+    result = {"inserted": inserted, "rejected": rejected, "errors": errors, **throughput(inserted, started)}
+    if failure is not None:
+        if isinstance(failure, HTTPException):
+            status_code, detail = failure.status_code, failure.detail
+        else:
+            print(f"Card import into deck {deck_id} failed after {inserted} rows: {failure}")
+            status_code, detail = 500, "Import failed"
+        return FastJSONResponse({**result, "partial": True, "error": detail}, status_code=status_code)
+    return result
+
+
 @router.put("/{card_id}")
-async def update_card(card_id: str, card: CardUpdate, db=Depends(get_db)):
+async def update_card(card_id: str, card: CardUpdate, db=Depends(get_db), redis_client=Depends(get_redis)):
     async with db.acquire() as conn:
         existing = await conn.fetchrow("SELECT * FROM cards WHERE id = $1", card_id)
         if not existing:
@@ -147,7 +442,7 @@ async def update_card(card_id: str, card: CardUpdate, db=Depends(get_db)):
         
         if card.metadata is not None:
             updates.append(f"metadata = ${param_count}")
-            values.append(json.dumps(card.metadata))
+            values.append(card.metadata)
             param_count += 1
 
         if card.position is not None:
@@ -166,22 +461,26 @@ async def update_card(card_id: str, card: CardUpdate, db=Depends(get_db)):
 
         row = await conn.fetchrow(query, *values)
 
-        result = dict(row)
-        if isinstance(result.get("metadata"), str):
-            try:
-                result["metadata"] = json.loads(result["metadata"])
-            except:
-                result["metadata"] = {}
-
-        return result
+    result = dict(row)
+    await card_cache.invalidate(redis_client, card_ids=[result["id"]], deck_ids=[result["deck_id"]])
+    await mark_cards_written(redis_client, deck_ids=[result["deck_id"]], card_ids=[result["id"]])
+    await shards.router.sync_decks([result["deck_id"]])
+    return result
 
 
 
 @router.delete("/{card_id}")
-async def delete_card(card_id: str, db=Depends(get_db)):
+async def delete_card(card_id: str, db=Depends(get_db), redis_client=Depends(get_redis)):
     async with db.acquire() as conn:
         row = await conn.fetchrow("DELETE FROM cards WHERE id = $1 RETURNING *", card_id)
         if not row:
             raise HTTPException(status_code=404, detail="Card not found")
-        return {"message": "Card deleted successfully"}
+    await card_cache.invalidate(redis_client, card_ids=[row["id"]], deck_ids=[row["deck_id"]])
+    await mark_cards_written(redis_client, deck_ids=[row["deck_id"]], card_ids=[row["id"]])
+    await shards.router.sync_decks([row["deck_id"]])
+    # Строки session_cards удалились каскадом (на шардах — при синхронизации выше),
+    # а закэшированные сессии колоды еще держат карточку в своих списках
+    session_rows = await shards.router.gather("SELECT id FROM sessions WHERE deck_id = $1", row["deck_id"])
+    await session_cache.invalidate_many(redis_client, [session_row["id"] for _, session_row in session_rows])
+    return {"message": "Card deleted successfully"}
 
@@ -1,11 +1,68 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Header
 import asyncpg
 import uuid
+from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel
 
+import admission
+import card_cache
+import http_cache
+import pagination
+import replica
+import session_cache
+import shards
+from dependencies import get_db, get_redis
+from serialization import FastJSONResponse
+
 router = APIRouter()
 
+DECK_FIELDS = [
+    "id", "user_id", "title", "description", "privacy",
+    "card_count", "cover_image_url", "created_at", "updated_at",
+]
+
+
+LEADERBOARD_SORTS = ["win_rate", "rating", "smash_rate", "duel_wins", "seen"]
+
+LEADERBOARD_SQL = """
+SELECT c.id AS card_id, c.title, c.image_url,
+    COALESCE(s.seen, 0) AS seen,
+    COALESCE(s.smashes, 0) AS smashes,
+    COALESCE(s.passes, 0) AS passes,
+    COALESCE(s.duel_wins, 0) AS duel_wins,
+    COALESCE(s.duel_losses, 0) AS duel_losses,
+    s.last_vote_at,
+    r.rating
+FROM cards c
+LEFT JOIN card_vote_stats s ON s.card_id = c.id
+LEFT JOIN card_ratings r ON r.card_id = c.id
+WHERE c.deck_id = $1
+"""
+
+# С шардами сессий (shards.py) голоса и их счетчики лежат на узлах сессий:
+# лидерборд складывает счетчики всех узлов, сводка берет самую новую активную сессию
+NODE_DECK_STATS_SQL = """
+SELECT votes, smashes, passes, duels, last_vote_at, version FROM deck_vote_stats WHERE deck_id = $1
+"""
+NODE_CARD_STATS_SQL = """
+SELECT card_id, seen, smashes, passes, duel_wins, duel_losses, last_vote_at
+FROM card_vote_stats WHERE deck_id = $1
+"""
+NODE_ACTIVE_SESSIONS_SQL = """
+SELECT DISTINCT ON (s.deck_id) s.deck_id, s.id, s.mode, s.created_at,
+    (SELECT count(*) FROM session_cards sc WHERE sc.session_id = s.id AND sc.state = 'remaining') AS remaining_count,
+    (SELECT count(*) FROM session_cards sc WHERE sc.session_id = s.id AND sc.smashed_position IS NOT NULL) AS smashed_count
+FROM sessions s
+WHERE s.deck_id = ANY($1::uuid[]) AND s.status != 'finished'
+ORDER BY s.deck_id, s.created_at DESC
+"""
+
+
+def rate(hits: int, misses: int) -> Optional[float]:
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
 
 class DeckCreate(BaseModel):
     title: str
@@ -18,38 +75,232 @@ class DeckUpdate(BaseModel):
     description: Optional[str] = None
 
 
-async def get_db():
-    from main import db_pool
-    if db_pool is None:
-        raise HTTPException(status_code=500, detail="Database not available")
-    return db_pool
+async def get_read_db(db=Depends(get_db)):
+    """Пул для чтения: реплика, если она здорова, иначе основной (replica.py)"""
+    return replica.replica.pool_for_read(db)
+
+
+async def get_deck_read_db(deck_id: str, db=Depends(get_db), redis_client=Depends(get_redis)):
+    """Как get_read_db, но основной пул, пока реплика может не знать о недавней правке колоды"""
+    return await replica.replica.pool_for_written(db, redis_client, deck_id, "deck")
+
 
+async def active_sessions_on_nodes(deck_ids) -> dict:
+    """deck_id -> самая новая активная сессия среди всех узлов"""
+    latest = {}
+    for _, row in await shards.router.gather(NODE_ACTIVE_SESSIONS_SQL, list(deck_ids)):
+        current = latest.get(row["deck_id"])
+        if current is None or row["created_at"] > current["created_at"]:
+            latest[row["deck_id"]] = row
+    return latest
+
+
+async def add_node_vote_stats(deck_id, deck: dict, rows: list):
+    """Добавляет к счетчикам каталога счетчики узлов шардов (на месте)"""
+    versions = [deck["version"] or 0]
+    for _, stats in await shards.router.gather(NODE_DECK_STATS_SQL, deck_id, include_main=False):
+        for name in ("votes", "smashes", "passes", "duels"):
+            deck[name] = (deck[name] or 0) + stats[name]
+        if stats["last_vote_at"] and (deck["last_vote_at"] is None or stats["last_vote_at"] > deck["last_vote_at"]):
+            deck["last_vote_at"] = stats["last_vote_at"]
+        versions.append(stats["version"])
+    # ETag меняется при изменении на любом узле
+    deck["version"] = ".".join(str(version) for version in versions)
+
+    by_card = {row["card_id"]: row for row in rows}
+    for _, stats in await shards.router.gather(NODE_CARD_STATS_SQL, deck_id, include_main=False):
+        card = by_card.get(stats["card_id"])
+        if card is None:
+            continue
+        for name in ("seen", "smashes", "passes", "duel_wins", "duel_losses"):
+            card[name] += stats[name]
+        if stats["last_vote_at"] and (card["last_vote_at"] is None or stats["last_vote_at"] > card["last_vote_at"]):
+            card["last_vote_at"] = stats["last_vote_at"]
+
+
+async def fetch_deck_page(db, source: str, columns, user_id, cursor, size):
+    """Одна keyset-страница колод из decks или deck_summary_view: (строки, заголовки)"""
+    # Ключи сортировки нужны для курсора, даже если их не просили
+    select = columns + [name for name in ("created_at",) if name not in columns]
+
+    conditions = []
+    values = []
+    param_count = 1
+
+    if user_id:
+        conditions.append(f"user_id = ${param_count}")
+        values.append(user_id)
+        param_count += 1
+
+    if cursor:
+        created_at, last_id = pagination.decode_cursor(cursor, [datetime, uuid.UUID])
+        conditions.append(f"(created_at, id) < (${param_count}, ${param_count + 1})")
+        values.extend([created_at, last_id])
+        param_count += 2
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    values.append(size + 1)
+    query = f"SELECT {', '.join(select)} FROM {source} {where} ORDER BY created_at DESC, id DESC LIMIT ${param_count}"
 
-@router.get("/")
-async def get_decks(user_id: Optional[str] = None, db=Depends(get_db)):
     async with db.acquire() as conn:
-        if user_id:
-            rows = await conn.fetch(
-                "SELECT * FROM decks WHERE user_id = $1 ORDER BY created_at DESC",
-                user_id
-            )
-        else:
-            rows = await conn.fetch(
-                "SELECT * FROM decks ORDER BY created_at DESC"
-            )
-        result = []
-        for row in rows:
-            result.append({k: v for k, v in row.items()})
-        return result
+        rows = await conn.fetch(query, *values)
+
+    page = rows[:size]
+    headers = {}
+    if len(rows) > size:
+        headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_cursor([page[-1]["created_at"], page[-1]["id"]])
+    return page, headers
+
+
+# Списки и лидерборд уступают соединения решениям свайпа (admission.py)
+@router.get("/", dependencies=[Depends(admission.low_priority)])
+async def get_decks(
+    user_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Колонки через запятую, например id,title"),
+    db=Depends(get_read_db),
+):
+    """
+    Колоды от новых к старым, постранично (keyset по created_at, id).
+    Следующая страница — по курсору из заголовка X-Next-Cursor.
+    """
+    size = pagination.page_size(limit, pagination.DECK_PAGE_SIZE)
+    columns = pagination.parse_fields(fields, DECK_FIELDS) or DECK_FIELDS
+    page, headers = await fetch_deck_page(db, "decks", columns, user_id, cursor, size)
+    return FastJSONResponse([{name: row[name] for name in columns} for row in page], headers=headers)
+
+
+@router.get("/summary", dependencies=[Depends(admission.low_priority)])
+async def get_deck_summaries(
+    user_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db=Depends(get_read_db),
+):
+    """
+    Колоды для списка одним запросом: число карточек и обложка (счетчики в decks,
+    их ведут триггеры) и прогресс активной сессии. Пагинация как у GET /decks/.
+    """
+    size = pagination.page_size(limit, pagination.DECK_PAGE_SIZE)
+    columns = DECK_FIELDS + ["session_id", "session_mode", "remaining_count", "smashed_count"]
+    page, headers = await fetch_deck_page(db, "deck_summary_view", columns, user_id, cursor, size)
+    if shards.router.sharded and page:
+        # Активная сессия может лежать на любом узле
+        sessions_by_deck = await active_sessions_on_nodes(row["id"] for row in page)
+        page = [
+            {**dict(row), **{
+                "session_id": session["id"] if session else None,
+                "session_mode": session["mode"] if session else None,
+                "remaining_count": session["remaining_count"] if session else None,
+                "smashed_count": session["smashed_count"] if session else None,
+            }}
+            for row, session in ((row, sessions_by_deck.get(row["id"])) for row in page)
+        ]
+
+    result = []
+    for row in page:
+        deck = {name: row[name] for name in DECK_FIELDS}
+        deck["active_session"] = None
+        if row["session_id"]:
+            deck["active_session"] = {
+                "id": row["session_id"],
+                "mode": row["session_mode"],
+                "remaining_count": row["remaining_count"],
+                "smashed_count": row["smashed_count"],
+            }
+        result.append(deck)
+    return FastJSONResponse(result, headers=headers)
 
 
 @router.get("/{deck_id}")
-async def get_deck(deck_id: str, db=Depends(get_db)):
+async def get_deck(deck_id: str, if_none_match: Optional[str] = Header(None), db=Depends(get_deck_read_db)):
     async with db.acquire() as conn:
         row = await conn.fetchrow("SELECT * FROM decks WHERE id = $1", deck_id)
         if not row:
             raise HTTPException(status_code=404, detail="Deck not found")
-        return dict(row)
+
+    etag = http_cache.make_etag("deck", row["id"], row["updated_at"], row["cards_version"])
+    cached = http_cache.not_modified(if_none_match, etag, http_cache.DECK_CACHE_CONTROL)
+    if cached:
+        return cached
+    return FastJSONResponse(dict(row), headers=http_cache.cache_headers(etag, http_cache.DECK_CACHE_CONTROL))
+
+
+@router.get("/{deck_id}/leaderboard", dependencies=[Depends(admission.low_priority)])
+async def get_deck_leaderboard(
+    deck_id: str,
+    sort: str = Query("win_rate", description="win_rate, rating, smash_rate, duel_wins или seen"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_read_db),
+):
+    """
+    Рейтинг карточек колоды по голосам: доля smash в свайпах, победы/поражения
+    в батлах, рейтинг Брэдли–Терри (пересчитывает jobs.fit_ratings) и сколько
+    раз карточку показывали. Читаются только готовые счетчики
+    (card_vote_stats/deck_vote_stats, их ведет триггер на votes), так что
+    стоимость зависит от числа карточек, а не голосов.
+    """
+    if sort not in LEADERBOARD_SORTS:
+        raise HTTPException(status_code=400, detail="Invalid sort")
+
+    async with db.acquire() as conn:
+        deck = await conn.fetchrow(
+            """
+            SELECT d.id, d.cards_version, s.votes, s.smashes, s.passes, s.duels, s.last_vote_at, s.version
+            FROM decks d LEFT JOIN deck_vote_stats s ON s.deck_id = d.id
+            WHERE d.id = $1
+            """,
+            deck_id
+        )
+        if not deck:
+            raise HTTPException(status_code=404, detail="Deck not found")
+        deck = dict(deck)
+        rows = None
+        if shards.router.sharded:
+            rows = [dict(row.items()) for row in await conn.fetch(LEADERBOARD_SQL, deck_id)]
+            await add_node_vote_stats(deck["id"], deck, rows)
+
+        etag = http_cache.make_etag("leaderboard", deck["id"], deck["version"], deck["cards_version"], sort, limit)
+        cached = http_cache.not_modified(if_none_match, etag, http_cache.DECK_CACHE_CONTROL)
+        if cached:
+            return cached
+
+        if rows is None:
+            rows = [dict(row.items()) for row in await conn.fetch(LEADERBOARD_SQL, deck_id)]
+
+    cards = []
+    for row in rows:
+        card = row
+        card["smash_rate"] = rate(row["smashes"], row["passes"])
+        card["win_rate"] = rate(row["duel_wins"], row["duel_losses"])
+        if card["rating"] is not None:
+            card["rating"] = round(card["rating"], 1)
+        cards.append(card)
+
+    # Карточки без голосов (rate = None) — в конце
+    if sort in ("win_rate", "rating", "smash_rate"):
+        cards.sort(key=lambda c: (c[sort] is not None, c[sort] or 0, c["duel_wins"], c["smashes"]), reverse=True)
+    else:
+        cards.sort(key=lambda c: c[sort], reverse=True)
+    if limit:
+        cards = cards[:limit]
+    for rank, card in enumerate(cards, start=1):
+        card["rank"] = rank
+
+    result = {
+        "deck_id": deck["id"],
+        "totals": {
+            "votes": deck["votes"] or 0,
+            "smashes": deck["smashes"] or 0,
+            "passes": deck["passes"] or 0,
+            "duels": deck["duels"] or 0,
+            "last_vote_at": deck["last_vote_at"],
+        },
+        "cards": cards,
+    }
+    return FastJSONResponse(result, headers=http_cache.cache_headers(etag, http_cache.DECK_CACHE_CONTROL))
 
 
 @router.post("/")
@@ -67,7 +318,7 @@ async def create_deck(deck: DeckCreate, db=Depends(get_db)):
 
 
 @router.put("/{deck_id}")
-async def update_deck(deck_id: str, deck: DeckUpdate, db=Depends(get_db)):
+async def update_deck(deck_id: str, deck: DeckUpdate, db=Depends(get_db), redis_client=Depends(get_redis)):
     async with db.acquire() as conn:
         # Get existing deck
         existing = await conn.fetchrow("SELECT * FROM decks WHERE id = $1", deck_id)
@@ -99,16 +350,23 @@ async def update_deck(deck_id: str, deck: DeckUpdate, db=Depends(get_db)):
         values.append(deck_id)
 
         row = await conn.fetchrow(query, *values)
-        return dict(row)
+    await replica.replica.mark_written(redis_client, row["id"], "deck")
+    return dict(row)
 
-    
 
 
 @router.delete("/{deck_id}")
-async def delete_deck(deck_id: str, db=Depends(get_db)):
+async def delete_deck(deck_id: str, db=Depends(get_db), redis_client=Depends(get_redis)):
+    # Сессии удалятся каскадом (на шардах — вместе с копией колоды) — убираем их и из кэша
+    session_rows = [row for _, row in await shards.router.gather("SELECT id FROM sessions WHERE deck_id = $1", deck_id)]
     async with db.acquire() as conn:
         row = await conn.fetchrow("DELETE FROM decks WHERE id = $1 RETURNING *", deck_id)
         if not row:
             raise HTTPException(status_code=404, detail="Deck not found")
-        return {"message": "Deck deleted successfully"}
+    await shards.router.sync_decks([row["id"]])
+    for session_row in session_rows:
+        await session_cache.invalidate(redis_client, session_row["id"])
+    await card_cache.invalidate(redis_client, deck_ids=[row["id"]])
+    await replica.replica.mark_written(redis_client, row["id"], "deck")
+    return {"message": "Deck deleted successfully"}
 
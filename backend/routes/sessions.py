@@ -1,10 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Request
+from fastapi.responses import StreamingResponse
 import asyncpg
 import uuid
 import json
 from typing import Optional, List
 from pydantic import BaseModel
 import random
+import asyncio
+import os
+
+import orjson
+
+import admission
+import card_cache
+import http_cache
+import replica
+import session_cache
+import session_events
+import shards
+import vote_writer
+from dependencies import get_db, get_redis
+from serialization import FastJSONResponse, dumps
 
 router = APIRouter()
 
@@ -20,12 +36,74 @@ class DecisionCreate(BaseModel):
     round: int = 1
 
 
-# keep local get_db to avoid circular import (main imports routes)
-async def get_db():
-    from main import db_pool
-    if db_pool is None:
-        raise HTTPException(status_code=500, detail="Database not available")
-    return db_pool
+class DecisionBatch(BaseModel):
+    decisions: List[DecisionCreate]
+
+
+class DuelResolve(BaseModel):
+    winner_id: str
+    loser_id: str
+    round: int = 1
+
+
+# Горячие запросы: тот же текст готовится в init пула (database.init_connection),
+# поэтому первое выполнение на новом соединении не тратит время на разбор и план
+SESSION_SQL = "SELECT * FROM session_view WHERE id = $1"
+ACTIVE_SESSION_SQL = (
+    "SELECT * FROM session_view WHERE deck_id = $1 AND status != 'finished' ORDER BY created_at DESC LIMIT 1"
+)
+DECK_CARDS_VERSION_SQL = "SELECT cards_version FROM decks WHERE id = $1"
+DECIDE_SQL = "SELECT session_decide($1, $2, $3, $4)"
+DECIDE_COMPACT_SQL = "SELECT session_decide_compact($1, $2, $3, $4, $5)"
+APPLY_DECISIONS_SQL = "SELECT session_apply_decisions($1, $2::jsonb)"
+APPLY_DECISION_SQL = "SELECT session_apply_decision($1, $2, $3, $4)"
+LOCK_DUEL_SESSION_SQL = "SELECT mode, status, duel_scheduler FROM sessions WHERE id = $1 FOR UPDATE"
+REMAINING_IDS_SQL = "SELECT card_id FROM session_cards WHERE session_id = $1 AND state = 'remaining' ORDER BY position"
+# Шаг батла без session_view: строка сессии и счетчики списков одним проходом по
+# session_cards сессии (как в session_decide_compact), пара — отдельным LIMIT 2
+DUEL_STEP_SQL = """
+SELECT s.id, s.deck_id, s.mode, s.status, s.duel_scheduler, s.version, s.updated_at,
+       c.remaining, c.passed, c.smashed
+FROM sessions s,
+LATERAL (
+    SELECT count(*) FILTER (WHERE state = 'remaining') AS remaining,
+           count(*) FILTER (WHERE state = 'passed') AS passed,
+           count(*) FILTER (WHERE smashed_position IS NOT NULL) AS smashed
+    FROM session_cards WHERE session_id = s.id
+) c
+WHERE s.id = $1
+"""
+COUNT_REMAINING_SQL = (
+    "SELECT count(*) FROM session_cards WHERE session_id = $1 AND card_id = ANY($2::uuid[]) AND state = 'remaining'"
+)
+
+PREPARED_QUERIES = [
+    SESSION_SQL, ACTIVE_SESSION_SQL, DECK_CARDS_VERSION_SQL,
+    DECIDE_SQL, DECIDE_COMPACT_SQL, APPLY_DECISIONS_SQL, APPLY_DECISION_SQL,
+    LOCK_DUEL_SESSION_SQL, COUNT_REMAINING_SQL, DUEL_STEP_SQL,
+]
+# Запросы чтения состояния сессии: их готовит и пул реплики
+READ_QUERIES = [SESSION_SQL, DECK_CARDS_VERSION_SQL]
+
+
+async def get_session_db(session_id: str, db=Depends(get_db)):
+    """Пул узла, на котором лежит сессия (shards.py); без шардов — основной"""
+    if not shards.router.sharded:
+        return db
+    return await shards.router.pool_for(session_id)
+
+
+async def get_session_read_db(session_id: str, db=Depends(get_db), redis_client=Depends(get_redis)):
+    """
+    Пул для чтения сессии: реплика, если она здорова и сессию не меняли
+    последние READ_YOUR_WRITES_WINDOW секунд (read-your-writes), иначе основной.
+    Реплика есть только у основной БД: сессии на других шардах читаются с их узла
+    """
+    if shards.router.sharded:
+        node = await shards.router.locate(session_id)
+        if node != shards.MAIN_NODE:
+            return shards.router.pools[node]
+    return await replica.replica.pool_for_session(db, redis_client, session_id)
 
 
 # ---- helpers ----
@@ -56,6 +134,259 @@ def to_uuid_list(str_list: List[str]) -> List[uuid.UUID]:
     return out
 
 
+async def fetch_session(conn, session_id):
+    """
+    Читает сессию из session_view: строка sessions плюс remaining_cards,
+    passed_cards и smashed_cards, собранные из session_cards (JSON, как раньше)
+    """
+    row = await conn.fetchrow(SESSION_SQL, session_id)
+    return dict(row) if row else None
+
+
+async def load_session(conn, redis_client, session_id, fill: bool = True):
+    """
+    Читает сессию из кэша Redis, при промахе — из Postgres (и кладёт в кэш).
+    fill=False — для чтения с реплики: отстающая строка не должна попасть в кэш
+    """
+    session = await session_cache.get(redis_client, session_id)
+    if session is not None:
+        return session
+    session = await fetch_session(conn, session_id)
+    if session is not None and fill:
+        await session_cache.put(redis_client, session)
+    return session
+
+
+# Поля ответа, которых нет в строке session_view (в кэш не кладём)
+HYDRATED_FIELDS = ("remainingCards", "passedCards", "smashedCards", "winner")
+
+
+async def refresh_session(conn, redis_client, session_id):
+    """Перечитывает сессию после изменения и обновляет кэш"""
+    session = await fetch_session(conn, session_id)
+    await session_cache.put(redis_client, session)
+    await replica.replica.mark_written(redis_client, session_id)
+    return session
+
+
+# ---- optimistic concurrency ----
+# sessions.version растёт при каждом UPDATE строки (триггер sessions_version).
+# Мутации вида «прочитали -> проверили -> записали» пишут строку сессии
+# только если version не изменилась с момента чтения (compare-and-swap).
+# При конфликте сессия перечитывается из Postgres и мутация повторяется;
+# после SESSION_CAS_RETRIES повторов — 409 с текущим состоянием.
+# Решения по карточкам (session_apply_decision) атомарны в самой БД.
+
+SESSION_CAS_RETRIES = int(os.getenv("SESSION_CAS_RETRIES", "3"))
+SESSION_CAS_BACKOFF = 0.02
+
+
+class SessionConflict(Exception):
+    """Строку сессии успел изменить другой запрос"""
+
+
+async def claim_session(conn, session, assignments: str = "", *values):
+    """
+    CAS-обновление строки сессии, прочитанной как session:
+    UPDATE sessions SET <assignments> ... WHERE id = $1 AND version = $2.
+    Значения для assignments — с $3. Возвращает новую строку sessions
+    или бросает SessionConflict (вызывающая транзакция откатывается).
+    """
+    sets = "updated_at = CURRENT_TIMESTAMP"
+    if assignments:
+        sets = f"{assignments}, {sets}"
+    row = await conn.fetchrow(
+        f"UPDATE sessions SET {sets} WHERE id = $1 AND version = $2 RETURNING *",
+        session["id"], session["version"], *values
+    )
+    if row is None:
+        raise SessionConflict()
+    return row
+
+
+async def mutate_session(db, redis_client, session_id, mutate):
+    """
+    Выполняет mutate(conn, session) в транзакции; mutate проверяет сессию
+    (HTTPException) и пишет её через claim_session(). Если mutate вернул False,
+    писать было нечего. Возвращает (свежая сессия, были ли изменения).
+    """
+    for attempt in range(SESSION_CAS_RETRIES + 1):
+        async with db.acquire() as conn:
+            # Первая попытка может читать кэш, повторы — только Postgres
+            if attempt == 0:
+                session = await load_session(conn, redis_client, session_id)
+            else:
+                session = await fetch_session(conn, session_id)
+            if not session:
+                raise HTTPException(status_code=404, detail="Session not found")
+            try:
+                async with conn.transaction():
+                    changed = await mutate(conn, session) is not False
+            except SessionConflict:
+                changed = None
+            if changed is False:
+                return session, False
+            if changed:
+                return await refresh_session(conn, redis_client, session_id), True
+        await asyncio.sleep(SESSION_CAS_BACKOFF * (attempt + 1) * random.random())
+
+    async with db.acquire() as conn:
+        current = await refresh_session(conn, redis_client, session_id)
+    raise HTTPException(
+        status_code=409,
+        detail={
+            "error": "Session was changed concurrently, retry with the current state",
+            "session": orjson.loads(dumps(current)),
+        },
+    )
+
+
+# ---- duel schedulers ----
+# Планировщик батла выбирается на сессию (sessions.duel_scheduler) и по списку
+# remaining (в порядке position) возвращает ID следующей пары.
+
+def random_duel_pair(remaining):
+    """Случайная пара; число батлов не ограничено, пары могут повторяться"""
+    return random.sample(remaining, 2)
+
+
+def bracket_duel_pair(remaining):
+    """
+    Сетка на выбывание: remaining — очередь, в батл идут две первые карты,
+    победитель уходит в конец очереди (position = card_seq в
+    session_apply_decision), проигравший выбывает. Пара не повторяется,
+    победитель находится ровно за n - 1 батлов.
+    """
+    return remaining[:2]
+
+
+DUEL_SCHEDULERS = {
+    "bracket": bracket_duel_pair,
+    "random": random_duel_pair,
+}
+DEFAULT_DUEL_SCHEDULER = "bracket"
+# Планировщики, у которых следующая пара однозначна: исход принимается только для неё.
+# random тянет любую пару из remaining, для него подходит любая пара оставшихся карт
+FIXED_PAIR_SCHEDULERS = {"bracket"}
+# Те же планировщики в SQL: следующая пара без чтения всего remaining
+DUEL_PAIR_SQL = {
+    "bracket": "SELECT card_id FROM session_cards WHERE session_id = $1 AND state = 'remaining' ORDER BY position LIMIT 2",
+    "random": "SELECT card_id FROM session_cards WHERE session_id = $1 AND state = 'remaining' ORDER BY random() LIMIT 2",
+}
+
+
+def duel_scheduler_name(session) -> str:
+    """Планировщик сессии; NULL и неизвестные значения — DEFAULT_DUEL_SCHEDULER"""
+    name = session.get("duel_scheduler") or DEFAULT_DUEL_SCHEDULER
+    return name if name in DUEL_SCHEDULERS else DEFAULT_DUEL_SCHEDULER
+
+
+def duel_scheduler(session):
+    return DUEL_SCHEDULERS[duel_scheduler_name(session)]
+
+
+async def pick_duel_pair(conn, session):
+    """Следующая пара по планировщику сессии, сразу объектами карточек"""
+    remaining = parse_json_field(session["remaining_cards"])
+    pair = await card_cache.get_cards(conn, duel_scheduler(session)(remaining))
+    if len(pair) < 2:
+        # Карточку пары удалили, а сессия взята из кэша: пару заново из session_cards
+        rows = await conn.fetch(DUEL_PAIR_SQL[duel_scheduler_name(session)], session["id"])
+        pair = await card_cache.get_cards(conn, [row["card_id"] for row in rows])
+        if len(pair) < 2:
+            raise HTTPException(status_code=409, detail="Not enough cards for duel, reload the session")
+    card1, card2 = pair
+    return {"card1": card1, "card2": card2}
+
+
+DECISION_TYPES = ["pass", "smash", "chosen"]
+MAX_DECISION_BATCH = 500
+
+# Ошибки session_apply_decision() -> HTTP-ответ
+DECISION_ERRORS = {
+    "not_found": (404, "Session not found"),
+    "finished": (400, "Session already finished"),
+}
+
+
+# ---- session_cards ----
+# Состояние каждой карточки в сессии — одна строка session_cards:
+#   state = 'remaining' | 'passed' | 'smashed' | 'dropped'
+#   position — порядок внутри remaining/passed, smashed_position — порядок
+#   в smashed (NULL, если карты там нет). В режиме батла выбранная карта
+#   остаётся 'remaining' и лишь получает smashed_position.
+# Позиции берутся из счётчика sessions.card_seq, поэтому решение по карточке —
+# это обновление одной строки, а не перезапись трёх JSONB-массивов.
+# Сами переходы при решении живут в БД: session_apply_decision() в db/init.sql.
+
+# remaining := smashed, smashed := [], мусорка не меняется (reswipe, start-duel)
+PROMOTE_SMASHED_SQL = """
+UPDATE session_cards
+SET state = CASE WHEN smashed_position IS NOT NULL THEN 'remaining' ELSE 'dropped' END,
+    position = COALESCE(smashed_position, position),
+    smashed_position = NULL
+WHERE session_id = $1
+  AND (smashed_position IS NOT NULL OR state IN ('remaining', 'smashed'))
+"""
+
+# smashed := remaining, мусорка не меняется (return-to-swipe)
+COPY_REMAINING_TO_SMASHED_SQL = """
+UPDATE session_cards
+SET smashed_position = CASE WHEN state = 'remaining' THEN position END,
+    state = CASE WHEN state = 'smashed' THEN 'dropped' ELSE state END
+WHERE session_id = $1
+  AND (smashed_position IS NOT NULL OR state IN ('remaining', 'smashed'))
+"""
+
+# Новые карточки колоды (и выпавшие из всех списков) добавляются в конец remaining
+ADD_NEW_DECK_CARDS_SQL = """
+WITH new_cards AS (
+    SELECT c.id, row_number() OVER (ORDER BY c.position ASC, c.created_at ASC) AS n
+    FROM cards c
+    WHERE c.deck_id = $2
+      AND NOT EXISTS (
+          SELECT 1 FROM session_cards sc
+          WHERE sc.session_id = $1 AND sc.card_id = c.id AND sc.state <> 'dropped'
+      )
+), inserted AS (
+    INSERT INTO session_cards (session_id, card_id, state, position)
+    SELECT $1, new_cards.id, 'remaining', s.card_seq + new_cards.n
+    FROM new_cards, sessions s
+    WHERE s.id = $1
+    ON CONFLICT (session_id, card_id) DO UPDATE
+    SET state = 'remaining', position = EXCLUDED.position, smashed_position = NULL
+    RETURNING 1
+)
+UPDATE sessions
+SET card_seq = card_seq + (SELECT count(*) FROM inserted), updated_at = CURRENT_TIMESTAMP
+WHERE id = $1 AND EXISTS (SELECT 1 FROM inserted)
+"""
+
+CREATE_SESSION_SQL = """
+WITH new_session AS (
+    INSERT INTO sessions (id, deck_id, user_id, mode, status, card_seq)
+    VALUES ($1, $2, $3, 'swipe', 'active', $4)
+    RETURNING id
+)
+INSERT INTO session_cards (session_id, card_id, state, position)
+SELECT new_session.id, c.id, 'remaining',
+       row_number() OVER (ORDER BY c.position ASC, c.created_at ASC)
+FROM cards c, new_session
+WHERE c.deck_id = $2
+"""
+
+
+async def find_active_session(deck_id):
+    """
+    Последняя незавершенная сессия колоды: (узел, строка session_view) или None.
+    Сессии колоды могут лежать на разных шардах — спрашиваем все узлы сразу
+    """
+    found = await shards.router.gather(ACTIVE_SESSION_SQL, deck_id)
+    if not found:
+        return None
+    return max(found, key=lambda item: item[1]["created_at"])
+
+
 # ---- routes ----
 
 @router.get("/deck/{deck_id}/active")
@@ -63,152 +394,95 @@ async def get_active_session(deck_id: str, db=Depends(get_db)):
     """
     Получает активную (не завершенную) сессию для указанной колоды
     """
-    async with db.acquire() as conn:
-        session_row = await conn.fetchrow(
-            "SELECT * FROM sessions WHERE deck_id = $1 AND status != 'finished' ORDER BY created_at DESC LIMIT 1",
-            deck_id
-        )
-        if session_row:
-            return dict(session_row)
-        # Возвращаем 404 если активной сессии нет
-        raise HTTPException(status_code=404, detail="No active session found")
+    found = await find_active_session(deck_id)
+    if found:
+        return dict(found[1])
+    # Возвращаем 404 если активной сессии нет
+    raise HTTPException(status_code=404, detail="No active session found")
 
 
 @router.post("/deck/{deck_id}")
-async def create_session(deck_id: str, session: SessionCreate, db=Depends(get_db)):
+async def create_session(deck_id: str, session: SessionCreate, db=Depends(get_db), redis_client=Depends(get_redis)):
     async with db.acquire() as conn:
-        # Получаем все карточки из колоды
-        card_rows = await conn.fetch(
-            "SELECT id FROM cards WHERE deck_id = $1 ORDER BY position ASC, created_at ASC",
-            deck_id
-        )
-        all_deck_card_ids = [str(row["id"]) for row in card_rows]
-        if not all_deck_card_ids:
+        deck_card_count = await conn.fetchval("SELECT count(*) FROM cards WHERE deck_id = $1", deck_id)
+        if not deck_card_count:
             raise HTTPException(status_code=400, detail="Deck has no cards")
         
-        # Проверяем, есть ли уже активная сессия для этой колоды
-        existing_session = await conn.fetchrow(
-            "SELECT * FROM sessions WHERE deck_id = $1 AND status != 'finished' ORDER BY created_at DESC LIMIT 1",
-            deck_id
-        )
-        
-        if existing_session:
-            # Обновляем существующую сессию, добавляя новые карточки
-            existing = dict(existing_session)
-            remaining = parse_json_field(existing.get("remaining_cards"))
-            smashed = parse_json_field(existing.get("smashed_cards"))
-            passed = parse_json_field(existing.get("passed_cards", []))
-            mode = existing.get("mode", "swipe")
-            
-            # Находим все карточки, которые уже есть в сессии
-            existing_card_ids = set(remaining + smashed + passed)
-            
-            # Находим новые карточки, которых нет в сессии
-            new_card_ids = [cid for cid in all_deck_card_ids if cid not in existing_card_ids]
-            
-            # Добавляем новые карточки в remaining_cards
-            if new_card_ids:
-                if mode == "swipe":
-                    # В режиме swipe добавляем новые карточки в remaining
-                    remaining = remaining + new_card_ids
-                else:
-                    # В режиме duel добавляем новые карточки в remaining для будущих батлов
-                    remaining = remaining + new_card_ids
-                
-                # Обновляем сессию с новыми карточками
-                await conn.execute(
-                    "UPDATE sessions SET remaining_cards = $1, updated_at = CURRENT_TIMESTAMP WHERE id = $2",
-                    json.dumps(remaining), existing["id"]
-                )
-                
-                # Получаем обновленную сессию
-                updated_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", existing["id"])
-                return dict(updated_row)
+    # Проверяем, есть ли уже активная сессия для этой колоды
+    existing_session = await find_active_session(deck_id)
+    
+    if existing_session:
+        node, existing_row = existing_session
+        # Копия колоды на узле сессии должна знать о новых карточках
+        await shards.router.ensure_deck(node, deck_id)
+        async with shards.router.pools[node].acquire() as conn:
+            # Добавляем в remaining карточки, которых еще нет в сессии
+            # (в режиме duel они пойдут в будущие батлы)
+            result = await conn.execute(ADD_NEW_DECK_CARDS_SQL, existing_row["id"], deck_id)
+            if result != "UPDATE 0":
+                return await refresh_session(conn, redis_client, existing_row["id"])
             
             # Возвращаем существующую сессию без изменений, если новых карточек нет
-            return existing
-        
-        # Создаем новую сессию только если активной нет
-        session_id = str(uuid.uuid4())
-        row = await conn.fetchrow(
-            "INSERT INTO sessions (id, deck_id, user_id, remaining_cards, smashed_cards, passed_cards, mode, status) "
-            "VALUES ($1,$2,$3,$4,$5,$6,$7,$8) RETURNING *",
-            session_id, deck_id, session.user_id, json.dumps(all_deck_card_ids), json.dumps([]), json.dumps([]), "swipe", "active"
-        )
-        return dict(row)
+            return await load_session(conn, redis_client, existing_row["id"])
+    
+    # Создаем новую сессию только если активной нет — на узле, которому её id
+    # достаётся по кольцу шардов (без шардов это основная БД)
+    session_id = str(uuid.uuid4())
+    node = shards.router.owner(session_id)
+    await shards.router.ensure_deck(node, deck_id, session.user_id)
+    async with shards.router.pools[node].acquire() as conn:
+        await conn.execute(CREATE_SESSION_SQL, session_id, deck_id, session.user_id, deck_card_count)
+        return await refresh_session(conn, redis_client, session_id)
 
 
 @router.post("/{session_id}/reswipe")
-async def reswipe_session(session_id: str, db=Depends(get_db)):
+async def reswipe_session(session_id: str, db=Depends(get_session_db), redis_client=Depends(get_redis)):
     """Reset session to reswipe smashed cards"""
-    async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
-            raise HTTPException(status_code=404, detail="Session not found")
-
-        session = dict(session_row)
+    async def reswipe(conn, session):
         smashed_cards = parse_json_field(session.get("smashed_cards"))
-        # Сохраняем существующие passed_cards (мусорку), чтобы карточки не терялись
-        passed_cards = parse_json_field(session.get("passed_cards", []))
 
         if not smashed_cards:
             raise HTTPException(status_code=400, detail="No smashed cards to reswipe")
 
-        await conn.execute(
-            "UPDATE sessions SET remaining_cards = $1, smashed_cards = $2, passed_cards = $3, mode = $4, status = $5, updated_at = CURRENT_TIMESTAMP WHERE id = $6",
-            json.dumps(smashed_cards), json.dumps([]), json.dumps(passed_cards), "swipe", "active", session_id
-        )
+        # passed_cards (мусорка) не трогаем, чтобы карточки не терялись
+        await claim_session(conn, session, "mode = $3, status = $4", "swipe", "active")
+        await conn.execute(PROMOTE_SMASHED_SQL, session["id"])
 
-        updated_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        return dict(updated_row)
+    updated, _ = await mutate_session(db, redis_client, session_id, reswipe)
+    await session_events.publish(redis_client, session_events.session_delta("reswipe", updated))
+    return updated
 
 
 @router.get("/{session_id}/state")
-async def get_session_state(session_id: str, db=Depends(get_db)):
+async def get_session_state(
+    session_id: str,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_session_read_db),
+    redis_client=Depends(get_redis),
+):
+    # Кэши (сессий и карточек) наполняются только с основной БД
+    fill = not replica.replica.is_replica(db)
     async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
+        session = await load_session(conn, redis_client, session_id, fill)
+        if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        session = dict(session_row)
+        # Версия = version сессии + версия карточек колоды (правки карточек тоже видны в ответе).
+        # Если у клиента она уже есть — 304 без гидрации карточек
+        cards_version = await conn.fetchval(DECK_CARDS_VERSION_SQL, session["deck_id"])
+        etag = http_cache.make_etag("session", session["id"], session["version"], cards_version)
+        cached = http_cache.not_modified(if_none_match, etag, http_cache.SESSION_CACHE_CONTROL)
+        if cached:
+            return cached
+
         remaining_ids = parse_json_field(session.get("remaining_cards"))
 
-        # Формируем объекты оставшихся карточек
-        remaining_cards = []
-        if remaining_ids:
-            uuid_list = to_uuid_list(remaining_ids)
-            if uuid_list:
-                card_rows = await conn.fetch(
-                    "SELECT * FROM cards WHERE id = ANY($1::uuid[])",
-                    uuid_list
-                )
-                for row in card_rows:
-                    card = dict(row)
-                    if isinstance(card.get("metadata"), str):
-                        try:
-                            card["metadata"] = json.loads(card["metadata"])
-                        except:
-                            card["metadata"] = {}
-                    remaining_cards.append(card)
+        # Формируем объекты оставшихся карточек (из кэша карточек, в порядке сессии)
+        remaining_cards = await card_cache.get_cards(conn, remaining_ids, fill)
 
         # Формируем объекты карточек из passed_cards (мусорка)
         passed_ids = parse_json_field(session.get("passed_cards"))
-        passed_cards = []
-        if passed_ids:
-            uuid_list = to_uuid_list(passed_ids)
-            if uuid_list:
-                card_rows = await conn.fetch(
-                    "SELECT * FROM cards WHERE id = ANY($1::uuid[])",
-                    uuid_list
-                )
-                for row in card_rows:
-                    card = dict(row)
-                    if isinstance(card.get("metadata"), str):
-                        try:
-                            card["metadata"] = json.loads(card["metadata"])
-                        except:
-                            card["metadata"] = {}
-                    passed_cards.append(card)
+        passed_cards = await card_cache.get_cards(conn, passed_ids, fill)
 
         # Отдаём фронту в camelCase
         session["remainingCards"] = remaining_cards
@@ -220,315 +494,341 @@ async def get_session_state(session_id: str, db=Depends(get_db)):
             # Проверяем, есть ли уже winner в базе (может быть установлен в record_decision)
             # Если нет, но осталась одна карта - определяем победителя
             if len(remaining_ids) == 1 and not session.get("winner"):
-                uuid_list = to_uuid_list(remaining_ids)
-                if uuid_list:
-                    winner_row = await conn.fetchrow("SELECT * FROM cards WHERE id = $1", uuid_list[0])
-                    if winner_row:
-                        winner = dict(winner_row)
-                        if isinstance(winner.get("metadata"), str):
-                            try:
-                                winner["metadata"] = json.loads(winner["metadata"])
-                            except:
-                                winner["metadata"] = {}
-                        session["winner"] = winner
-
-        return session
-
-@router.post("/{session_id}/decision")
-async def record_decision(session_id: str, decision: DecisionCreate, db=Depends(get_db)):
+                winner = await card_cache.get_card(conn, remaining_ids[0], fill)
+                if winner:
+                    session["winner"] = winner
 
-    if decision.decision not in ["pass", "smash", "chosen"]:
-        raise HTTPException(status_code=400, detail="Invalid decision type")
+        return FastJSONResponse(session, headers=http_cache.cache_headers(etag, http_cache.SESSION_CACHE_CONTROL))
 
+@router.get("/{session_id}/events")
+async def stream_session_events(session_id: str, request: Request, db=Depends(get_session_db), redis_client=Depends(get_redis)):
+    """
+    Server-Sent Events вместо опроса /state: сначала snapshot, затем update
+    после каждого изменения сессии (с любого устройства и любого воркера).
+    resync — пропущены события, клиент перечитывает /state
+    """
     async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
-            raise HTTPException(status_code=404, detail="Session not found")
+        session = await load_session(conn, redis_client, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
 
-        session = dict(session_row)
+    session_key = str(session["id"])
+    queue = session_events.hub.subscribe(session_key)
 
-        if session["status"] == "finished":
-            raise HTTPException(status_code=400, detail="Session already finished")
-
-        remaining = parse_json_field(session["remaining_cards"])
-        smashed = parse_json_field(session["smashed_cards"])
-        passed = parse_json_field(session["passed_cards"])
-        mode = session["mode"]
+    async def stream():
+        try:
+            yield session_events.format_sse(session_events.session_delta("snapshot", session))
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=session_events.SESSION_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE держит соединение живым через прокси
+                    yield b": keepalive\n\n"
+                    continue
+                if event is session_events.CLOSED:
+                    # Воркер останавливается: клиент переподключится к другому
+                    break
+                yield session_events.format_sse(event)
+        finally:
+            session_events.hub.unsubscribe(session_key, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Решения свайпа и дуэли первыми получают соединение из пула (admission.py)
+@router.post("/{session_id}/decision", dependencies=[Depends(admission.high_priority)])
+async def record_decision(
+    session_id: str,
+    decision: DecisionCreate,
+    view: Optional[str] = Query(None, description="full (по умолчанию) или compact"),
+    next_cards: int = Query(3, ge=0, le=50, description="Сколько следующих карточек вернуть в compact"),
+    x_response_view: Optional[str] = Header(None),
+    db=Depends(get_session_db),
+    redis_client=Depends(get_redis),
+):
+
+    if decision.decision not in DECISION_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid decision type")
 
-        # ВАЖНО: Исключаем все passed карты из remaining для дополнительной защиты
-        # (на случай, если они каким-то образом попали обратно)
-        remaining = [cid for cid in remaining if cid not in passed]
+    response_view = view or x_response_view or "full"
+    if response_view not in ["full", "compact"]:
+        raise HTTPException(status_code=400, detail="Invalid response view")
 
-        # В режиме батла: убираем карту из оставшихся только если она "pass"
-        # В режиме свайпа: убираем карту из оставшихся всегда
-        if mode == "duel":
-            # В батле: выбранная карта (smash) остается, не выбранная (pass) удаляется
-            if decision.decision == "pass":
-                remaining = [cid for cid in remaining if cid != decision.card_id]
-                if decision.card_id not in passed:
-                    passed.append(decision.card_id)
-            else:
-                # Карта выбрана (smash) - остается в remaining, добавляем в smashed для истории
-                if decision.card_id not in smashed:
-                    smashed.append(decision.card_id)
+    # Один вызов session_decide(): под блокировкой строки сессии переносит карту,
+    # сохраняет голос, обновляет статус и возвращает готовый ответ
+    # (remainingCards/passedCards объектами, smashedCards ID, winner).
+    # session_decide_compact() вместо всей колоды отдает изменившуюся карту,
+    # счетчики и следующие next_cards карточек
+    async with db.acquire() as conn:
+        if response_view == "compact":
+            payload = await conn.fetchval(
+                DECIDE_COMPACT_SQL,
+                session_id, decision.card_id, decision.decision, decision.round, next_cards
+            )
         else:
-            # Режим свайпа: убираем карту из оставшихся всегда
-            remaining = [cid for cid in remaining if cid != decision.card_id]
-            # Добавляем карту в выбранные или пропущенные
-            if decision.decision == "pass":
-                passed.append(decision.card_id)
-            else:
-                if decision.card_id not in smashed:
-                    smashed.append(decision.card_id)
+            payload = await conn.fetchval(
+                DECIDE_SQL,
+                session_id, decision.card_id, decision.decision, decision.round
+            )
 
-        # Сохраняем голос
-        vote_id = str(uuid.uuid4())
-        await conn.execute(
-            """
-            INSERT INTO votes (id, session_id, card_id, decision, round)
-            VALUES ($1,$2,$3,$4,$5)
-            """,
-            vote_id, session_id, decision.card_id, decision.decision, decision.round
+    updated = session_cache.restore_timestamps(payload)
+    if "error" in updated:
+        raise HTTPException(status_code=updated["status_code"], detail=updated["error"])
+    await vote_writer.record(session_id, updated["mode"], [(decision.card_id, decision.decision, decision.round)])
+    await replica.replica.mark_written(redis_client, session_id)
+
+    if response_view == "compact":
+        # В compact-ответе нет списков карточек — строку в кэше просто сбрасываем
+        await session_cache.invalidate(redis_client, session_id)
+    else:
+        await session_cache.put(
+            redis_client,
+            {k: v for k, v in updated.items() if k not in HYDRATED_FIELDS}
         )
+    await session_events.publish(redis_client, session_events.session_delta(
+        "decision", updated, card_id=decision.card_id, decision=decision.decision
+    ))
+    return FastJSONResponse(updated)
 
-        status = session["status"]
 
-        # Определяем статус после последнего свайпа
-        if not remaining and mode == "swipe":
-            status = "finished" if len(smashed) < 2 else "active"
-        
-        # В режиме батла: если осталась одна карта, она становится победителем
-        if mode == "duel" and len(remaining) == 1:
-            status = "finished"
+@router.post("/{session_id}/decisions", dependencies=[Depends(admission.high_priority)])
+async def record_decisions(session_id: str, batch: DecisionBatch, db=Depends(get_session_db), redis_client=Depends(get_redis)):
+    """
+    Пакет решений (офлайн-очередь свайпов) по тем же правилам, что и record_decision:
+    одна транзакция, одно обновление сессии и одна вставка голосов на весь пакет.
+    Решения, которые уже не применимы (карта в мусорке, сессия завершена...),
+    пропускаются и возвращаются в rejected с индексом и причиной.
+    """
+    if len(batch.decisions) > MAX_DECISION_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_DECISION_BATCH} decisions per batch")
+
+    rejected = []
+    items = []
+    for index, decision in enumerate(batch.decisions):
+        if decision.decision not in DECISION_TYPES:
+            rejected.append({"index": index, "card_id": decision.card_id, "reason": "invalid_decision"})
+        elif not to_uuid_list([decision.card_id]):
+            rejected.append({"index": index, "card_id": decision.card_id, "reason": "invalid_card_id"})
+        else:
+            items.append({"index": index, "card_id": decision.card_id, "decision": decision.decision, "round": decision.round})
 
-        # Обновляем сессию в базе
-        await conn.execute(
-            """
-            UPDATE sessions
-            SET remaining_cards = $1,
-                smashed_cards = $2,
-                passed_cards = $3,
-                status = $4,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = $5
-            """,
-            json.dumps(remaining),
-            json.dumps(smashed),
-            json.dumps(passed),
-            status,
-            session_id
+    async with db.acquire() as conn:
+        result = await conn.fetchval(
+            APPLY_DECISIONS_SQL,
+            session_id, items
         )
+        if "error" in result:
+            raise HTTPException(status_code=result["status_code"], detail=result["error"])
 
-        # Получаем актуальные данные
-        updated = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        updated = dict(updated)
-
-        # Формируем объекты оставшихся карточек
-        remaining_cards_list = []
-        if remaining:
-            uuid_ids = to_uuid_list(remaining)
-            if uuid_ids:
-                card_rows = await conn.fetch(
-                    "SELECT * FROM cards WHERE id = ANY($1::uuid[])",
-                    uuid_ids
-                )
-                for c in card_rows:
-                    card = dict(c)
-                    if isinstance(card.get("metadata"), str):
-                        try:
-                            card["metadata"] = json.loads(card["metadata"])
-                        except:
-                            card["metadata"] = {}
-                    remaining_cards_list.append(card)
-        updated["remainingCards"] = remaining_cards_list
-
-        # Формируем объекты карточек из passed_cards (мусорка)
-        passed_cards_list = []
-        if passed:
-            uuid_ids = to_uuid_list(passed)
-            if uuid_ids:
-                card_rows = await conn.fetch(
-                    "SELECT * FROM cards WHERE id = ANY($1::uuid[])",
-                    uuid_ids
-                )
-                for c in card_rows:
-                    card = dict(c)
-                    if isinstance(card.get("metadata"), str):
-                        try:
-                            card["metadata"] = json.loads(card["metadata"])
-                        except:
-                            card["metadata"] = {}
-                    passed_cards_list.append(card)
-        
-        # Формируем списки для фронта
-        updated["smashedCards"] = smashed
-        updated["passedCards"] = passed_cards_list  # Теперь это массив объектов, а не ID
-
-        # Автоматический победитель, если выбрана только 1 карта (swipe mode)
-        if updated["status"] == "finished" and len(smashed) == 1 and mode == "swipe":
-            winner_row = await conn.fetchrow(
-                "SELECT * FROM cards WHERE id = $1", smashed[0]
-            )
-            if winner_row:
-                winner = dict(winner_row)
-                if isinstance(winner.get("metadata"), str):
-                    try:
-                        winner["metadata"] = json.loads(winner["metadata"])
-                    except:
-                        winner["metadata"] = {}
-                updated["winner"] = winner
-        
-        # Автоматический победитель в режиме батла, если осталась одна карта
-        if updated["status"] == "finished" and len(remaining) == 1 and mode == "duel":
-            winner_row = await conn.fetchrow(
-                "SELECT * FROM cards WHERE id = $1", remaining[0]
-            )
-            if winner_row:
-                winner = dict(winner_row)
-                if isinstance(winner.get("metadata"), str):
-                    try:
-                        winner["metadata"] = json.loads(winner["metadata"])
-                    except:
-                        winner["metadata"] = {}
-                updated["winner"] = winner
-
-        return updated
-
-
+        if result["applied"]:
+            updated = await refresh_session(conn, redis_client, session_id)
+        else:
+            updated = await load_session(conn, redis_client, session_id)
+
+    if result["applied"]:
+        skipped = {item["index"] for item in result["rejected"]}
+        await vote_writer.record(session_id, updated["mode"], [
+            (item["card_id"], item["decision"], item["round"]) for item in items if item["index"] not in skipped
+        ])
+        await session_events.publish(redis_client, session_events.session_delta(
+            "decisions", updated, applied=result["applied"]
+        ))
+    rejected = sorted(rejected + result["rejected"], key=lambda item: item["index"])
+    updated["applied"] = result["applied"]
+    updated["rejected"] = rejected
+    return updated
 
 
 @router.post("/{session_id}/duel")
-async def get_duel_pair(session_id: str, db=Depends(get_db)):
+async def get_duel_pair(session_id: str, db=Depends(get_session_db), redis_client=Depends(get_redis)):
     async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
+        session = await load_session(conn, redis_client, session_id)
+        if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        session = dict(session_row)
+        # remaining и passed в session_cards взаимоисключающие состояния,
+        # поэтому дополнительно фильтровать remaining по мусорке не нужно
         remaining = parse_json_field(session["remaining_cards"])
-        passed = parse_json_field(session.get("passed_cards", []))
-
-        # Исключаем карты, которые уже были исключены (passed) - для дополнительной безопасности
-        remaining = [cid for cid in remaining if cid not in passed]
 
         if len(remaining) < 2:
             raise HTTPException(status_code=400, detail="Not enough cards for duel")
 
-        # случайная пара из remaining (только активные карты, не исключенные)
-        pair_ids = random.sample(remaining, 2)
-        uuid_ids = to_uuid_list(pair_ids)
+        return await pick_duel_pair(conn, session)
 
-        card_rows = await conn.fetch(
-            "SELECT * FROM cards WHERE id = ANY($1::uuid[])",
-            uuid_ids
-        )
 
-        cards = []
-        for c in card_rows:
-            card = dict(c)
-            if isinstance(card.get("metadata"), str):
-                try:
-                    card["metadata"] = json.loads(card["metadata"])
-                except:
-                    card["metadata"] = {}
-            cards.append(card)
+@router.post("/{session_id}/duel/resolve", dependencies=[Depends(admission.high_priority)])
+async def resolve_duel(session_id: str, resolve: DuelResolve, db=Depends(get_session_db), redis_client=Depends(get_redis)):
+    """
+    Записывает исход батла одной транзакцией (winner — smash, loser — pass)
+    и сразу возвращает следующую пару или победителя батла
+    """
+    if resolve.winner_id == resolve.loser_id:
+        raise HTTPException(status_code=400, detail="winner_id and loser_id must be different cards")
 
-        return {"card1": cards[0], "card2": cards[1]}
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            session_row = await conn.fetchrow(
+                LOCK_DUEL_SESSION_SQL, session_id
+            )
+            if not session_row:
+                raise HTTPException(status_code=404, detail="Session not found")
+            if session_row["mode"] != "duel":
+                raise HTTPException(status_code=400, detail="Session is not in duel mode")
+
+            in_duel = await conn.fetchval(
+                COUNT_REMAINING_SQL,
+                session_id, to_uuid_list([resolve.winner_id, resolve.loser_id])
+            )
+            if in_duel != 2:
+                raise HTTPException(status_code=400, detail="Both cards must be in the duel")
+
+            # Пара должна быть той, которую назначил планировщик (под блокировкой сессии)
+            scheduler = duel_scheduler_name(session_row)
+            if scheduler in FIXED_PAIR_SCHEDULERS:
+                remaining = [str(row["card_id"]) for row in await conn.fetch(REMAINING_IDS_SQL, session_id)]
+                scheduled = set(DUEL_SCHEDULERS[scheduler](remaining))
+                submitted = {str(card_id) for card_id in to_uuid_list([resolve.winner_id, resolve.loser_id])}
+                if submitted != scheduled:
+                    raise HTTPException(
+                        status_code=409,
+                        detail={"error": "This pair is not the scheduled duel", "pair": sorted(scheduled)},
+                    )
+
+            for card_id, decision in ((resolve.winner_id, "smash"), (resolve.loser_id, "pass")):
+                error = await conn.fetchval(
+                    APPLY_DECISION_SQL,
+                    session_id, card_id, decision, resolve.round
+                )
+                if error:
+                    status_code, detail = DECISION_ERRORS[error]
+                    raise HTTPException(status_code=status_code, detail=detail)
+
+            # Новое состояние и следующая пара — без session_view и списков всей колоды
+            step = dict(await conn.fetchrow(DUEL_STEP_SQL, session_id))
+            pair_ids = []
+            if step["status"] != "finished" and step["remaining"] >= 2:
+                pair_ids = [row["card_id"] for row in await conn.fetch(DUEL_PAIR_SQL[scheduler], session_id)]
+
+        await vote_writer.record(session_id, "duel", [
+            (resolve.winner_id, "smash", resolve.round),
+            (resolve.loser_id, "pass", resolve.round),
+        ])
+        await replica.replica.mark_written(redis_client, session_id)
+        # Как в compact-ответе свайпа: строку в кэше сбрасываем, полную сессию
+        # перечитает следующий GET /state, а не каждый шаг батла
+        await session_cache.invalidate(redis_client, session_id)
+        step["counts"] = {name: step.pop(name) for name in ("remaining", "passed", "smashed")}
+        await session_events.publish(redis_client, session_events.session_delta(
+            "duel", step, winner_id=resolve.winner_id, loser_id=resolve.loser_id
+        ))
+
+        if step["status"] == "finished":
+            winner = await conn.fetchval(
+                "SELECT session_decision_winner($1, $2, $3)",
+                session_id, step["mode"], step["status"]
+            )
+            return {"status": "finished", "winner": winner}
+
+        remaining_count = step["counts"]["remaining"]
+        result = {"status": step["status"], "remainingCount": remaining_count}
+        if scheduler in FIXED_PAIR_SCHEDULERS:
+            # В сетке до победителя осталось ровно remaining - 1 батлов
+            result["duelsLeft"] = max(remaining_count - 1, 0)
+        if pair_ids:
+            pair = await card_cache.get_cards(conn, pair_ids)
+            if len(pair) < 2:
+                raise HTTPException(status_code=409, detail="Not enough cards for duel, reload the session")
+            result["card1"], result["card2"] = pair
+        return result
 
 
 
 
 @router.post("/{session_id}/start-duel")
-async def start_duel(session_id: str, db=Depends(get_db)):
+async def start_duel(
+    session_id: str,
+    scheduler: Optional[str] = Query(None, description="Планировщик батла: bracket или random"),
+    db=Depends(get_session_db),
+    redis_client=Depends(get_redis),
+):
     """
     Switch session to duel mode: move smashed_cards -> remaining_cards, clear smashed.
     Если сессия уже в режиме duel, просто возвращает её без изменений.
     """
-    async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
-            raise HTTPException(status_code=404, detail="Session not found")
+    if scheduler is not None and scheduler not in DUEL_SCHEDULERS:
+        raise HTTPException(status_code=400, detail="Unknown duel scheduler")
 
-        session = dict(session_row)
+    async def switch_to_duel(conn, session):
         mode = session.get("mode", "swipe")
-        
+
         # Если сессия уже в режиме duel, просто возвращаем её
         if mode == "duel":
             remaining = parse_json_field(session.get("remaining_cards"))
             if len(remaining) < 2:
                 raise HTTPException(status_code=400, detail="Not enough cards for duel")
-            return session
-        
+            return False
+
         # Переключаем из режима swipe в duel
         smashed = parse_json_field(session.get("smashed_cards"))
-        # Сохраняем существующие passed_cards (мусорку), чтобы карточки не терялись
-        passed = parse_json_field(session.get("passed_cards", []))
 
         if len(smashed) < 2:
             raise HTTPException(status_code=400, detail="Need at least 2 smashed cards for duel")
 
-        await conn.execute(
-            "UPDATE sessions SET remaining_cards = $1, smashed_cards = $2, passed_cards = $3, mode = $4, status = $5, updated_at = CURRENT_TIMESTAMP WHERE id = $6",
-            json.dumps(smashed), json.dumps([]), json.dumps(passed), "duel", "active", session_id
+        # passed_cards (мусорку) не трогаем, чтобы карточки не терялись
+        await claim_session(
+            conn, session, "mode = $3, status = $4, duel_scheduler = $5",
+            "duel", "active", scheduler or DEFAULT_DUEL_SCHEDULER
         )
+        await conn.execute(PROMOTE_SMASHED_SQL, session["id"])
 
-        updated_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        return dict(updated_row)
+    updated, changed = await mutate_session(db, redis_client, session_id, switch_to_duel)
+    if changed:
+        await session_events.publish(redis_client, session_events.session_delta("start_duel", updated))
+    return updated
 
 
 @router.post("/{session_id}/return-to-swipe")
-async def return_to_swipe(session_id: str, db=Depends(get_db)):
+async def return_to_swipe(session_id: str, db=Depends(get_session_db), redis_client=Depends(get_redis)):
     """
     Переключает сессию из режима duel обратно в режим swipe.
     Объединяет remaining_cards обратно в smashed_cards для свайпа.
     """
-    async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
-            raise HTTPException(status_code=404, detail="Session not found")
-
-        session = dict(session_row)
-        remaining = parse_json_field(session.get("remaining_cards"))
-        # Сохраняем существующие passed_cards (мусорку), чтобы карточки не терялись
-        passed = parse_json_field(session.get("passed_cards", []))
-
+    async def switch_to_swipe(conn, session):
         # В режиме duel remaining_cards содержат карты для батла
-        # При возврате к свайпу перемещаем их обратно в smashed_cards
-        # и делаем их remaining для свайпа
-        smashed_for_swipe = remaining.copy()
-
-        await conn.execute(
-            "UPDATE sessions SET remaining_cards = $1, smashed_cards = $2, passed_cards = $3, mode = $4, status = $5, updated_at = CURRENT_TIMESTAMP WHERE id = $6",
-            json.dumps(smashed_for_swipe), json.dumps(smashed_for_swipe), json.dumps(passed), "swipe", "active", session_id
-        )
+        # При возврате к свайпу копируем их в smashed_cards
+        # и оставляем remaining для свайпа; мусорку не трогаем
+        await claim_session(conn, session, "mode = $3, status = $4", "swipe", "active")
+        await conn.execute(COPY_REMAINING_TO_SMASHED_SQL, session["id"])
 
-        updated_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        return dict(updated_row)
+    updated, _ = await mutate_session(db, redis_client, session_id, switch_to_swipe)
+    await session_events.publish(redis_client, session_events.session_delta("return_to_swipe", updated))
+    return updated
 
 
 @router.post("/{session_id}/finish")
-async def finish_session(session_id: str, db=Depends(get_db)):
+async def finish_session(session_id: str, db=Depends(get_session_db), redis_client=Depends(get_redis)):
     async with db.acquire() as conn:
         row = await conn.fetchrow(
-            "UPDATE sessions SET status = $1, updated_at = CURRENT_TIMESTAMP WHERE id = $2 RETURNING *",
+            "UPDATE sessions SET status = $1, updated_at = CURRENT_TIMESTAMP WHERE id = $2 RETURNING id",
             "finished", session_id
         )
         if not row:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        session = dict(row)
+        session = await refresh_session(conn, redis_client, session_id)
         remaining = parse_json_field(session.get("remaining_cards"))
         if len(remaining) == 1:
-            winner_row = await conn.fetchrow("SELECT * FROM cards WHERE id = $1", remaining[0])
-            if winner_row:
-                winner = dict(winner_row)
-                if isinstance(winner.get("metadata"), str):
-                    try:
-                        winner["metadata"] = json.loads(winner["metadata"])
-                    except:
-                        winner["metadata"] = {}
+            winner = await card_cache.get_card(conn, remaining[0])
+            if winner:
                 session["winner"] = winner
-        return session
+    await session_events.publish(redis_client, session_events.session_delta(
+        "finish", session, winner_id=remaining[0] if len(remaining) == 1 else None
+    ))
+    return session
 
 
 class RestoreCardRequest(BaseModel):
@@ -536,55 +836,36 @@ class RestoreCardRequest(BaseModel):
 
 
 @router.post("/{session_id}/restore")
-async def restore_card_from_trash(session_id: str, request: RestoreCardRequest, db=Depends(get_db)):
+async def restore_card_from_trash(session_id: str, request: RestoreCardRequest, db=Depends(get_session_db), redis_client=Depends(get_redis)):
     """
     Восстанавливает карточку из мусорки (passed_cards) обратно в remaining_cards
     """
-    async with db.acquire() as conn:
-        session_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        if not session_row:
-            raise HTTPException(status_code=404, detail="Session not found")
-
-        session = dict(session_row)
-
+    async def restore(conn, session):
         if session["status"] == "finished":
             raise HTTPException(status_code=400, detail="Cannot restore cards from finished session")
 
-        remaining = parse_json_field(session["remaining_cards"])
         passed = parse_json_field(session["passed_cards"])
 
         # Проверяем, что карта действительно в мусорке
         if request.card_id not in passed:
             raise HTTPException(status_code=400, detail="Card is not in trash")
 
-        # Удаляем карту из passed
-        passed = [cid for cid in passed if cid != request.card_id]
-
-        # Добавляем карту обратно в remaining
-        if request.card_id not in remaining:
-            remaining.append(request.card_id)
-
-        # Обновляем сессию
+        # Переносим карту из passed в конец remaining
+        row = await claim_session(conn, session, "card_seq = card_seq + 1")
         await conn.execute(
-            """
-            UPDATE sessions
-            SET remaining_cards = $1,
-                passed_cards = $2,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = $3
-            """,
-            json.dumps(remaining),
-            json.dumps(passed),
-            session_id
+            "UPDATE session_cards SET state = 'remaining', position = $3 "
+            "WHERE session_id = $1 AND card_id = $2 AND state = 'passed'",
+            session["id"], request.card_id, row["card_seq"]
         )
 
-        # Получаем обновленную сессию
-        updated_row = await conn.fetchrow("SELECT * FROM sessions WHERE id = $1", session_id)
-        updated = dict(updated_row)
+    updated, _ = await mutate_session(db, redis_client, session_id, restore)
 
-        # Формируем ответ
-        updated["remainingCards"] = remaining
-        updated["passedCards"] = passed
+    # Формируем ответ
+    updated["remainingCards"] = parse_json_field(updated["remaining_cards"])
+    updated["passedCards"] = parse_json_field(updated["passed_cards"])
 
-        return updated
+    await session_events.publish(redis_client, session_events.session_delta(
+        "restore", updated, card_id=request.card_id
+    ))
+    return updated
 
@@ -0,0 +1,59 @@
+"""
+JSON in and out of the API without the generic encoders.
+
+`init_connection()` is the asyncpg pool `init` hook: it registers orjson
+codecs for json/jsonb, so `metadata`, the session card lists and the
+payloads of the session_* SQL functions arrive as Python objects and jsonb
+parameters are passed as plain dicts/lists (never pre-encoded strings).
+
+`FastJSONResponse` is the app's default response class. Handlers on hot
+paths return it directly, which skips FastAPI's `jsonable_encoder` pass:
+orjson writes dicts, lists, UUIDs and datetimes itself, and asyncpg records
+are converted while serializing instead of being copied into dicts first.
+"""
+from decimal import Decimal
+
+import asyncpg
+import orjson
+from fastapi.responses import Response
+
+# jsonb binary format: a version byte followed by the JSON text
+_JSONB_VERSION = b"\x01"
+
+
+def _encode_jsonb(value) -> bytes:
+    return _JSONB_VERSION + orjson.dumps(value)
+
+
+def _decode_jsonb(data: bytes):
+    return orjson.loads(data[1:])
+
+
+async def init_connection(conn):
+    await conn.set_type_codec(
+        "jsonb", schema="pg_catalog", format="binary",
+        encoder=_encode_jsonb, decoder=_decode_jsonb,
+    )
+    await conn.set_type_codec(
+        "json", schema="pg_catalog", format="binary",
+        encoder=orjson.dumps, decoder=orjson.loads,
+    )
+
+
+def _default(value):
+    if isinstance(value, asyncpg.Record):
+        return dict(value.items())
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
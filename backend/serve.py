@@ -0,0 +1,76 @@
+"""
+Production entry point: python serve.py
+
+Runs WEB_CONCURRENCY worker processes (default: one per CPU) on one
+listening socket. Each worker builds its own app (main.create_app), so it
+has its own event loop, database pool, Redis client and in-process caches;
+DB_POOL_MAX_SIZE is per worker, so Postgres sees up to
+WEB_CONCURRENCY * DB_POOL_MAX_SIZE connections. The event loop is uvloop
+and the HTTP parser httptools (UVICORN_LOOP / UVICORN_HTTP to change).
+
+Graceful drain on SIGTERM/SIGINT: a worker stops accepting connections,
+ends its SSE streams (clients reconnect elsewhere), waits up to
+GRACEFUL_TIMEOUT seconds for the requests in flight, then runs the
+lifespan shutdown (queued votes are flushed, pools closed).
+"""
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+from uvicorn.supervisors import Multiprocess
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "3001"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "uvloop")
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "httptools")
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "5"))
+LISTEN_BACKLOG = int(os.getenv("LISTEN_BACKLOG", "2048"))
+# Proxies whose X-Forwarded-* headers are trusted (comma-separated, * = all)
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+ACCESS_LOG = os.getenv("ACCESS_LOG", "0").lower() in ("1", "true", "yes", "on")
+
+
+class DrainingServer(uvicorn.Server):
+    async def shutdown(self, sockets=None):
+        # Long-lived SSE responses would hold the drain until GRACEFUL_TIMEOUT
+        import session_events
+        session_events.hub.close_all()
+        await super().shutdown(sockets=sockets)
+
+
+def config() -> uvicorn.Config:
+    return uvicorn.Config(
+        "main:create_app",
+        factory=True,
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop=UVICORN_LOOP,
+        http=UVICORN_HTTP,
+        lifespan="on",
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        backlog=LISTEN_BACKLOG,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        access_log=ACCESS_LOG,
+    )
+
+
+def main():
+    server_config = config()
+    server = DrainingServer(server_config)
+    if server_config.workers > 1:
+        # Same as `uvicorn --workers N`, with our Server class in every worker
+        socket = server_config.bind_socket()
+        Multiprocess(server_config, target=server.run, sockets=[socket]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
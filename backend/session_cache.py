@@ -0,0 +1,119 @@
+"""
+Redis write-through cache for live session rows.
+
+Routes read a session via `get()` before touching Postgres and push every
+freshly written row back with `put()`. Entries expire after
+SESSION_CACHE_TTL seconds, and each entry carries the row's `version`
+(sessions.version, bumped on every update) so a slow writer can never
+replace a newer row with an older one.
+Any Redis error is swallowed and the caller falls back to Postgres.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+import orjson
+
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "3600"))
+# Bump when the cached row layout changes so old entries are simply ignored
+SESSION_CACHE_SCHEMA = "v6"
+# After a Redis failure, skip the cache for this many seconds instead of
+# paying a connect timeout on every request
+SESSION_CACHE_BACKOFF = float(os.getenv("SESSION_CACHE_BACKOFF", "10"))
+
+_disabled_until = 0.0
+
+# Store the row only if it is at least as new as the cached one
+_PUT_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'v') or '-1')
+if tonumber(ARGV[1]) >= current then
+    redis.call('HSET', KEYS[1], 'v', ARGV[1], 'd', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def _key(session_id) -> str:
+    return f"pickme:{SESSION_CACHE_SCHEMA}:session:{session_id}"
+
+
+def _available(redis_client) -> bool:
+    return redis_client is not None and time.monotonic() >= _disabled_until
+
+
+def _mark_failed(e: Exception):
+    global _disabled_until
+    _disabled_until = time.monotonic() + SESSION_CACHE_BACKOFF
+    print(f"Session cache unavailable, falling back to database: {e}")
+
+
+def _version(session: dict) -> int:
+    if isinstance(session.get("version"), int):
+        return session["version"]
+    # Payloads without the column (e.g. compact decisions) fall back to updated_at
+    updated_at = session.get("updated_at")
+    if isinstance(updated_at, datetime):
+        return int(updated_at.timestamp() * 1_000_000)
+    return 0
+
+
+def encode(session: dict) -> bytes:
+    return orjson.dumps(session)
+
+
+def restore_timestamps(session: dict) -> dict:
+    """JSON carries timestamps as strings; the version needs datetimes back."""
+    for field in ("created_at", "updated_at"):
+        if isinstance(session.get(field), str):
+            session[field] = datetime.fromisoformat(session[field])
+    return session
+
+
+def decode(payload) -> dict:
+    return restore_timestamps(orjson.loads(payload))
+
+
+async def get(redis_client, session_id) -> Optional[dict]:
+    if not _available(redis_client):
+        return None
+    try:
+        payload = await redis_client.hget(_key(session_id), "d")
+    except Exception as e:
+        _mark_failed(e)
+        return None
+    if payload is None:
+        return None
+    return decode(payload)
+
+
+async def put(redis_client, session: dict):
+    if not _available(redis_client) or not session:
+        return
+    try:
+        await redis_client.eval(
+            _PUT_SCRIPT, 1, _key(session["id"]),
+            _version(session), encode(session), SESSION_CACHE_TTL
+        )
+    except Exception as e:
+        _mark_failed(e)
+
+
+async def invalidate(redis_client, session_id):
+    if not _available(redis_client):
+        return
+    try:
+        await redis_client.delete(_key(session_id))
+    except Exception as e:
+        _mark_failed(e)
+
+
+async def invalidate_many(redis_client, session_ids):
+    if not session_ids or not _available(redis_client):
+        return
+    try:
+        await redis_client.delete(*(_key(session_id) for session_id in session_ids))
+    except Exception as e:
+        _mark_failed(e)
@@ -0,0 +1,154 @@
+"""
+Push of session state deltas to connected clients (SSE, see
+GET /sessions/{id}/events).
+
+Writers call `publish()` after their change is committed. The delta goes
+to a Redis channel per session; every uvicorn worker runs
+`listen_for_events()` (one pattern subscription per worker, started in the
+lifespan) and hands each message to the local subscriber queues in `hub`.
+Without Redis, deltas are delivered to this worker's subscribers only.
+
+A subscriber that falls behind (full queue) or misses messages while the
+pub/sub link is down gets a `resync` event and should reload the state.
+When the worker shuts down, `hub.close_all()` ends every stream, so the
+graceful drain does not wait on them; EventSource reconnects by itself
+(to another worker) and starts from a new snapshot.
+"""
+import asyncio
+import os
+from typing import Dict, Set
+
+import orjson
+
+SESSION_EVENTS_QUEUE_SIZE = int(os.getenv("SESSION_EVENTS_QUEUE_SIZE", "100"))
+SESSION_EVENTS_KEEPALIVE = float(os.getenv("SESSION_EVENTS_KEEPALIVE", "15"))
+CHANNEL_PREFIX = "pickme:session-events:"
+
+RESYNC = {"type": "resync"}
+# Internal: tells a stream to end, never sent to the client
+CLOSED = {"type": "closed"}
+
+
+class SessionEventHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, session_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(session_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(session_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[session_id]
+
+    def dispatch(self, session_id: str, event: dict):
+        for queue in self._subscribers.get(session_id, ()):
+            self._offer(queue, event)
+
+    def resync_all(self):
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._offer(queue, RESYNC)
+
+    def close_all(self):
+        for queues in self._subscribers.values():
+            for queue in queues:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(CLOSED)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+    def _offer(self, queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+            self.delivered += 1
+        except asyncio.QueueFull:
+            # The client is too slow: drop its backlog, it reloads the state instead
+            self.overflows += 1
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+
+hub = SessionEventHub(SESSION_EVENTS_QUEUE_SIZE)
+
+
+def session_delta(action: str, session: dict, **extra) -> dict:
+    """`update` event: what happened, status, mode and list counts (compact payloads already carry counts)."""
+    counts = session.get("counts")
+    if counts is None:
+        counts = {
+            "remaining": len(session.get("remaining_cards") or []),
+            "passed": len(session.get("passed_cards") or []),
+            "smashed": len(session.get("smashed_cards") or []),
+        }
+    delta = {
+        "type": "update",
+        "action": action,
+        "session_id": str(session["id"]),
+        "status": session.get("status"),
+        "mode": session.get("mode"),
+        "version": session.get("version"),
+        "updated_at": session.get("updated_at"),
+        "counts": counts,
+    }
+    delta.update(extra)
+    return delta
+
+
+async def publish(redis_client, event: dict):
+    session_id = event["session_id"]
+    hub.published += 1
+    if redis_client is None:
+        hub.dispatch(session_id, event)
+        return
+    try:
+        await redis_client.publish(CHANNEL_PREFIX + session_id, orjson.dumps(event))
+    except Exception as e:
+        print(f"Session event publish failed (delivering locally): {e}")
+        hub.dispatch(session_id, event)
+
+
+async def listen_for_events(redis_client, retry_delay: float = 5.0):
+    """Delivers deltas published by any worker to local subscribers until cancelled."""
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+            # Deltas may have been missed while disconnected
+            hub.resync_all()
+            async for message in pubsub.listen():
+                if message.get("type") != "pmessage":
+                    continue
+                session_id = message["channel"][len(CHANNEL_PREFIX):]
+                hub.dispatch(session_id, orjson.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Session event listener error (retrying): {e}")
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(retry_delay)
+
+
+def format_sse(event: dict) -> bytes:
+    return f"event: {event['type']}\ndata: ".encode() + orjson.dumps(event) + b"\n\n"
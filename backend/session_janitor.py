@@ -0,0 +1,132 @@
+"""
+Background cleanup of abandoned sessions, started in the lifespan.
+
+Every SESSION_JANITOR_INTERVAL seconds:
+- expire: unfinished sessions without activity (updated_at) for
+  SESSION_IDLE_DAYS are finished and get expired_at, so they stop being a
+  deck's "active" session and every finished-session rule applies to them;
+- compact: SESSION_COMPACT_DAYS after expiry their session_cards rows (one
+  per deck card, the bulk of a session) are deleted and compacted_at is set.
+  The session row and its votes stay.
+
+Work is done in batches of SESSION_JANITOR_BATCH rows with
+SESSION_JANITOR_PAUSE seconds between batches and at most
+SESSION_JANITOR_MAX_BATCHES batches per step and pass, so a backlog is
+worked off gradually. Rows locked by a request are skipped (SKIP LOCKED),
+and one worker runs a batch at a time (transaction-level advisory lock; a
+worker that finds it taken leaves the step to the holder). Each batch takes
+its own pooled connection and gives it back before the pause, so the janitor
+holds no admission slot while it sleeps. With session shards (shards.py)
+each node is cleaned in turn, under its own lock.
+"""
+import asyncio
+import os
+
+import admission
+import session_cache
+
+SESSION_IDLE_DAYS = int(os.getenv("SESSION_IDLE_DAYS", "30"))
+SESSION_COMPACT_DAYS = int(os.getenv("SESSION_COMPACT_DAYS", "7"))
+SESSION_JANITOR_INTERVAL = float(os.getenv("SESSION_JANITOR_INTERVAL", "600"))
+SESSION_JANITOR_BATCH = int(os.getenv("SESSION_JANITOR_BATCH", "500"))
+SESSION_JANITOR_PAUSE = float(os.getenv("SESSION_JANITOR_PAUSE", "1.0"))
+SESSION_JANITOR_MAX_BATCHES = int(os.getenv("SESSION_JANITOR_MAX_BATCHES", "20"))
+
+JANITOR_LOCK_SQL = "SELECT pg_try_advisory_xact_lock(hashtext('session_janitor'))"
+
+# updated_at is left alone: it stays the time of the last real activity
+EXPIRE_SQL = """
+WITH batch AS (
+    SELECT id FROM sessions
+    WHERE status != 'finished'
+      AND updated_at < CURRENT_TIMESTAMP - make_interval(days => $1)
+    ORDER BY updated_at
+    LIMIT $2
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE sessions s
+SET status = 'finished', expired_at = CURRENT_TIMESTAMP
+FROM batch
+WHERE s.id = batch.id
+RETURNING s.id
+"""
+
+COMPACT_SQL = """
+WITH batch AS (
+    SELECT id FROM sessions
+    WHERE expired_at IS NOT NULL AND compacted_at IS NULL
+      AND expired_at < CURRENT_TIMESTAMP - make_interval(days => $1)
+    ORDER BY expired_at
+    LIMIT $2
+    FOR UPDATE SKIP LOCKED
+), cleared AS (
+    DELETE FROM session_cards sc USING batch WHERE sc.session_id = batch.id
+)
+UPDATE sessions s
+SET compacted_at = CURRENT_TIMESTAMP
+FROM batch
+WHERE s.id = batch.id
+RETURNING s.id
+"""
+
+
+class SessionJanitor:
+    def __init__(self):
+        self.passes = 0
+        self.expired = 0
+        self.compacted = 0
+        self.last_pass_ms = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "passes": self.passes,
+            "expired": self.expired,
+            "compacted": self.compacted,
+            "last_pass_ms": round(self.last_pass_ms, 2),
+        }
+
+    async def run_pass(self, pool, redis_client):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.expired += await self._batches(pool, redis_client, EXPIRE_SQL, SESSION_IDLE_DAYS)
+        self.compacted += await self._batches(pool, redis_client, COMPACT_SQL, SESSION_COMPACT_DAYS)
+        self.passes += 1
+        self.last_pass_ms = (loop.time() - started) * 1000
+
+    async def run(self, pools, redis_client):
+        """Background loop over the session nodes' pools; errors are logged and the next pass tries again."""
+        admission.set_priority(admission.LOW)
+        while True:
+            for pool in pools:
+                try:
+                    await self.run_pass(pool, redis_client)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Session janitor pass failed: {e}")
+            await asyncio.sleep(SESSION_JANITOR_INTERVAL)
+
+    async def _batch(self, pool, query: str, days: int):
+        """One batch in its own transaction; None if another worker holds the lock."""
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval(JANITOR_LOCK_SQL):
+                    return None
+                return await conn.fetch(query, days, SESSION_JANITOR_BATCH)
+
+    async def _batches(self, pool, redis_client, query: str, days: int) -> int:
+        done = 0
+        for batch in range(SESSION_JANITOR_MAX_BATCHES):
+            if batch:
+                await asyncio.sleep(SESSION_JANITOR_PAUSE)
+            rows = await self._batch(pool, query, days)
+            if rows is None:
+                break
+            await session_cache.invalidate_many(redis_client, [row["id"] for row in rows])
+            done += len(rows)
+            if len(rows) < SESSION_JANITOR_BATCH:
+                break
+        return done
+
+
+janitor = SessionJanitor()
@@ -0,0 +1,319 @@
+"""
+Session shards: sessions, their session_cards and votes spread over several
+Postgres nodes by consistent hashing of the session id.
+
+The catalog database (the main pool: decks, cards, users) is the node
+"main"; SESSION_SHARDS adds more nodes as comma-separated
+`name=host:port[/database]` (user and password are the catalog's), e.g.
+    SESSION_SHARDS=shard1=postgres-shard1:5432,shard2=postgres-shard2:5432
+Every node runs the full schema (db/init.sql). Each node takes
+SESSION_SHARD_VNODES points on the ring, placed by the hash of its name, so
+adding or removing a node only remaps the sessions next to its points.
+With SESSION_SHARDS_INCLUDE_MAIN=0 the catalog takes no new sessions.
+Without SESSION_SHARDS there is one node and everything stays on the main
+pool, as before.
+
+The session SQL (session_decide() and friends) joins the deck's cards and
+the foreign keys point at decks/cards, so a node keeps a mirror of the
+decks its sessions use: `mirror_deck()` copies the deck and card rows from
+the catalog when the node's decks.cards_version differs (the cards
+triggers bump it on every card change). Sessions are created after their
+deck is mirrored, and card writes re-sync the nodes that have the deck.
+The users row of a session's user is copied the same way (sessions.user_id
+is a foreign key).
+Card and deck endpoints keep reading the catalog.
+
+Rebalancing (python -m jobs.rebalance_sessions) moves every session whose
+ring owner changed to its new node. While it runs, set
+SESSION_SHARDS_MIGRATING=1: a session not found on its owner is then
+looked up on the other nodes. A request that hits a session in the moment
+it moves can still get a 404; clients retry.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+import database
+
+MAIN_NODE = "main"
+SESSION_SHARDS = os.getenv("SESSION_SHARDS", "")
+SESSION_SHARD_VNODES = int(os.getenv("SESSION_SHARD_VNODES", "64"))
+SESSION_SHARDS_INCLUDE_MAIN = os.getenv("SESSION_SHARDS_INCLUDE_MAIN", "1").lower() in ("1", "true", "yes", "on")
+SESSION_SHARDS_MIGRATING = os.getenv("SESSION_SHARDS_MIGRATING", "0").lower() in ("1", "true", "yes", "on")
+
+SESSION_EXISTS_SQL = "SELECT EXISTS (SELECT 1 FROM sessions WHERE id = $1)"
+MIRROR_VERSION_SQL = "SELECT cards_version FROM decks WHERE id = $1"
+
+# The mirror deck has no owner: users are not mirrored, and nothing on a
+# node reads decks.user_id
+MIRROR_DECK_SQL = """
+INSERT INTO decks (id, title, description, privacy, created_at, updated_at)
+VALUES ($1, $2, $3, $4, $5, $6)
+ON CONFLICT (id) DO UPDATE
+SET title = EXCLUDED.title, description = EXCLUDED.description, privacy = EXCLUDED.privacy,
+    updated_at = EXCLUDED.updated_at
+"""
+MIRROR_CARDS_SQL = """
+INSERT INTO cards (id, deck_id, title, description, image_url, metadata, position, created_at, updated_at)
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+ON CONFLICT (id) DO UPDATE
+SET title = EXCLUDED.title, description = EXCLUDED.description, image_url = EXCLUDED.image_url,
+    metadata = EXCLUDED.metadata, position = EXCLUDED.position, updated_at = EXCLUDED.updated_at
+"""
+MIRROR_USER_SQL = """
+INSERT INTO users (id, email, display_name, provider, created_at, updated_at)
+SELECT $1, $2, $3, $4, $5, $6
+ON CONFLICT (id) DO NOTHING
+"""
+MIRROR_CARD_COLUMNS = ["id", "deck_id", "title", "description", "image_url", "metadata", "position", "created_at", "updated_at"]
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def session_key(session_id) -> str:
+    """The same ring position for every spelling of a UUID."""
+    try:
+        return str(uuid.UUID(str(session_id)))
+    except ValueError:
+        return str(session_id)
+
+
+class HashRing:
+    """Consistent hashing: a key belongs to the first node point at or after its hash."""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = SESSION_SHARD_VNODES):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+        self.nodes = sorted(set(self._nodes))
+
+    def node(self, key: str) -> str:
+        index = bisect.bisect_left(self._hashes, _hash(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+def parse_shards(spec: str = SESSION_SHARDS) -> Dict[str, dict]:
+    """SESSION_SHARDS -> {name: connect kwargs}."""
+    nodes = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, address = entry.partition("=")
+        if not address or name == MAIN_NODE:
+            raise ValueError(f"SESSION_SHARDS: expected name=host:port[/database], got {entry!r}")
+        settings = database.connect_kwargs()
+        address, _, dbname = address.partition("/")
+        host, _, port = address.partition(":")
+        settings["host"] = host
+        if port:
+            settings["port"] = int(port)
+        if dbname:
+            settings["database"] = dbname
+        nodes[name.strip()] = settings
+    return nodes
+
+
+def node_settings() -> Dict[str, dict]:
+    """Connect kwargs of every node, the catalog first (for the jobs)."""
+    return {MAIN_NODE: database.connect_kwargs(), **parse_shards()}
+
+
+def build_ring(names: Iterable[str]) -> HashRing:
+    names = list(names)
+    if SESSION_SHARDS_INCLUDE_MAIN or len(names) == 1:
+        return HashRing(names)
+    return HashRing(name for name in names if name != MAIN_NODE)
+
+
+async def read_deck(catalog_conn, deck_id):
+    """The catalog's deck row and card rows, or None if the deck was deleted."""
+    deck = await catalog_conn.fetchrow("SELECT * FROM decks WHERE id = $1", deck_id)
+    if deck is None:
+        return None
+    cards = await catalog_conn.fetch(
+        f"SELECT {', '.join(MIRROR_CARD_COLUMNS)} FROM cards WHERE deck_id = $1", deck_id
+    )
+    return deck, cards
+
+
+async def write_deck(node_conn, deck_id, snapshot, force: bool = False) -> bool:
+    """Applies a read_deck() snapshot to the node's copy; True if copied."""
+    if snapshot is None:
+        # Deleted in the catalog: the cascade takes the node's sessions with it
+        await node_conn.execute("DELETE FROM decks WHERE id = $1", deck_id)
+        return False
+    deck, cards = snapshot
+    async with node_conn.transaction():
+        # Concurrent syncs of the same deck: an older snapshot never replaces a newer one
+        current = await node_conn.fetchval(MIRROR_VERSION_SQL + " FOR UPDATE", deck_id)
+        if current is not None and (current > deck["cards_version"] or (current == deck["cards_version"] and not force)):
+            return False
+        await node_conn.execute(
+            MIRROR_DECK_SQL, deck["id"], deck["title"], deck["description"], deck["privacy"],
+            deck["created_at"], deck["updated_at"],
+        )
+        await node_conn.execute(
+            "DELETE FROM cards WHERE deck_id = $1 AND NOT (id = ANY($2::uuid[]))",
+            deck_id, [card["id"] for card in cards],
+        )
+        if cards:
+            # One statement per card, sent as a pipeline; the cards triggers still run once per row
+            await node_conn.executemany(MIRROR_CARDS_SQL, [tuple(card) for card in cards])
+        # After the cards triggers, which bump the node's own counter
+        await node_conn.execute("UPDATE decks SET cards_version = $2 WHERE id = $1", deck_id, deck["cards_version"])
+    return True
+
+
+async def mirror_deck(catalog_conn, node_conn, deck_id, force: bool = False) -> bool:
+    """Brings the node's copy of the deck and its cards up to the catalog; True if copied."""
+    return await write_deck(node_conn, deck_id, await read_deck(catalog_conn, deck_id), force)
+
+
+async def read_user(catalog_conn, user_id):
+    if user_id is None:
+        return None
+    return await catalog_conn.fetchrow("SELECT * FROM users WHERE id = $1", user_id)
+
+
+async def write_user(node_conn, user) -> bool:
+    """Copies the users row a session on the node refers to; True if it was missing there."""
+    if user is None:
+        return False
+    result = await node_conn.execute(
+        MIRROR_USER_SQL, user["id"], user["email"], user["display_name"], user["provider"],
+        user["created_at"], user["updated_at"],
+    )
+    return result != "INSERT 0 0"
+
+
+async def mirror_user(catalog_conn, node_conn, user_id) -> bool:
+    return await write_user(node_conn, await read_user(catalog_conn, user_id))
+
+
+class ShardRouter:
+    def __init__(self):
+        self.main = None
+        self.pools: Dict[str, database.Pool] = {}
+        self.ring: Optional[HashRing] = None
+        self.routed: Dict[str, int] = {}
+        self.probes = 0
+        self.mirrored = 0
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.pools) > 1
+
+    async def start(self, main_pool, prepared_queries: Iterable[str] = (), server_settings: dict = None):
+        self.main = main_pool
+        self.pools = {MAIN_NODE: main_pool}
+        prepared_queries = list(prepared_queries)
+        for name, settings in parse_shards().items():
+            self.pools[name] = await database.create_pool(prepared_queries, server_settings, connect=settings)
+        self.ring = build_ring(self.pools)
+        self.routed = {name: 0 for name in self.pools}
+        if self.sharded:
+            print(f"Session shards: {', '.join(self.ring.nodes)}{' (migrating)' if SESSION_SHARDS_MIGRATING else ''}")
+
+    async def stop(self):
+        for name, pool in self.pools.items():
+            if name != MAIN_NODE:
+                await pool.close()
+        self.pools = {MAIN_NODE: self.main} if self.main is not None else {}
+
+    def owner(self, session_id) -> str:
+        if not self.sharded:
+            return MAIN_NODE
+        return self.ring.node(session_key(session_id))
+
+    async def locate(self, session_id) -> str:
+        """Node that holds the session: its owner, or where it still is during a migration."""
+        name = self.owner(session_id)
+        if self.sharded and SESSION_SHARDS_MIGRATING:
+            try:
+                key = uuid.UUID(str(session_id))
+            except ValueError:
+                return name
+            for candidate in [name] + [other for other in self.pools if other != name]:
+                self.probes += 1
+                if await self.pools[candidate].fetchval(SESSION_EXISTS_SQL, key):
+                    name = candidate
+                    break
+        self.routed[name] = self.routed.get(name, 0) + 1
+        return name
+
+    async def pool_for(self, session_id):
+        return self.pools[await self.locate(session_id)]
+
+    def items(self) -> List[Tuple[str, "database.Pool"]]:
+        return list(self.pools.items())
+
+    async def gather(self, query: str, *args, include_main: bool = True) -> List[Tuple[str, "asyncpg.Record"]]:
+        """(node, row) for the rows of one query run on every node at once, catalog first."""
+        names = [name for name in self.pools if include_main or name != MAIN_NODE]
+        results = await asyncio.gather(*(self.pools[name].fetch(query, *args) for name in names))
+        return [(name, row) for name, rows in zip(names, results) for row in rows]
+
+    async def ensure_deck(self, name: str, deck_id, user_id=None) -> bool:
+        """Mirrors the deck (and the session's user) onto a node before a session is created there."""
+        if name == MAIN_NODE:
+            return False
+        copied = await self._mirror(name, deck_id, user_id=user_id)
+        self.mirrored += copied
+        return copied
+
+    async def sync_decks(self, deck_ids: Iterable):
+        """
+        After card/deck writes: refreshes the nodes that hold a copy of these
+        decks. Call it after the write's own connection is released.
+        """
+        if not self.sharded:
+            return
+        for deck_id in set(deck_ids):
+            for name in self.pools:
+                if name == MAIN_NODE:
+                    continue
+                try:
+                    self.mirrored += await self._mirror(name, deck_id, only_present=True)
+                except Exception as e:
+                    # The next session created there re-syncs by cards_version
+                    print(f"Deck {deck_id} mirror on {name} failed: {e}")
+
+    async def _mirror(self, name: str, deck_id, only_present: bool = False, user_id=None) -> bool:
+        # One connection at a time: a catalog connection is never held while
+        # waiting for a node connection (or the other way around), so a
+        # saturated pool cannot make mirror calls wait on each other
+        pool = self.pools[name]
+        async with pool.acquire() as node_conn:
+            version = await node_conn.fetchval(MIRROR_VERSION_SQL, deck_id)
+        if only_present and version is None:
+            return False
+        async with self.main.acquire() as catalog_conn:
+            # Up to date: the cards are not read at all
+            current = version is not None and version == await catalog_conn.fetchval(MIRROR_VERSION_SQL, deck_id)
+            snapshot = None if current else await read_deck(catalog_conn, deck_id)
+            user = await read_user(catalog_conn, user_id)
+        if current and user is None:
+            return False
+        async with pool.acquire() as node_conn:
+            await write_user(node_conn, user)
+            if current:
+                return False
+            return await write_deck(node_conn, deck_id, snapshot)
+
+    def stats(self) -> dict:
+        return {
+            "nodes": self.ring.nodes if self.ring else [MAIN_NODE],
+            "migrating": SESSION_SHARDS_MIGRATING,
+            "routed": self.routed,
+            "probes": self.probes,
+            "mirrored_decks": self.mirrored,
+            "pools": {name: database.stats(pool) for name, pool in self.pools.items() if name != MAIN_NODE},
+        }
+
+
+router = ShardRouter()
@@ -0,0 +1,58 @@
+"""
+Unit tests for the pure parts of the backend; no Postgres or Redis needed.
+
+Run from backend/ (pip install -r requirements-dev.txt): python -m pytest -q
+
+The tests of the SQL functions in db/init.sql (the `database` fixture) run
+against a throwaway database created on the server of TEST_DATABASE_URL
+and are skipped without it (make test-db).
+"""
+import asyncio
+import os
+import sys
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+INIT_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db", "init.sql")
+
+
+@pytest.fixture(scope="session")
+def database():
+    """DSN of a fresh database with db/init.sql applied, dropped after the run."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    name = f"pickme_test_{uuid.uuid4().hex[:12]}"
+    dsn = urlunsplit(urlsplit(TEST_DATABASE_URL)._replace(path=f"/{name}"))
+
+    async def create():
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await admin.execute(f'CREATE DATABASE "{name}"')
+        finally:
+            await admin.close()
+        conn = await asyncpg.connect(dsn)
+        try:
+            with open(INIT_SQL) as f:
+                await conn.execute(f.read())
+        finally:
+            await conn.close()
+
+    async def drop():
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        finally:
+            await admin.close()
+
+    asyncio.run(create())
+    try:
+        yield dsn
+    finally:
+        asyncio.run(drop())
@@ -0,0 +1,121 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import admission
+
+
+def controller(capacity=4, wait=1.0):
+    ctrl = admission.AdmissionController(capacity)
+    ctrl.limits = {admission.HIGH: capacity, admission.NORMAL: capacity - 1, admission.LOW: 1}
+    ctrl.waits = {priority: wait for priority in admission.PRIORITIES}
+    return ctrl
+
+
+def test_limits_per_priority():
+    async def scenario():
+        ctrl = controller(wait=0.01)
+        await ctrl.enter(admission.LOW)
+        # Low may only hold one slot
+        with pytest.raises(admission.Overloaded):
+            await ctrl.enter(admission.LOW)
+        await ctrl.enter(admission.NORMAL)
+        await ctrl.enter(admission.NORMAL)
+        # Normal may not take the slot reserved for high
+        with pytest.raises(admission.Overloaded):
+            await ctrl.enter(admission.NORMAL)
+        await ctrl.enter(admission.HIGH)
+        assert ctrl.in_use == 4
+
+    asyncio.run(scenario())
+
+
+def test_freed_slot_goes_to_highest_priority_first():
+    async def scenario():
+        ctrl = controller(capacity=1)
+        ctrl.limits = {priority: 1 for priority in admission.PRIORITIES}
+        await ctrl.enter(admission.HIGH)
+
+        order = []
+
+        async def request(priority):
+            await ctrl.enter(priority)
+            order.append(priority)
+            ctrl.leave()
+
+        tasks = []
+        for priority in (admission.LOW, admission.NORMAL, admission.HIGH, admission.NORMAL):
+            tasks.append(asyncio.create_task(request(priority)))
+            await asyncio.sleep(0)
+        assert ctrl.waiting == 4
+
+        ctrl.leave()
+        await asyncio.gather(*tasks)
+        assert order == [admission.HIGH, admission.NORMAL, admission.NORMAL, admission.LOW]
+        assert ctrl.in_use == 0
+
+    asyncio.run(scenario())
+
+
+def test_lower_priority_does_not_overtake_a_waiter():
+    async def scenario():
+        ctrl = controller(capacity=2)
+        ctrl.limits = {admission.HIGH: 2, admission.NORMAL: 1, admission.LOW: 1}
+        await ctrl.enter(admission.NORMAL)
+        waiter = asyncio.create_task(ctrl.enter(admission.NORMAL))
+        await asyncio.sleep(0)
+        # A free slot exists for high only; low must queue behind the normal waiter
+        ctrl.waits[admission.LOW] = 0.01
+        with pytest.raises(admission.Overloaded):
+            await ctrl.enter(admission.LOW)
+        ctrl.leave()
+        await waiter
+        assert ctrl.in_use == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_full_rejects_all_but_high(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUE", 1)
+
+    async def scenario():
+        ctrl = controller(capacity=1)
+        ctrl.limits = {priority: 1 for priority in admission.PRIORITIES}
+        await ctrl.enter(admission.HIGH)
+        waiter = asyncio.create_task(ctrl.enter(admission.NORMAL))
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Overloaded) as error:
+            await ctrl.enter(admission.NORMAL)
+        assert error.value.reason == "queue full"
+        high = asyncio.create_task(ctrl.enter(admission.HIGH))
+        await asyncio.sleep(0)
+        assert ctrl.waiting == 2
+        ctrl.leave()
+        await high
+        ctrl.leave()
+        await waiter
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_is_a_503_with_retry_after():
+    ctrl = controller(capacity=1, wait=0.01)
+    app = FastAPI()
+
+    @app.get("/busy")
+    async def busy():
+        await ctrl.enter(admission.NORMAL)
+        return {}
+
+    async def scenario():
+        ctrl.limits[admission.NORMAL] = 0
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/busy")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER)
+    assert "busy" in response.json()["detail"]
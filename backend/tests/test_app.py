@@ -0,0 +1,22 @@
+import main
+import serialization
+import serve
+
+
+def test_every_call_builds_a_separate_app():
+    first, second = main.create_app(), main.create_app()
+    assert first is not second
+    assert first.state.db_pool is None and first.state.redis_client is None
+    assert first.router.default_response_class is serialization.FastJSONResponse
+
+    paths = {route.path for route in first.routes}
+    assert {"/health", "/metrics", "/api/v1/decks/summary", "/api/v1/sessions/{session_id}/events"} <= paths
+
+
+def test_server_config_loads_the_app_factory_in_each_worker(monkeypatch):
+    monkeypatch.setattr(serve, "WEB_CONCURRENCY", 4)
+    config = serve.config()
+    assert config.app == "main:create_app" and config.factory
+    assert config.workers == 4
+    assert config.lifespan == "on"
+    assert config.timeout_graceful_shutdown == serve.GRACEFUL_TIMEOUT
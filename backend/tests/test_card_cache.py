@@ -0,0 +1,108 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+import card_cache
+
+DECK = str(uuid.uuid4())
+OTHER_DECK = str(uuid.uuid4())
+
+
+def card(deck_id=DECK, title="card"):
+    return {"id": uuid.uuid4(), "deck_id": uuid.UUID(deck_id), "title": title}
+
+
+class CardsConn:
+    """Serves CARDS_BY_ID_SQL from a dict; `during_fetch` runs while the query is in flight."""
+
+    def __init__(self, cards, during_fetch=None):
+        self.cards = {str(c["id"]): c for c in cards}
+        self.during_fetch = during_fetch
+        self.fetches = 0
+
+    async def fetch(self, query, ids):
+        assert query == card_cache.CARDS_BY_ID_SQL
+        self.fetches += 1
+        if self.during_fetch is not None:
+            self.during_fetch()
+        return [self.cards[str(card_id)] for card_id in ids if str(card_id) in self.cards]
+
+
+class Publisher:
+    def __init__(self):
+        self.messages = []
+
+    async def publish(self, channel, message):
+        self.messages.append((channel, json.loads(message)))
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(card_cache, "cache", card_cache.CardCache(max_cards=3, ttl=60))
+
+
+def test_reads_through_and_keeps_order():
+    cards = [card(title=str(n)) for n in range(3)]
+    conn = CardsConn(cards)
+    ids = [c["id"] for c in reversed(cards)] + ["not-a-uuid", uuid.uuid4()]
+    assert [c["title"] for c in asyncio.run(card_cache.get_cards(conn, ids))] == ["2", "1", "0"]
+    assert [c["title"] for c in asyncio.run(card_cache.get_cards(conn, ids))] == ["2", "1", "0"]
+    # Known cards come from the cache; only the unknown ID is looked up again
+    assert conn.fetches == 2
+    assert card_cache.cache.hits == 3
+
+
+def test_card_and_deck_invalidation():
+    first, second, other = card(), card(), card(OTHER_DECK)
+    conn = CardsConn([first, second, other])
+    asyncio.run(card_cache.get_cards(conn, [first["id"], second["id"], other["id"]]))
+
+    card_cache.cache.invalidate(card_ids=[str(first["id"])])
+    assert card_cache.cache.get(str(first["id"])) is None
+    assert card_cache.cache.get(str(second["id"])) is not None
+
+    card_cache.cache.invalidate(deck_ids=[DECK])
+    assert card_cache.cache.get(str(second["id"])) is None
+    assert card_cache.cache.get(str(other["id"])) is not None
+
+
+def test_invalidation_is_published_to_other_workers():
+    c = card()
+    redis_client = Publisher()
+    asyncio.run(card_cache.get_cards(CardsConn([c]), [c["id"]]))
+    asyncio.run(card_cache.invalidate(redis_client, card_ids=[c["id"]], deck_ids=[DECK]))
+    assert card_cache.cache.get(str(c["id"])) is None
+    channel, message = redis_client.messages[0]
+    assert channel == card_cache.INVALIDATION_CHANNEL
+    assert message == {"origin": card_cache.WORKER_ID, "cards": [str(c["id"])], "decks": [DECK]}
+
+
+def test_invalidation_during_fetch_does_not_cache_the_old_row():
+    c = card(title="old")
+    conn = CardsConn([c], during_fetch=lambda: card_cache.cache.invalidate(deck_ids=[DECK]))
+    assert asyncio.run(card_cache.get_cards(conn, [c["id"]]))[0]["title"] == "old"
+    assert card_cache.cache.get(str(c["id"])) is None
+    assert card_cache.cache.stale_fills == 1
+
+    # The next read, with no invalidation in flight, fills the cache again
+    conn.during_fetch = None
+    asyncio.run(card_cache.get_cards(conn, [c["id"]]))
+    assert card_cache.cache.get(str(c["id"])) is not None
+
+
+def test_replica_reads_do_not_fill():
+    c = card()
+    asyncio.run(card_cache.get_cards(CardsConn([c]), [c["id"]], fill=False))
+    assert card_cache.cache.get(str(c["id"])) is None
+
+
+def test_lru_eviction_keeps_deck_groups_consistent():
+    cards = [card() for _ in range(4)]
+    asyncio.run(card_cache.get_cards(CardsConn(cards), [c["id"] for c in cards]))
+    assert card_cache.cache.evictions == 1
+    assert card_cache.cache.get(str(cards[0]["id"])) is None
+    card_cache.cache.invalidate(deck_ids=[DECK])
+    assert card_cache.cache.stats()["cards"] == 0
+    assert card_cache.cache.stats()["decks"] == 0
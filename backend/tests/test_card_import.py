@@ -0,0 +1,154 @@
+import asyncio
+import contextlib
+import uuid
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from routes import cards
+
+
+class StreamedRequest:
+    """Just enough of a Request for the import parser: the body in chunks."""
+
+    def __init__(self, body: str, chunk_size: int = 7):
+        self.data = body.encode()
+        self.chunk_size = chunk_size
+        self.headers = {"content-type": "application/x-ndjson"}
+
+    async def stream(self):
+        for start in range(0, len(self.data), self.chunk_size):
+            yield self.data[start:start + self.chunk_size]
+
+
+def parse(body: str, fmt: str, chunk_size: int = 7):
+    async def collect():
+        return [row async for row in cards.iter_import_rows(StreamedRequest(body, chunk_size), fmt)]
+
+    return asyncio.run(collect())
+
+
+def test_ndjson_rows_and_errors():
+    body = '{"title": "A"}\n\n{"title": "Б", "position": 2}\r\n{broken\n[1, 2]\n'
+    rows = parse(body, "ndjson")
+    assert [(line, data) for line, data, error in rows if error is None] == [
+        (1, {"title": "A"}), (3, {"title": "Б", "position": 2}), (5, [1, 2]),
+    ]
+    errors = [(line, error) for line, data, error in rows if error is not None]
+    assert len(errors) == 1 and errors[0][0] == 4 and errors[0][1].startswith("Invalid JSON")
+
+
+def test_ndjson_last_line_without_newline():
+    assert parse('{"title": "A"}\n{"title": "B"}', "ndjson")[-1] == (2, {"title": "B"}, None)
+
+
+def test_csv_header_empty_values_and_metadata():
+    body = (
+        "title, description,metadata,position\n"
+        'A,,"{""k"": 1}",3\n'
+        ",,,\n"
+        "B,desc,,\n"
+    )
+    assert parse(body, "csv") == [
+        (2, {"title": "A", "metadata": {"k": 1}, "position": "3"}, None),
+        (4, {"title": "B", "description": "desc"}, None),
+    ]
+
+
+def test_csv_quoted_field_spans_lines():
+    body = 'title,description\nA,"line one\nline, two"\nB,x\n'
+    assert parse(body, "csv", chunk_size=3) == [
+        (3, {"title": "A", "description": "line one\nline, two"}, None),
+        (4, {"title": "B", "description": "x"}, None),
+    ]
+
+
+def test_csv_invalid_metadata_is_a_row_error():
+    rows = parse('title,metadata\nA,{oops\nB,\n', "csv")
+    assert rows[0][0] == 2 and rows[0][1] is None and rows[0][2].startswith("Invalid metadata JSON")
+    assert rows[1] == (3, {"title": "B"}, None)
+
+
+def test_utf8_split_across_chunks():
+    body = '{"title": "Привет"}\n'
+    assert parse(body, "ndjson", chunk_size=1) == [(1, {"title": "Привет"}, None)]
+
+
+def test_overlong_line_is_rejected(monkeypatch):
+    monkeypatch.setattr(cards, "MAX_IMPORT_LINE_LENGTH", 16)
+    with pytest.raises(HTTPException) as error:
+        parse('{"title": "' + "x" * 64 + '"}\n', "ndjson")
+    assert error.value.status_code == 413
+
+
+def test_row_model_limits():
+    assert cards.CardImportRow(title="A", position="3").position == 3
+    with pytest.raises(ValueError):
+        cards.CardImportRow(title="")
+    with pytest.raises(ValueError):
+        cards.CardImportRow(title="A", image_url="x" * 501)
+
+
+class DeckPool:
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetchval(self, query, *args):
+        return 1
+
+
+@pytest.fixture
+def import_calls(monkeypatch):
+    calls = {"copied": [], "after_write": []}
+
+    async def copy_cards(db, records):
+        calls["copied"].append(len(records))
+        return len(records)
+
+    async def invalidate(redis_client, card_ids=(), deck_ids=()):
+        calls["after_write"].append("cache")
+
+    async def mark_cards_written(redis_client, deck_ids=(), card_ids=()):
+        calls["after_write"].append("replica")
+
+    async def sync_decks(deck_ids):
+        calls["after_write"].append("shards")
+
+    monkeypatch.setattr(cards, "CARD_IMPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(cards, "copy_cards", copy_cards)
+    monkeypatch.setattr(cards.card_cache, "invalidate", invalidate)
+    monkeypatch.setattr(cards, "mark_cards_written", mark_cards_written)
+    monkeypatch.setattr(cards.shards.router, "sync_decks", sync_decks)
+    return calls
+
+
+def run_import(body: str):
+    request = StreamedRequest(body)
+    return asyncio.run(cards.import_cards(str(uuid.uuid4()), request, None, db=DeckPool(), redis_client=None))
+
+
+def test_import_batches_and_report(import_calls):
+    result = run_import('{"title": "A"}\n{"title": ""}\n{"title": "B"}\n{"title": "C"}\n')
+    assert import_calls["copied"] == [2, 1]
+    assert import_calls["after_write"] == ["cache", "replica", "shards"]
+    assert result["inserted"] == 3 and result["rejected"] == 1
+    assert result["errors"][0]["line"] == 2
+
+
+def test_failed_import_reports_the_committed_rows(import_calls, monkeypatch):
+    monkeypatch.setattr(cards, "MAX_IMPORT_LINE_LENGTH", 64)
+    response = run_import('{"title": "A"}\n{"title": "B"}\n{"title": "' + "x" * 100 + '"}\n')
+    assert response.status_code == 413
+    body = orjson.loads(response.body)
+    assert body["partial"] is True and body["inserted"] == 2
+    assert import_calls["after_write"] == ["cache", "replica", "shards"]
+
+
+def test_failure_before_any_insert_is_a_plain_error(import_calls, monkeypatch):
+    monkeypatch.setattr(cards, "MAX_IMPORT_LINE_LENGTH", 16)
+    with pytest.raises(HTTPException) as error:
+        run_import('{"title": "' + "x" * 100 + '"}\n')
+    assert error.value.status_code == 413
+    assert import_calls["after_write"] == []
@@ -0,0 +1,125 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+import admission
+import database
+
+
+class FakeAsyncpgPool:
+    """The public asyncpg pool calls the adapter uses."""
+
+    def __init__(self, max_size=2):
+        self.max_size = max_size
+        self.out = []
+        self.released = []
+
+    def get_max_size(self):
+        return self.max_size
+
+    async def acquire(self, timeout=None):
+        conn = FakeConnection()
+        self.out.append(conn)
+        return conn
+
+    async def release(self, conn, timeout=None):
+        self.out.remove(conn)
+        self.released.append(conn)
+
+
+class FakeConnection:
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        return query
+
+
+def test_acquire_holds_an_admission_slot():
+    pool = database.Pool(FakeAsyncpgPool())
+
+    async def scenario():
+        async with pool.acquire() as conn:
+            assert pool.admission.in_use == 1
+            assert pool.pool.out == [conn]
+        assert pool.admission.in_use == 0
+
+        conn = await pool.acquire()
+        assert pool.admission.in_use == 1
+        await pool.release(conn)
+        assert pool.admission.in_use == 0
+        assert await pool.fetchval("SELECT 1") == "SELECT 1"
+        assert pool.admission.in_use == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_acquire_gives_the_slot_back():
+    class Unreachable(FakeAsyncpgPool):
+        async def acquire(self, timeout=None):
+            raise OSError("connection refused")
+
+    pool = database.Pool(Unreachable())
+
+    async def scenario():
+        with pytest.raises(OSError):
+            async with pool.acquire():
+                pass
+
+    asyncio.run(scenario())
+    assert pool.admission.in_use == 0
+
+
+def test_saturated_pool_is_overloaded():
+    pool = database.Pool(FakeAsyncpgPool(max_size=1))
+    pool.admission.waits = {priority: 0.01 for priority in admission.PRIORITIES}
+
+    async def scenario():
+        async with pool.acquire():
+            with pytest.raises(admission.Overloaded):
+                await pool.acquire()
+
+    asyncio.run(scenario())
+
+
+class Statement:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    async def fetchval(self, *args, column=0, timeout=None):
+        if self.error is not None:
+            raise self.error
+        self.calls.append(args)
+        return "prepared"
+
+
+class UnconnectedConnection(database.Connection):
+    """database.Connection without a server behind it."""
+
+    def __del__(self):
+        pass
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        return "statement cache"
+
+    monkeypatch.setattr(asyncpg.Connection, "fetchval", fetchval)
+    monkeypatch.setattr(asyncpg.Connection, "is_in_transaction", lambda self: False)
+    conn = object.__new__(UnconnectedConnection)
+    conn.prepared = {}
+    return conn
+
+
+def test_prepared_queries_run_through_their_statement(connection):
+    statement = Statement()
+    connection.prepared["SELECT $1"] = statement
+    assert asyncio.run(connection.fetchval("SELECT $1", 5)) == "prepared"
+    assert statement.calls == [(5,)]
+    assert asyncio.run(connection.fetchval("SELECT 2")) == "statement cache"
+
+
+def test_invalidated_statement_falls_back(connection):
+    connection.prepared["SELECT $1"] = Statement(asyncpg.InvalidCachedStatementError("schema changed"))
+    assert asyncio.run(connection.fetchval("SELECT $1", 5)) == "statement cache"
+    assert connection.prepared == {}
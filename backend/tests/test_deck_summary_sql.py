@@ -0,0 +1,26 @@
+from routes import sessions
+from test_session_sql import new_session, run
+
+
+def test_card_counters_and_session_progress(database):
+    async def scenario(conn):
+        session_id, (first, second, third) = await new_session(conn)
+        deck_id = await conn.fetchval("SELECT deck_id FROM sessions WHERE id = $1", session_id)
+        await conn.execute("UPDATE cards SET image_url = 'b.png' WHERE id = $1", second)
+        await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, first, "smash", 1)
+
+        row = await conn.fetchrow("SELECT * FROM deck_summary_view WHERE id = $1", deck_id)
+        assert row["card_count"] == 3 and row["cover_image_url"] == "b.png"
+        assert row["session_id"] == session_id
+        assert (row["remaining_count"], row["smashed_count"]) == (2, 1)
+
+        await conn.execute("DELETE FROM cards WHERE id = ANY($1::uuid[])", [second, third])
+        row = await conn.fetchrow("SELECT * FROM deck_summary_view WHERE id = $1", deck_id)
+        assert row["card_count"] == 1 and row["cover_image_url"] is None
+        assert row["remaining_count"] == 0
+
+        await conn.execute("UPDATE sessions SET status = 'finished' WHERE id = $1", session_id)
+        row = await conn.fetchrow("SELECT * FROM deck_summary_view WHERE id = $1", deck_id)
+        assert row["session_id"] is None
+
+    run(database, scenario)
@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from routes import sessions
+
+CARDS = [str(uuid.UUID(int=n + 1)) for n in range(4)]
+
+
+class DuelConn:
+    """Answers the queries of resolve_duel for a session whose remaining queue is `remaining`."""
+
+    def __init__(self, remaining, scheduler=None):
+        self.remaining = list(remaining)
+        self.scheduler = scheduler
+        self.queries = []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchrow(self, query, *args):
+        self.queries.append(query)
+        if query == sessions.LOCK_DUEL_SESSION_SQL:
+            return {"mode": "duel", "status": "active", "duel_scheduler": self.scheduler}
+        if query == sessions.DUEL_STEP_SQL:
+            return {
+                "id": args[0], "deck_id": uuid.uuid4(), "mode": "duel",
+                "status": "finished" if len(self.remaining) == 1 else "active",
+                "duel_scheduler": self.scheduler, "version": 7, "updated_at": datetime(2026, 1, 1),
+                "remaining": len(self.remaining), "passed": 4 - len(self.remaining), "smashed": 4,
+            }
+        raise AssertionError(query)
+
+    async def fetchval(self, query, *args):
+        self.queries.append(query)
+        if query == sessions.COUNT_REMAINING_SQL:
+            return sum(str(card_id) in self.remaining for card_id in args[1])
+        if query == sessions.APPLY_DECISION_SQL:
+            card_id, decision = args[1], args[2]
+            self.remaining.remove(card_id)
+            if decision == "smash":
+                # The winner goes to the back of the queue
+                self.remaining.append(card_id)
+            return None
+        raise AssertionError(query)
+
+    async def fetch(self, query, *args):
+        self.queries.append(query)
+        if query == sessions.REMAINING_IDS_SQL:
+            return [{"card_id": uuid.UUID(card_id)} for card_id in self.remaining]
+        if query == sessions.DUEL_PAIR_SQL["bracket"]:
+            return [{"card_id": uuid.UUID(card_id)} for card_id in self.remaining[:2]]
+        raise AssertionError(query)
+
+
+class DuelPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+@pytest.fixture(autouse=True)
+def cards_from_ids(monkeypatch):
+    async def get_cards(conn, card_ids, fill=True):
+        return [{"id": str(card_id)} for card_id in card_ids]
+
+    monkeypatch.setattr(sessions.card_cache, "get_cards", get_cards)
+
+
+def resolve(conn, winner, loser):
+    body = sessions.DuelResolve(winner_id=winner, loser_id=loser)
+    return asyncio.run(sessions.resolve_duel(str(uuid.uuid4()), body, db=DuelPool(conn), redis_client=None))
+
+
+@pytest.mark.parametrize("scheduler", [None, "bracket"])
+def test_bracket_step_returns_the_next_pair(scheduler):
+    conn = DuelConn(CARDS, scheduler)
+    result = resolve(conn, CARDS[1], CARDS[0])
+    assert result["remainingCount"] == 3
+    # A NULL scheduler is the default bracket
+    assert result["duelsLeft"] == 2
+    assert (result["card1"]["id"], result["card2"]["id"]) == (CARDS[2], CARDS[3])
+    # No whole-session read per step
+    assert sessions.SESSION_SQL not in conn.queries
+
+
+def test_unscheduled_pair_is_a_409():
+    conn = DuelConn(CARDS)
+    with pytest.raises(HTTPException) as error:
+        resolve(conn, CARDS[2], CARDS[3])
+    assert error.value.status_code == 409
+    assert error.value.detail["pair"] == sorted(CARDS[:2])
+    assert sessions.APPLY_DECISION_SQL not in conn.queries
+
+
+def test_last_duel_finishes_the_session(monkeypatch):
+    conn = DuelConn(CARDS[:2])
+    winners = []
+
+    async def fetchval(query, *args):
+        if query.startswith("SELECT session_decision_winner"):
+            winners.append(args)
+            return {"id": CARDS[0]}
+        return await DuelConn.fetchval(conn, query, *args)
+
+    monkeypatch.setattr(conn, "fetchval", fetchval)
+    assert resolve(conn, CARDS[0], CARDS[1]) == {"status": "finished", "winner": {"id": CARDS[0]}}
+    assert sessions.DUEL_PAIR_SQL["bracket"] not in conn.queries
+
+
+def test_scheduler_name_fallback():
+    assert sessions.duel_scheduler_name({"duel_scheduler": None}) == sessions.DEFAULT_DUEL_SCHEDULER
+    assert sessions.duel_scheduler_name({"duel_scheduler": "unknown"}) == sessions.DEFAULT_DUEL_SCHEDULER
+    assert sessions.duel_scheduler_name({"duel_scheduler": "random"}) == "random"
+    assert sessions.bracket_duel_pair(CARDS) == CARDS[:2]
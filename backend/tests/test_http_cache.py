@@ -0,0 +1,39 @@
+import http_cache
+
+
+def test_make_etag_is_weak_and_varies_by_part():
+    etag = http_cache.make_etag("cards", "deck", 1)
+    assert etag.startswith('W/"')
+    assert etag == http_cache.make_etag("cards", "deck", 1)
+    assert etag != http_cache.make_etag("cards", "deck", 2)
+
+
+def test_etag_matches_weak_comparison():
+    etag = http_cache.make_etag("card", "id", 1)
+    strong = etag[2:]
+    assert http_cache.etag_matches(etag, etag)
+    assert http_cache.etag_matches(strong, etag)
+    assert http_cache.etag_matches(etag, strong)
+
+
+def test_etag_matches_one_of_a_list():
+    etag = http_cache.make_etag("card", "id", 1)
+    other = http_cache.make_etag("card", "id", 2)
+    assert http_cache.etag_matches(f"{other}, {etag}", etag)
+    assert not http_cache.etag_matches(other, etag)
+
+
+def test_etag_matches_star_and_missing_header():
+    etag = http_cache.make_etag("deck", "id")
+    assert http_cache.etag_matches("*", etag)
+    assert http_cache.etag_matches(" * ", etag)
+    assert not http_cache.etag_matches(None, etag)
+    assert not http_cache.etag_matches("", etag)
+
+
+def test_not_modified_response():
+    etag = http_cache.make_etag("deck", "id")
+    response = http_cache.not_modified(etag, etag, "no-cache")
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert http_cache.not_modified(None, etag, "no-cache") is None
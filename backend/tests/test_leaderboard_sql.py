@@ -0,0 +1,96 @@
+from jobs import backfill_leaderboard, fit_ratings
+from routes import sessions
+from test_session_sql import new_session, run
+
+
+async def stats_of(conn, card_ids):
+    rows = await conn.fetch(
+        "SELECT card_id, seen, smashes, passes, duel_wins, duel_losses FROM card_vote_stats WHERE card_id = ANY($1::uuid[])",
+        card_ids,
+    )
+    return {row["card_id"]: tuple(row)[1:] for row in rows}
+
+
+def test_votes_trigger_and_rebuild_agree(database):
+    async def scenario(conn):
+        session_id, (first, second, third) = await new_session(conn)
+        for card_id, decision in ((first, "smash"), (second, "smash"), (third, "pass")):
+            await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, card_id, decision, 1)
+        await conn.execute("UPDATE sessions SET mode = 'duel' WHERE id = $1", session_id)
+        await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, first, "smash", 1)
+        await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, second, "pass", 1)
+
+        deck_id = await conn.fetchval("SELECT deck_id FROM sessions WHERE id = $1", session_id)
+        expected = {
+            first: (2, 1, 0, 1, 0),
+            second: (2, 1, 0, 0, 1),
+            third: (1, 0, 1, 0, 0),
+        }
+        assert await stats_of(conn, [first, second, third]) == expected
+        deck = await conn.fetchrow("SELECT votes, smashes, passes, duels FROM deck_vote_stats WHERE deck_id = $1", deck_id)
+        assert tuple(deck) == (5, 2, 1, 1)
+
+        await conn.execute("DELETE FROM card_vote_stats WHERE deck_id = $1", deck_id)
+        async with conn.transaction():
+            assert await conn.fetchval("SELECT vote_stats_rebuild($1)", deck_id) == 5
+        assert await stats_of(conn, [first, second, third]) == expected
+
+    run(database, scenario)
+
+
+async def add_vote(conn, session_id, card_id, decision, round, mode, seconds):
+    await conn.execute(
+        """
+        INSERT INTO votes (session_id, card_id, decision, round, mode, timestamp)
+        VALUES ($1, $2, $3, $4, $5, date_trunc('second', CURRENT_TIMESTAMP) + make_interval(secs => $6))
+        """,
+        session_id, card_id, decision, round, mode, seconds,
+    )
+
+
+async def duels_of(conn, deck_id, card_ids):
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        rows = await conn.fetch(fit_ratings.DUELS_SQL, deck_id)
+    order = sorted(card_ids)
+    return sorted((order[row["winner"]], order[row["loser"]]) for row in rows)
+
+
+def test_duels_of_the_duel_endpoint_and_of_legacy_decisions(database):
+    async def scenario(conn):
+        session_id, (a, b, c) = await new_session(conn)
+        deck_id = await conn.fetchval("SELECT deck_id FROM sessions WHERE id = $1", session_id)
+        for card_id in (a, b, c):
+            await add_vote(conn, session_id, card_id, "smash", 1, "swipe", 0)
+        # POST /duel: both votes in one statement, one timestamp
+        await add_vote(conn, session_id, b, "pass", 1, "duel", 1)
+        await add_vote(conn, session_id, a, "smash", 1, "duel", 1)
+        # POST /decision twice: the smash, then the pass a moment later
+        await add_vote(conn, session_id, c, "smash", 2, "duel", 2)
+        await add_vote(conn, session_id, a, "pass", 2, "duel", 3)
+        # A smash without its pass is not a duel
+        await add_vote(conn, session_id, c, "smash", 3, "duel", 4)
+
+        assert await duels_of(conn, deck_id, [a, b, c]) == sorted([(a, b), (c, a)])
+
+    run(database, scenario)
+
+
+def test_backfill_sets_the_mode_of_legacy_duel_votes(database):
+    async def scenario(conn):
+        session_id, (a, b, c) = await new_session(conn)
+        deck_id = await conn.fetchval("SELECT deck_id FROM sessions WHERE id = $1", session_id)
+        await conn.execute("UPDATE sessions SET mode = 'duel' WHERE id = $1", session_id)
+        # Before migration 012: swipes, then one duel, all without mode
+        await add_vote(conn, session_id, a, "smash", 1, None, 0)
+        await add_vote(conn, session_id, b, "smash", 1, None, 1)
+        await add_vote(conn, session_id, c, "pass", 1, None, 2)
+        await add_vote(conn, session_id, b, "smash", 1, None, 3)
+        await add_vote(conn, session_id, a, "pass", 1, None, 4)
+        assert await duels_of(conn, deck_id, [a, b, c]) == []
+
+        assert await conn.execute(backfill_leaderboard.BACKFILL_MODE_SQL, deck_id) == "UPDATE 5"
+        modes = await conn.fetch("SELECT mode FROM votes WHERE session_id = $1 ORDER BY timestamp", session_id)
+        assert [row["mode"] for row in modes] == ["swipe", "swipe", "swipe", "duel", "duel"]
+        assert await duels_of(conn, deck_id, [a, b, c]) == [(b, a)]
+
+    run(database, scenario)
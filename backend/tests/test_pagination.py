@@ -0,0 +1,113 @@
+import asyncio
+import base64
+import contextlib
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import pagination
+
+KINDS = [int, datetime, uuid.UUID]
+
+
+def test_cursor_round_trip():
+    values = [3, datetime(2026, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc), uuid.uuid4()]
+    cursor = pagination.encode_cursor(values)
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor, KINDS) == values
+
+
+def test_cursor_keeps_nulls():
+    cursor = pagination.encode_cursor([None, "x"])
+    assert pagination.decode_cursor(cursor, [int, None]) == [None, "x"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"{\"a\": 1}").decode(),
+    pagination.encode_cursor([1, "2026-01-01T00:00:00"]),
+    pagination.encode_cursor(["one", "2026-01-01T00:00:00", str(uuid.uuid4())]),
+    pagination.encode_cursor([1, "yesterday", str(uuid.uuid4())]),
+    pagination.encode_cursor([1, "2026-01-01T00:00:00", "not-a-uuid"]),
+])
+def test_tampered_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        pagination.decode_cursor(cursor, KINDS)
+    assert error.value.status_code == 400
+
+
+def test_truncated_cursor_is_a_400():
+    cursor = pagination.encode_cursor([1, "2026-01-01T00:00:00", str(uuid.uuid4())])
+    with pytest.raises(HTTPException):
+        pagination.decode_cursor(cursor[:-5], KINDS)
+
+
+def test_parse_fields():
+    assert pagination.parse_fields(None, ["id", "title"]) is None
+    assert pagination.parse_fields("title, title,id", ["id", "title"]) == ["id", "title"]
+    with pytest.raises(HTTPException) as error:
+        pagination.parse_fields("title,password", ["id", "title"])
+    assert error.value.status_code == 400
+
+
+def test_page_size_is_bounded():
+    assert pagination.page_size(None, 100) == 100
+    assert pagination.page_size(10, 100) == 10
+    assert pagination.page_size(10 ** 6, 100) == pagination.MAX_PAGE_SIZE
+
+
+class CardPageConn:
+    def __init__(self, count):
+        self.count = count
+        self.queries = []
+
+    async def fetchval(self, query, *args):
+        return 1
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        limit = args[-1]
+        return [
+            {"id": uuid.UUID(int=n + 1), "title": f"card {n}", "sort_position": n, "created_at": datetime(2026, 1, 1)}
+            for n in range(min(self.count, limit))
+        ]
+
+
+class CardPagePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def list_cards(conn, **params):
+    from routes import cards
+
+    params = {"limit": None, "cursor": None, "fields": None, "if_none_match": None, **params}
+    return asyncio.run(cards.get_cards(str(uuid.uuid4()), db=CardPagePool(conn), **params))
+
+
+def test_card_listing_defaults_to_a_bounded_page(monkeypatch):
+    monkeypatch.setattr(pagination, "CARD_PAGE_SIZE", 2)
+    conn = CardPageConn(5)
+    response = list_cards(conn, fields="title")
+    query, args = conn.queries[0]
+    assert args[-1] == 3
+    assert "title" in query and "description" not in query
+    assert orjson.loads(response.body) == [
+        {"id": str(uuid.UUID(int=1)), "title": "card 0"}, {"id": str(uuid.UUID(int=2)), "title": "card 1"},
+    ]
+    cursor = response.headers[pagination.NEXT_CURSOR_HEADER]
+    assert pagination.decode_cursor(cursor, KINDS) == [1, datetime(2026, 1, 1), uuid.UUID(int=2)]
+
+
+def test_last_card_page_has_no_cursor():
+    conn = CardPageConn(3)
+    response = list_cards(conn, limit=10, fields="title")
+    assert len(orjson.loads(response.body)) == 3
+    assert pagination.NEXT_CURSOR_HEADER not in response.headers
@@ -0,0 +1,53 @@
+import numpy as np
+
+import ratings
+
+
+def counts_from_matrix(wins):
+    """DuelCounts from wins[i][j] = duels card i won against card j."""
+    size = len(wins)
+    counts = ratings.DuelCounts(list(range(size)))
+    winners, losers = [], []
+    for i in range(size):
+        for j in range(size):
+            winners += [i] * wins[i][j]
+            losers += [j] * wins[i][j]
+    counts.add(np.array(winners, dtype=np.int64), np.array(losers, dtype=np.int64))
+    return counts
+
+
+def test_counts_accumulate_per_pair():
+    counts = counts_from_matrix([[0, 3, 1], [2, 0, 0], [0, 4, 0]])
+    first, second, games = counts.pairs()
+    assert dict(zip(zip(first.tolist(), second.tolist()), games.tolist())) == {(0, 1): 5, (0, 2): 1, (1, 2): 4}
+    assert counts.wins.tolist() == [4, 2, 4]
+    assert counts.games.tolist() == [6, 9, 5]
+    assert counts.duels == 10
+
+
+def test_even_results_give_average_ratings():
+    strengths, iterations = ratings.fit(counts_from_matrix([[0, 5, 5], [5, 0, 5], [5, 5, 0]]))
+    assert iterations < ratings.MAX_ITERATIONS
+    assert np.allclose(strengths, ratings.BASE_RATING)
+
+
+def test_converges_to_the_known_odds():
+    # 3:1 and 3:1 imply 9:1 between the ends; the prior is negligible at these counts
+    wins = [[0, 3000, 900], [1000, 0, 3000], [100, 1000, 0]]
+    strengths, iterations = ratings.fit(counts_from_matrix(wins))
+    assert iterations < ratings.MAX_ITERATIONS
+    expected = ratings.ELO_SCALE * np.log10(3)
+    assert abs((strengths[0] - strengths[1]) - expected) < 1
+    assert abs((strengths[1] - strengths[2]) - expected) < 1
+    assert abs(strengths.mean() - ratings.BASE_RATING) < 1e-6
+
+
+def test_unbeaten_card_gets_a_finite_rating():
+    strengths, _ = ratings.fit(counts_from_matrix([[0, 10], [0, 0]]))
+    assert np.all(np.isfinite(strengths))
+    assert strengths[0] > strengths[1]
+
+
+def test_empty_deck():
+    strengths, iterations = ratings.fit(ratings.DuelCounts([]))
+    assert len(strengths) == 0 and iterations == 0
@@ -0,0 +1,122 @@
+import asyncio
+import contextlib
+
+import pytest
+
+import replica
+from routes import sessions
+
+
+class FakeConn:
+    def __init__(self, health=None, error=None, session=None):
+        self.health = health
+        self.error = error
+        self.session = session
+
+    async def fetchrow(self, query, *args, timeout=None):
+        if self.error is not None:
+            raise self.error
+        if query == sessions.SESSION_SQL:
+            return self.session
+        return self.health
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield self.conn
+
+
+class FailingRedis:
+    async def exists(self, key):
+        raise ConnectionError("redis is down")
+
+
+@pytest.fixture
+def configured(monkeypatch):
+    monkeypatch.setattr(replica, "DB_REPLICA_HOST", "replica")
+
+
+def replica_with(conn):
+    rep = replica.Replica()
+    rep.pool = FakePool(conn)
+    asyncio.run(rep.check())
+    return rep
+
+
+def test_healthy_replica_serves_reads(configured):
+    rep = replica_with(FakeConn({"in_recovery": True, "streaming": True, "lag": 0.1}))
+    primary = object()
+    assert rep.healthy
+    assert rep.pool_for_read(primary) is rep.pool
+    assert rep.is_replica(rep.pool) and not rep.is_replica(primary)
+
+
+@pytest.mark.parametrize("conn", [
+    FakeConn({"in_recovery": True, "streaming": True, "lag": replica.DB_REPLICA_MAX_LAG + 1}),
+    FakeConn({"in_recovery": True, "streaming": False, "lag": 0.0}),
+    FakeConn(error=OSError("connection refused")),
+])
+def test_unhealthy_replica_falls_back_to_the_primary(configured, conn):
+    rep = replica_with(conn)
+    primary = object()
+    assert not rep.healthy and rep.last_error
+    assert rep.pool_for_read(primary) is primary
+    assert rep.reads_primary == 1
+
+
+def test_recovery_after_a_failed_check(configured):
+    conn = FakeConn(error=OSError("connection refused"))
+    rep = replica_with(conn)
+    conn.error = None
+    conn.health = {"in_recovery": True, "streaming": True, "lag": 0.0}
+    asyncio.run(rep.check())
+    assert rep.pool_for_read(object()) is rep.pool
+
+
+def test_read_your_writes_goes_to_the_primary(configured):
+    rep = replica_with(FakeConn({"in_recovery": True, "streaming": True, "lag": 0.0}))
+    primary = object()
+
+    async def scenario():
+        await rep.mark_written(None, "s1")
+        await rep.mark_written(None, "d1", "deck")
+        return (
+            await rep.pool_for_session(primary, None, "s1"),
+            await rep.pool_for_session(primary, None, "s2"),
+            await rep.pool_for_written(primary, None, "d1", "deck"),
+            await rep.pool_for_written(primary, None, "s1", "deck"),
+        )
+
+    assert asyncio.run(scenario()) == (primary, rep.pool, primary, rep.pool)
+
+
+def test_unknown_write_state_goes_to_the_primary(configured):
+    rep = replica_with(FakeConn({"in_recovery": True, "streaming": True, "lag": 0.0}))
+    primary = object()
+    assert asyncio.run(rep.pool_for_session(primary, FailingRedis(), "s1")) is primary
+
+
+def test_session_read_from_the_replica_is_not_cached(monkeypatch):
+    cached = []
+
+    async def miss(redis_client, session_id):
+        return None
+
+    async def put(redis_client, session):
+        cached.append(session)
+
+    monkeypatch.setattr(sessions.session_cache, "get", miss)
+    monkeypatch.setattr(sessions.session_cache, "put", put)
+    conn = FakeConn(session={"id": "s1", "version": 3})
+
+    async def scenario():
+        from_replica = await sessions.load_session(conn, None, "s1", fill=False)
+        from_primary = await sessions.load_session(conn, None, "s1")
+        return from_replica, from_primary
+
+    assert asyncio.run(scenario()) == ({"id": "s1", "version": 3}, {"id": "s1", "version": 3})
+    assert cached == [{"id": "s1", "version": 3}]
@@ -0,0 +1,46 @@
+import asyncio
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import asyncpg
+import orjson
+import pytest
+
+import serialization
+
+
+def test_dumps_writes_uuids_datetimes_and_decimals():
+    body = serialization.dumps({
+        "id": uuid.UUID(int=1), "at": datetime(2026, 1, 2, 3, 4, 5), "rating": Decimal("1512.5"),
+    })
+    assert orjson.loads(body) == {
+        "id": "00000000-0000-0000-0000-000000000001", "at": "2026-01-02T03:04:05", "rating": 1512.5,
+    }
+
+
+def test_dumps_refuses_unknown_types():
+    with pytest.raises(TypeError):
+        serialization.dumps({"cards": {1, 2}})
+
+
+def test_response_renders_with_dumps():
+    response = serialization.FastJSONResponse({"id": uuid.UUID(int=2)})
+    assert response.media_type == "application/json"
+    assert orjson.loads(response.body) == {"id": str(uuid.UUID(int=2))}
+
+
+def test_jsonb_codec_and_records(database):
+    async def scenario():
+        conn = await asyncpg.connect(database)
+        try:
+            await serialization.init_connection(conn)
+            value = {"tags": ["a", "b"], "n": 1}
+            row = await conn.fetchrow("SELECT $1::jsonb AS metadata, 2::numeric AS score", value)
+            return value, row
+        finally:
+            await conn.close()
+
+    value, row = asyncio.run(scenario())
+    assert row["metadata"] == value
+    assert orjson.loads(serialization.dumps([row])) == [{"metadata": value, "score": 2.0}]
@@ -0,0 +1,102 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+
+import session_cache
+
+
+class FakeRedis:
+    """Hashes in a dict; eval() runs the version check of _PUT_SCRIPT."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.calls = 0
+
+    async def hget(self, key, field):
+        self.calls += 1
+        return self.hashes.get(key, {}).get(field)
+
+    async def eval(self, script, numkeys, key, version, payload, ttl):
+        self.calls += 1
+        assert script == session_cache._PUT_SCRIPT and numkeys == 1
+        current = self.hashes.get(key, {}).get("v", -1)
+        if version >= current:
+            self.hashes[key] = {"v": version, "d": payload}
+            return 1
+        return 0
+
+    async def delete(self, *keys):
+        self.calls += 1
+        for key in keys:
+            self.hashes.pop(key, None)
+
+
+class DownRedis:
+    def __init__(self):
+        self.calls = 0
+
+    async def hget(self, key, field):
+        self.calls += 1
+        raise ConnectionError("redis is down")
+
+
+@pytest.fixture(autouse=True)
+def cache_enabled(monkeypatch):
+    monkeypatch.setattr(session_cache, "_disabled_until", 0.0)
+
+
+def session(version, status="active"):
+    return {
+        "id": uuid.UUID(int=1), "status": status, "version": version,
+        "created_at": datetime(2026, 1, 1, 12, 0), "updated_at": datetime(2026, 1, 1, 12, version),
+    }
+
+
+def test_put_then_get_restores_the_row():
+    redis = FakeRedis()
+
+    async def scenario():
+        await session_cache.put(redis, session(3))
+        return await session_cache.get(redis, uuid.UUID(int=1))
+
+    cached = asyncio.run(scenario())
+    assert cached["id"] == str(uuid.UUID(int=1))
+    assert cached["version"] == 3
+    assert cached["updated_at"] == datetime(2026, 1, 1, 12, 3)
+
+
+def test_older_row_does_not_replace_a_newer_one():
+    redis = FakeRedis()
+
+    async def scenario():
+        await session_cache.put(redis, session(5, status="finished"))
+        await session_cache.put(redis, session(4))
+        return await session_cache.get(redis, uuid.UUID(int=1))
+
+    assert asyncio.run(scenario())["status"] == "finished"
+
+
+def test_invalidate_drops_the_entry():
+    redis = FakeRedis()
+
+    async def scenario():
+        await session_cache.put(redis, session(1))
+        await session_cache.invalidate(redis, uuid.UUID(int=1))
+        return await session_cache.get(redis, uuid.UUID(int=1))
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_redis_failure_disables_the_cache_for_the_backoff():
+    redis = DownRedis()
+
+    async def scenario():
+        first = await session_cache.get(redis, uuid.UUID(int=1))
+        second = await session_cache.get(redis, uuid.UUID(int=1))
+        return first, second
+
+    assert asyncio.run(scenario()) == (None, None)
+    # The second read went straight to Postgres
+    assert redis.calls == 1
@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from routes import sessions
+
+SESSION_ID = uuid.uuid4()
+
+
+class CasConn:
+    """A sessions row with a version; `conflicts` concurrent writers bump it before our UPDATE."""
+
+    def __init__(self, conflicts=0):
+        self.version = 1
+        self.mode = "swipe"
+        self.conflicts = conflicts
+        self.claims = 0
+        self.reads = 0
+        self.rollbacks = 0
+
+    def row(self):
+        return {"id": SESSION_ID, "mode": self.mode, "status": "active", "version": self.version}
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        try:
+            yield
+        except Exception:
+            self.rollbacks += 1
+            raise
+
+    async def fetchrow(self, query, *args):
+        if query == sessions.SESSION_SQL:
+            self.reads += 1
+            return self.row()
+        if query.startswith("UPDATE sessions SET"):
+            self.claims += 1
+            if self.conflicts:
+                self.conflicts -= 1
+                self.version += 1
+            if args[1] != self.version:
+                return None
+            self.mode = args[2]
+            self.version += 1
+            return self.row()
+        raise AssertionError(query)
+
+
+class CasPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_CAS_BACKOFF", 0)
+
+
+async def to_duel(conn, session):
+    await sessions.claim_session(conn, session, "mode = $3", "duel")
+
+
+def mutate(conn, mutation):
+    return asyncio.run(sessions.mutate_session(CasPool(conn), None, str(SESSION_ID), mutation))
+
+
+def test_claim_writes_when_version_matches():
+    conn = CasConn()
+    updated, changed = mutate(conn, to_duel)
+    assert changed
+    assert updated["mode"] == "duel" and updated["version"] == 2
+    assert conn.claims == 1
+
+
+def test_claim_retries_on_a_concurrent_write():
+    conn = CasConn(conflicts=2)
+    updated, changed = mutate(conn, to_duel)
+    assert changed and updated["mode"] == "duel"
+    assert conn.claims == 3
+    # The failed attempts rolled back and the session was read again each time
+    assert conn.rollbacks == 2
+    assert conn.reads >= 3
+
+
+def test_conflict_after_the_retries_is_409_with_the_current_session():
+    conn = CasConn(conflicts=sessions.SESSION_CAS_RETRIES + 1)
+    with pytest.raises(HTTPException) as raised:
+        mutate(conn, to_duel)
+    assert raised.value.status_code == 409
+    assert conn.claims == sessions.SESSION_CAS_RETRIES + 1
+    current = raised.value.detail["session"]
+    assert current["mode"] == "swipe"
+    assert current["version"] == conn.version
+
+
+def test_no_write_when_mutation_has_nothing_to_do():
+    conn = CasConn()
+
+    async def unchanged(conn, session):
+        return False
+
+    updated, changed = mutate(conn, unchanged)
+    assert not changed
+    assert updated["version"] == 1
+    assert conn.claims == 0
+
+
+def test_validation_error_is_not_retried():
+    conn = CasConn()
+
+    async def invalid(conn, session):
+        raise HTTPException(status_code=400, detail="Not enough cards for duel")
+
+    with pytest.raises(HTTPException) as raised:
+        mutate(conn, invalid)
+    assert raised.value.status_code == 400
+    assert conn.reads == 1 and conn.rollbacks == 1
@@ -0,0 +1,84 @@
+import asyncio
+import uuid
+
+import orjson
+import pytest
+
+import session_events
+
+SESSION_ID = str(uuid.UUID(int=1))
+
+
+class DownRedis:
+    async def publish(self, channel, data):
+        raise ConnectionError("redis is down")
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = session_events.SessionEventHub(queue_size=2)
+    monkeypatch.setattr(session_events, "hub", hub)
+    return hub
+
+
+def delta(action="decision", **extra):
+    session = {"id": uuid.UUID(SESSION_ID), "status": "active", "mode": "swipe", "version": 4,
+               "remaining_cards": ["a", "b"], "passed_cards": [], "smashed_cards": ["c"]}
+    return session_events.session_delta(action, session, **extra)
+
+
+def queued(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_delta_counts_the_card_lists():
+    event = delta(card_id="c")
+    assert event["type"] == "update" and event["session_id"] == SESSION_ID
+    assert event["counts"] == {"remaining": 2, "passed": 0, "smashed": 1}
+    assert event["card_id"] == "c"
+
+
+def test_compact_payload_counts_are_kept():
+    counts = {"remaining": 7, "passed": 1, "smashed": 2}
+    event = session_events.session_delta("decision", {"id": SESSION_ID, "counts": counts})
+    assert event["counts"] == counts
+
+
+def test_publish_without_redis_reaches_local_subscribers(hub):
+    queue = hub.subscribe(SESSION_ID)
+    other = hub.subscribe(str(uuid.UUID(int=2)))
+    asyncio.run(session_events.publish(None, delta()))
+    assert [event["action"] for event in queued(queue)] == ["decision"]
+    assert queued(other) == []
+
+
+def test_publish_falls_back_to_local_delivery_when_redis_fails(hub):
+    queue = hub.subscribe(SESSION_ID)
+    asyncio.run(session_events.publish(DownRedis(), delta()))
+    assert len(queued(queue)) == 1
+
+
+def test_slow_subscriber_gets_a_resync_instead_of_the_backlog(hub):
+    queue = hub.subscribe(SESSION_ID)
+    for action in ("one", "two", "three"):
+        hub.dispatch(SESSION_ID, delta(action))
+    assert queued(queue) == [session_events.RESYNC]
+    assert hub.overflows == 1
+
+
+def test_close_all_ends_every_stream(hub):
+    queue = hub.subscribe(SESSION_ID)
+    hub.dispatch(SESSION_ID, delta())
+    hub.close_all()
+    assert queued(queue) == [session_events.CLOSED]
+    hub.unsubscribe(SESSION_ID, queue)
+    assert hub.stats()["subscribers"] == 0
+
+
+def test_format_sse():
+    frame = session_events.format_sse(session_events.RESYNC)
+    assert frame.startswith(b"event: resync\ndata: ") and frame.endswith(b"\n\n")
+    assert orjson.loads(frame.split(b"data: ", 1)[1]) == session_events.RESYNC
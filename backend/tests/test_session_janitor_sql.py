@@ -0,0 +1,67 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+import session_janitor
+from test_session_sql import new_session, run
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(session_janitor, "SESSION_JANITOR_BATCH", 1)
+    monkeypatch.setattr(session_janitor, "SESSION_JANITOR_PAUSE", 0)
+
+
+async def age(conn, session_id, column, days):
+    await conn.execute(
+        f"UPDATE sessions SET {column} = CURRENT_TIMESTAMP - make_interval(days => $2) WHERE id = $1",
+        session_id, days,
+    )
+
+
+def janitor_pass(database):
+    async def main():
+        pool = await asyncpg.create_pool(database, min_size=1, max_size=2)
+        try:
+            janitor = session_janitor.SessionJanitor()
+            await janitor.run_pass(pool, None)
+            return janitor
+        finally:
+            await pool.close()
+
+    return asyncio.run(main())
+
+
+def test_idle_sessions_are_expired_then_compacted(database):
+    async def setup(conn):
+        idle = [(await new_session(conn))[0] for _ in range(2)]
+        live, _ = await new_session(conn)
+        for session_id in idle:
+            await age(conn, session_id, "updated_at", session_janitor.SESSION_IDLE_DAYS + 1)
+        return idle, live
+
+    idle, live = run(database, setup)
+    janitor = janitor_pass(database)
+    # Batches of one row until the backlog is worked off
+    assert janitor.expired >= 2
+
+    async def expired(conn):
+        rows = await conn.fetch("SELECT id, status, expired_at FROM sessions WHERE id = ANY($1::uuid[])", idle + [live])
+        state = {row["id"]: (row["status"], row["expired_at"] is not None) for row in rows}
+        assert state == {idle[0]: ("finished", True), idle[1]: ("finished", True), live: ("active", False)}
+        await age(conn, idle[0], "expired_at", session_janitor.SESSION_COMPACT_DAYS + 1)
+
+    run(database, expired)
+    janitor = janitor_pass(database)
+    assert janitor.compacted >= 1
+
+    async def compacted(conn):
+        counts = {
+            session_id: await conn.fetchval("SELECT count(*) FROM session_cards WHERE session_id = $1", session_id)
+            for session_id in idle
+        }
+        assert counts == {idle[0]: 0, idle[1]: 3}
+        assert await conn.fetchval("SELECT compacted_at IS NOT NULL FROM sessions WHERE id = $1", idle[0])
+
+    run(database, compacted)
@@ -0,0 +1,205 @@
+import asyncio
+import uuid
+
+import asyncpg
+
+import serialization
+from routes import sessions
+
+
+def run(database, scenario):
+    async def main():
+        conn = await asyncpg.connect(database)
+        # jsonb codecs of the app's pool connections
+        await serialization.init_connection(conn)
+        try:
+            return await scenario(conn)
+        finally:
+            await conn.close()
+
+    return asyncio.run(main())
+
+
+async def new_session(conn, cards=3):
+    """A swipe session over a new deck of `cards` cards; returns (session id, card ids in order)."""
+    deck_id = await conn.fetchval("INSERT INTO decks (title) VALUES ('deck') RETURNING id")
+    card_ids = [
+        await conn.fetchval(
+            "INSERT INTO cards (deck_id, title, position) VALUES ($1, $2, $3) RETURNING id",
+            deck_id, f"card {n}", n,
+        )
+        for n in range(cards)
+    ]
+    session_id = uuid.uuid4()
+    await conn.execute(sessions.CREATE_SESSION_SQL, session_id, deck_id, None, cards)
+    return session_id, card_ids
+
+
+async def card_state(conn, session_id, card_id):
+    row = await conn.fetchrow(
+        "SELECT state, position, smashed_position FROM session_cards WHERE session_id = $1 AND card_id = $2",
+        session_id, card_id,
+    )
+    return tuple(row)
+
+
+async def transition(conn, session_id, mode, card_id, decision, seq):
+    await conn.execute("SELECT session_card_transition($1, $2, $3, $4, $5)", session_id, mode, card_id, decision, seq)
+
+
+def test_swipe_moves_cards_to_passed_and_smashed(database):
+    async def scenario(conn):
+        session_id, (first, second, third) = await new_session(conn)
+        await transition(conn, session_id, "swipe", first, "pass", 4)
+        await transition(conn, session_id, "swipe", second, "smash", 5)
+        assert await card_state(conn, session_id, first) == ("passed", 4, None)
+        assert await card_state(conn, session_id, second) == ("smashed", 2, 5)
+        assert await card_state(conn, session_id, third) == ("remaining", 3, None)
+
+        view = await conn.fetchrow("SELECT * FROM session_view WHERE id = $1", session_id)
+        assert [uuid.UUID(c) for c in view["remaining_cards"]] == [third]
+        assert [uuid.UUID(c) for c in view["passed_cards"]] == [first]
+        assert [uuid.UUID(c) for c in view["smashed_cards"]] == [second]
+
+    run(database, scenario)
+
+
+def test_smash_does_not_bring_back_a_passed_card(database):
+    async def scenario(conn):
+        session_id, (card, _, _) = await new_session(conn)
+        await transition(conn, session_id, "swipe", card, "pass", 4)
+        await transition(conn, session_id, "swipe", card, "smash", 5)
+        assert (await card_state(conn, session_id, card))[0] == "passed"
+
+    run(database, scenario)
+
+
+def test_duel_winner_stays_remaining_at_the_back_of_the_queue(database):
+    async def scenario(conn):
+        session_id, (winner, loser, _) = await new_session(conn)
+        await transition(conn, session_id, "swipe", winner, "smash", 4)
+        await conn.execute("UPDATE session_cards SET state = 'remaining' WHERE session_id = $1", session_id)
+
+        await transition(conn, session_id, "duel", winner, "smash", 5)
+        await transition(conn, session_id, "duel", loser, "pass", 6)
+        # Keeps its first smashed position (history), moves to the back of remaining
+        assert await card_state(conn, session_id, winner) == ("remaining", 5, 4)
+        assert await card_state(conn, session_id, loser) == ("passed", 6, None)
+
+    run(database, scenario)
+
+
+async def votes_of(conn, session_id):
+    return [
+        tuple(row) for row in await conn.fetch(
+            "SELECT card_id, decision, round, mode FROM votes WHERE session_id = $1 ORDER BY timestamp, decision", session_id
+        )
+    ]
+
+
+def test_apply_decision_moves_the_card_and_records_the_vote(database):
+    async def scenario(conn):
+        session_id, (first, second, _) = await new_session(conn)
+        assert await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, first, "smash", 1) is None
+        assert await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, second, "pass", 1) is None
+
+        row = await conn.fetchrow("SELECT card_seq, status, version FROM sessions WHERE id = $1", session_id)
+        assert row["card_seq"] == 5 and row["status"] == "active" and row["version"] == 2
+        assert (await card_state(conn, session_id, first))[0] == "smashed"
+        assert (await card_state(conn, session_id, second))[0] == "passed"
+        assert sorted(await votes_of(conn, session_id)) == sorted([
+            (first, "smash", 1, "swipe"), (second, "pass", 1, "swipe"),
+        ])
+
+    run(database, scenario)
+
+
+def test_apply_decision_finishes_the_session_and_then_refuses(database):
+    async def scenario(conn):
+        session_id, card_ids = await new_session(conn, cards=2)
+        assert await conn.fetchval(sessions.APPLY_DECISION_SQL, uuid.uuid4(), card_ids[0], "pass", 1) == "not_found"
+        for card_id in card_ids:
+            await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, card_id, "pass", 1)
+        # Nothing left and nothing to duel
+        assert await conn.fetchval("SELECT status FROM sessions WHERE id = $1", session_id) == "finished"
+        assert await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, card_ids[0], "smash", 1) == "finished"
+        assert len(await votes_of(conn, session_id)) == 2
+
+    run(database, scenario)
+
+
+def test_apply_decision_skips_the_vote_when_votes_are_deferred(database):
+    async def scenario(conn):
+        session_id, (card, _, _) = await new_session(conn)
+        async with conn.transaction():
+            await conn.execute("SET LOCAL pickme.defer_votes = on")
+            await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, card, "smash", 1)
+        assert (await card_state(conn, session_id, card))[0] == "smashed"
+        assert await votes_of(conn, session_id) == []
+
+    run(database, scenario)
+
+
+def test_decide_returns_the_hydrated_session_and_the_winner(database):
+    async def scenario(conn):
+        session_id, (first, second) = await new_session(conn, cards=2)
+        result = await conn.fetchval(sessions.DECIDE_SQL, session_id, first, "smash", 1)
+        assert result["status"] == "active"
+        assert [card["id"] for card in result["remainingCards"]] == [str(second)]
+        assert "winner" not in result
+
+        result = await conn.fetchval(sessions.DECIDE_SQL, session_id, second, "pass", 1)
+        # One smashed card: it wins without a duel
+        assert result["status"] == "finished"
+        assert result["winner"]["id"] == str(first)
+        assert [card["id"] for card in result["passedCards"]] == [str(second)]
+
+        error = await conn.fetchval(sessions.DECIDE_SQL, session_id, first, "pass", 1)
+        assert error == {"error": "Session already finished", "status_code": 400}
+
+    run(database, scenario)
+
+
+def test_apply_decisions_applies_a_batch_and_reports_the_rest(database):
+    async def scenario(conn):
+        session_id, (first, second, third) = await new_session(conn)
+        await conn.fetchval(sessions.APPLY_DECISION_SQL, session_id, first, "pass", 1)
+        batch = [
+            {"index": 0, "card_id": str(first), "decision": "smash", "round": 1},
+            {"index": 1, "card_id": str(second), "decision": "smash", "round": 1},
+            {"index": 2, "card_id": str(uuid.uuid4()), "decision": "pass", "round": 1},
+            {"index": 3, "card_id": str(second), "decision": "pass", "round": 1},
+            {"index": 4, "card_id": str(third), "decision": "pass", "round": 2},
+        ]
+        result = await conn.fetchval(sessions.APPLY_DECISIONS_SQL, session_id, batch)
+        assert result["applied"] == 2
+        assert [(item["index"], item["reason"]) for item in result["rejected"]] == [
+            (0, "already_passed"), (2, "not_in_session"), (3, "already_decided"),
+        ]
+
+        row = await conn.fetchrow("SELECT card_seq, status FROM sessions WHERE id = $1", session_id)
+        # One smashed card and nothing left: finished
+        assert row["card_seq"] == 6 and row["status"] == "finished"
+        assert (first, "smash", 1, "swipe") not in await votes_of(conn, session_id)
+        assert (third, "pass", 2, "swipe") in await votes_of(conn, session_id)
+
+        result = await conn.fetchval(sessions.APPLY_DECISIONS_SQL, uuid.uuid4(), [])
+        assert result["status_code"] == 404
+
+    run(database, scenario)
+
+
+def test_decide_compact_returns_counts_and_the_next_cards(database):
+    async def scenario(conn):
+        session_id, (first, second, third) = await new_session(conn)
+        result = await conn.fetchval(sessions.DECIDE_COMPACT_SQL, session_id, first, "smash", 1, 1)
+        assert result["changedCards"] == [str(first)]
+        assert result["counts"] == {"remaining": 2, "passed": 0, "smashed": 1}
+        assert [card["id"] for card in result["nextCards"]] == [str(second)]
+
+        await conn.fetchval(sessions.DECIDE_COMPACT_SQL, session_id, second, "pass", 1, 1)
+        result = await conn.fetchval(sessions.DECIDE_COMPACT_SQL, session_id, third, "pass", 1, 1)
+        assert result["status"] == "finished" and result["nextCards"] == []
+        assert result["winner"]["id"] == str(first)
+
+    run(database, scenario)
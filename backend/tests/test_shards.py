@@ -0,0 +1,50 @@
+import uuid
+
+import shards
+
+SESSIONS = [str(uuid.UUID(int=n * 7919 + 1)) for n in range(5000)]
+
+
+def placement(ring):
+    return {key: ring.node(key) for key in SESSIONS}
+
+
+def test_placement_is_deterministic():
+    nodes = ["main", "shard1", "shard2"]
+    assert placement(shards.HashRing(nodes)) == placement(shards.HashRing(list(reversed(nodes))))
+
+
+def test_every_node_gets_a_share():
+    counts = {}
+    for node in placement(shards.HashRing(["main", "shard1", "shard2"])).values():
+        counts[node] = counts.get(node, 0) + 1
+    assert set(counts) == {"main", "shard1", "shard2"}
+    assert min(counts.values()) > len(SESSIONS) / 3 * 0.5
+
+
+def test_adding_a_node_only_moves_sessions_to_it():
+    before = placement(shards.HashRing(["main", "shard1"]))
+    after = placement(shards.HashRing(["main", "shard1", "shard2"]))
+    moved = [key for key in SESSIONS if before[key] != after[key]]
+    assert moved
+    assert all(after[key] == "shard2" for key in moved)
+    # Roughly the new node's share, not a reshuffle
+    assert len(moved) < len(SESSIONS) * 0.5
+
+
+def test_removing_a_node_only_moves_its_sessions():
+    before = placement(shards.HashRing(["main", "shard1", "shard2"]))
+    after = placement(shards.HashRing(["main", "shard2"]))
+    for key in SESSIONS:
+        if before[key] != "shard1":
+            assert after[key] == before[key]
+        else:
+            assert after[key] in ("main", "shard2")
+
+
+def test_session_key_is_spelling_independent():
+    session_id = uuid.uuid4()
+    ring = shards.HashRing(["main", "shard1", "shard2"])
+    spellings = [session_id, str(session_id), str(session_id).upper(), session_id.hex]
+    assert len({shards.session_key(spelling) for spelling in spellings}) == 1
+    assert len({ring.node(shards.session_key(spelling)) for spelling in spellings}) == 1
@@ -0,0 +1,42 @@
+import csv
+import gzip
+import os
+from datetime import date
+
+import vote_partitions
+from test_session_sql import new_session, run
+
+
+def months_ago(months: int) -> date:
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def test_expired_partition_is_archived_and_dropped(database, tmp_path):
+    start, end = months_ago(24), months_ago(23)
+    name = f"votes_y{start:%Y}m{start:%m}"
+
+    async def scenario(conn):
+        session_id, (card, _, _) = await new_session(conn)
+        await conn.execute(f"CREATE TABLE {name} PARTITION OF votes FOR VALUES FROM ('{start}') TO ('{end}')")
+        await conn.execute(
+            "INSERT INTO votes (session_id, card_id, decision, mode, timestamp) VALUES ($1, $2, 'smash', 'swipe', $3)",
+            session_id, card, start,
+        )
+
+        result = await vote_partitions.maintain_once(conn, retention_months=12, archive_dir=str(tmp_path))
+        assert result["detached"] == [name]
+        assert result["archived"] == [os.path.join(str(tmp_path), f"{name}.csv.gz")]
+        assert await conn.fetchval("SELECT to_regclass($1)", name) is None
+        assert await conn.fetchval("SELECT count(*) FROM votes WHERE session_id = $1", session_id) == 0
+        # The current month and the ones ahead are still there
+        assert await conn.fetchval("SELECT votes_create_partitions($1)", vote_partitions.VOTE_PARTITIONS_AHEAD) == 0
+        return session_id, card
+
+    session_id, card = run(database, scenario)
+    with gzip.open(tmp_path / f"{name}.csv.gz", "rt") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["session_id"], row["card_id"], row["decision"]) for row in rows] == [
+        (str(session_id), str(card), "smash"),
+    ]
@@ -0,0 +1,130 @@
+import asyncio
+import contextlib
+import glob
+import os
+import uuid
+
+import pytest
+
+import vote_writer
+
+
+class VotesConn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def copy_records_to_table(self, table, records, columns):
+        if self.pool.down:
+            raise ConnectionError("database is down")
+        assert table == "votes" and columns == vote_writer.VOTE_COLUMNS
+        self.pool.rows.extend(records)
+
+
+class VotesPool:
+    def __init__(self, down=False):
+        self.down = down
+        self.rows = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield VotesConn(self)
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(vote_writer, "VOTE_SPOOL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def votes(count, session_id=None):
+    session_id = session_id or uuid.uuid4()
+    now = vote_writer.vote_timestamp()
+    return [vote_writer.vote_row(session_id, uuid.uuid4(), "smash", 1, "swipe", now) for _ in range(count)]
+
+
+def spool_files(spool_dir):
+    return sorted(glob.glob(os.path.join(str(spool_dir), "*")))
+
+
+def test_queued_votes_are_flushed_on_stop():
+    pool = VotesPool()
+    rows = votes(3)
+
+    async def scenario():
+        writer = vote_writer.VoteWriter()
+        await writer.start(pool)
+        await writer.submit(rows)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert pool.rows == rows
+    assert writer.stats()["flushed"] == 3
+
+
+def test_unwritten_votes_are_spooled_and_replayed_on_next_start(spool_dir):
+    rows = votes(3)
+
+    async def shutdown_while_down():
+        writer = vote_writer.VoteWriter()
+        await writer.start(VotesPool(down=True))
+        await writer.submit(rows)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(shutdown_while_down())
+    assert writer.spooled == 3
+    assert len(spool_files(spool_dir)) == 1
+
+    pool = VotesPool()
+
+    async def restart():
+        writer = vote_writer.VoteWriter()
+        await writer.start(pool)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(restart())
+    # Same ids, UUIDs and timestamps as before the spool round trip
+    assert pool.rows == rows
+    assert writer.replayed == 3
+    assert spool_files(spool_dir) == []
+
+
+def test_replay_keeps_the_spool_while_the_database_is_down(spool_dir):
+    rows = votes(2)
+    writer = vote_writer.VoteWriter()
+    writer._spool(rows)
+
+    async def restart(pool):
+        writer = vote_writer.VoteWriter()
+        await writer.start(pool)
+        await writer.stop()
+        return writer
+
+    assert asyncio.run(restart(VotesPool(down=True))).replayed == 0
+    assert len(spool_files(spool_dir)) == 1
+
+    pool = VotesPool()
+    assert asyncio.run(restart(pool)).replayed == 2
+    assert pool.rows == rows
+    assert spool_files(spool_dir) == []
+
+
+def test_flush_returns_only_the_rows_of_the_failed_node():
+    up, down = VotesPool(), VotesPool(down=True)
+    up_rows, down_rows = votes(2), votes(1)
+    down_session = down_rows[0][1]
+
+    async def route(session_id):
+        return down if session_id == down_session else up
+
+    async def scenario():
+        writer = vote_writer.VoteWriter()
+        writer.route = route
+        return await writer._flush(up_rows + down_rows), writer
+
+    failed, writer = asyncio.run(scenario())
+    assert failed == down_rows
+    assert up.rows == up_rows
+    assert writer.flushed == 2 and writer.flush_failures == 1
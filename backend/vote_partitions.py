@@ -0,0 +1,141 @@
+"""
+Maintenance of the monthly votes partitions (see votes in db/init.sql).
+
+Every VOTE_PARTITION_CHECK_INTERVAL seconds each worker's `run_maintenance()`
+makes sure partitions exist VOTE_PARTITIONS_AHEAD months ahead. With
+VOTE_RETENTION_MONTHS > 0 it also enforces retention: partitions that ended
+more than that many months ago are detached from votes, written to
+VOTE_ARCHIVE_DIR as gzipped CSV (with a header row) and dropped. A table
+detached but not yet archived (crash in between) is picked up on the next
+pass. A pass runs under an advisory lock, so one worker does the work.
+With session shards (shards.py) every node has its own votes partitions;
+the archives of a node other than the catalog go to
+VOTE_ARCHIVE_DIR/<node>.
+
+Archived votes stay counted in the leaderboard rollups. To look at them
+again, load a file into a standalone table, not into votes (that would
+count them twice):
+    \\copy votes_archive FROM PROGRAM 'gunzip -c votes_y2025m01.csv.gz' CSV HEADER
+
+Also runnable once by hand: python -m jobs.maintain_votes
+"""
+import asyncio
+import gzip
+import os
+from typing import List
+
+import admission
+import shards
+
+VOTE_PARTITIONS_AHEAD = int(os.getenv("VOTE_PARTITIONS_AHEAD", "3"))
+VOTE_RETENTION_MONTHS = int(os.getenv("VOTE_RETENTION_MONTHS", "0"))
+VOTE_ARCHIVE_DIR = os.getenv("VOTE_ARCHIVE_DIR", "archive")
+VOTE_PARTITION_CHECK_INTERVAL = float(os.getenv("VOTE_PARTITION_CHECK_INTERVAL", "3600"))
+# DETACH needs a short exclusive lock on votes; give up rather than queue behind long inserts
+DETACH_LOCK_TIMEOUT = "5s"
+
+MAINTENANCE_LOCK_SQL = "SELECT pg_try_advisory_lock(hashtext('votes_maintenance'))"
+MAINTENANCE_UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtext('votes_maintenance'))"
+
+EXPIRED_PARTITIONS_SQL = """
+SELECT name FROM votes_partitions
+WHERE NOT is_default
+  AND range_end <= date_trunc('month', CURRENT_TIMESTAMP) - make_interval(months => $1)
+ORDER BY range_end
+"""
+
+# Former partitions: detached, waiting to be archived. Only in the schema
+# the unqualified names below resolve to, never a same-named table elsewhere
+DETACHED_PARTITIONS_SQL = r"""
+SELECT relname AS name FROM pg_class
+WHERE relkind = 'r' AND NOT relispartition
+  AND relnamespace = current_schema()::regnamespace
+  AND (relname ~ '^votes_y\d{4}m\d{2}$' OR relname = 'votes_legacy')
+ORDER BY relname
+"""
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def ensure_partitions(conn) -> int:
+    return await conn.fetchval("SELECT votes_create_partitions($1)", VOTE_PARTITIONS_AHEAD)
+
+
+async def detach_expired(conn, retention_months: int) -> List[str]:
+    detached = []
+    for row in await conn.fetch(EXPIRED_PARTITIONS_SQL, retention_months):
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+            await conn.execute(f"ALTER TABLE votes DETACH PARTITION {quote_ident(row['name'])}")
+        detached.append(row["name"])
+    return detached
+
+
+def _fsync(path: str):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+async def archive_table(conn, name: str, archive_dir: str) -> str:
+    """
+    Writes a detached partition to <archive_dir>/<name>.csv.gz, then drops it.
+    Compression and file I/O run in a thread, one COPY chunk at a time, so the
+    API workers' event loop keeps serving while a large partition is archived.
+    """
+    await asyncio.to_thread(os.makedirs, archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial = path + ".partial"
+    f = await asyncio.to_thread(gzip.open, partial, "wb")
+    try:
+        async def write(chunk: bytes):
+            await asyncio.to_thread(f.write, chunk)
+
+        await conn.copy_from_table(name, output=write, format="csv", header=True)
+    finally:
+        await asyncio.to_thread(f.close)
+    await asyncio.to_thread(_fsync, partial)
+    await asyncio.to_thread(os.replace, partial, path)
+    await conn.execute(f"DROP TABLE {quote_ident(name)}")
+    return path
+
+
+async def maintain_once(conn, retention_months: int = VOTE_RETENTION_MONTHS, archive_dir: str = VOTE_ARCHIVE_DIR) -> dict:
+    """One maintenance pass; returns what was done (empty if another worker holds the lock)."""
+    if not await conn.fetchval(MAINTENANCE_LOCK_SQL):
+        return {}
+    try:
+        result = {"created": await ensure_partitions(conn), "detached": [], "archived": []}
+        if retention_months > 0:
+            result["detached"] = await detach_expired(conn, retention_months)
+            for row in await conn.fetch(DETACHED_PARTITIONS_SQL):
+                result["archived"].append(await archive_table(conn, row["name"], archive_dir))
+        return result
+    finally:
+        await conn.execute(MAINTENANCE_UNLOCK_SQL)
+
+
+def archive_dir_for(node: str, archive_dir: str = VOTE_ARCHIVE_DIR) -> str:
+    """Archives of a session node other than the catalog go to a subdirectory."""
+    return archive_dir if node == shards.MAIN_NODE else os.path.join(archive_dir, node)
+
+
+async def run_maintenance(nodes):
+    """
+    Background loop started in the lifespan over (node, pool) pairs; errors
+    are logged and retried on the next pass.
+    """
+    admission.set_priority(admission.LOW)
+    while True:
+        for node, pool in nodes:
+            try:
+                async with pool.acquire() as conn:
+                    result = await maintain_once(conn, archive_dir=archive_dir_for(node))
+                if result.get("created") or result.get("archived"):
+                    print(f"Votes partitions ({node}): {result}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Votes partition maintenance on {node} failed: {e}")
+        await asyncio.sleep(VOTE_PARTITION_CHECK_INTERVAL)
@@ -0,0 +1,296 @@
+"""
+Optional write-behind for the votes table (VOTE_WRITE_BEHIND=1).
+
+In this mode pool connections start with `pickme.defer_votes = on`, so the
+session_apply_decision*() functions skip their INSERT INTO votes and the
+routes hand the vote rows to `writer.submit()` instead. A background task
+collects them from a bounded asyncio queue and flushes a batch with COPY
+when VOTE_BATCH_SIZE rows are waiting or VOTE_FLUSH_INTERVAL has passed.
+
+- Backpressure: when the queue is full `submit()` waits up to
+  VOTE_ENQUEUE_TIMEOUT, then writes the rows itself (synchronously).
+- Durability: on shutdown the queue is drained and flushed; rows that
+  still cannot reach the database are appended to a per-process NDJSON
+  spool file in VOTE_SPOOL_DIR, which the next startup replays.
+- Session shards: with a `route` (session_id -> pool, see shards.py) a
+  batch is split by the node of each row's session and every node's part
+  is written on its own; only the parts that failed are retried or spooled.
+- Metrics: `writer.stats()` (queue depth, flush latency, ...), exposed on
+  GET /metrics.
+"""
+import asyncio
+import glob
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import asyncpg
+import orjson
+
+import admission
+
+VOTE_WRITE_BEHIND = os.getenv("VOTE_WRITE_BEHIND", "0").lower() in ("1", "true", "yes", "on")
+VOTE_BATCH_SIZE = int(os.getenv("VOTE_BATCH_SIZE", "500"))
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "1.0"))
+VOTE_QUEUE_SIZE = int(os.getenv("VOTE_QUEUE_SIZE", "10000"))
+VOTE_ENQUEUE_TIMEOUT = float(os.getenv("VOTE_ENQUEUE_TIMEOUT", "0.5"))
+VOTE_SPOOL_DIR = os.getenv("VOTE_SPOOL_DIR", "spool")
+VOTE_FLUSH_RETRIES = 3
+
+VOTE_COLUMNS = ["id", "session_id", "card_id", "decision", "round", "mode", "timestamp"]
+
+# Rows whose session or card was deleted before the flush are dropped here
+# instead of failing the whole COPY batch on the foreign keys
+INSERT_EXISTING_VOTES_SQL = """
+INSERT INTO votes (id, session_id, card_id, decision, round, mode, timestamp)
+SELECT t.id, t.session_id, t.card_id, t.decision, t.round, t.mode, t.ts
+FROM unnest($1::uuid[], $2::uuid[], $3::uuid[], $4::text[], $5::int[], $6::text[], $7::timestamp[])
+    AS t(id, session_id, card_id, decision, round, mode, ts)
+WHERE EXISTS (SELECT 1 FROM sessions s WHERE s.id = t.session_id)
+  AND EXISTS (SELECT 1 FROM cards c WHERE c.id = t.card_id)
+"""
+
+VoteRow = Tuple[uuid.UUID, uuid.UUID, uuid.UUID, str, int, Optional[str], datetime]
+
+
+def server_settings() -> dict:
+    """Startup settings for pool connections (kept across asyncpg's RESET ALL)."""
+    return {"pickme.defer_votes": "on"} if VOTE_WRITE_BEHIND else {}
+
+
+def vote_timestamp() -> datetime:
+    # votes.timestamp is TIMESTAMP (no time zone) in UTC, like CURRENT_TIMESTAMP in the container
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def vote_row(session_id, card_id, decision: str, round: int, mode: Optional[str], timestamp: datetime) -> VoteRow:
+    return (uuid.uuid4(), uuid.UUID(str(session_id)), uuid.UUID(str(card_id)), decision, round, mode, timestamp)
+
+
+async def insert_votes(conn, rows: List[VoteRow]):
+    try:
+        await conn.copy_records_to_table("votes", records=rows, columns=VOTE_COLUMNS)
+    except asyncpg.ForeignKeyViolationError:
+        await conn.execute(INSERT_EXISTING_VOTES_SQL, *(list(column) for column in zip(*rows)))
+
+
+class VoteWriter:
+    def __init__(self):
+        self.pool = None
+        self.route = None
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Batch the flusher has taken off the queue, and its flush in progress
+        self._batch: List[VoteRow] = []
+        self._flushing: Optional[asyncio.Future] = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.direct_writes = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    async def start(self, pool, route=None):
+        self.pool = pool
+        self.route = route
+        self.queue = asyncio.Queue(maxsize=VOTE_QUEUE_SIZE)
+        await self._replay_spool()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flusher and writes out everything still queued (DB, else spool file)."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # The batch in hand is not lost with the task; a flush already
+        # under way is let finish rather than written a second time
+        rows = self._batch
+        if self._flushing is not None:
+            rows = await self._flushing
+        self._batch, self._flushing = [], None
+        rows = rows + self._drain()
+        if rows:
+            rows = await self._flush(rows)
+        if rows:
+            self._spool(rows)
+
+    async def submit(self, rows: Iterable[VoteRow]):
+        """Queues vote rows; while the flusher is not running they are written right away."""
+        rows = list(rows)
+        if not rows:
+            return
+        if not self.enabled:
+            await self._write(rows)
+            return
+        queued = 0
+        try:
+            for row in rows:
+                await asyncio.wait_for(self.queue.put(row), timeout=VOTE_ENQUEUE_TIMEOUT)
+                queued += 1
+        except asyncio.TimeoutError:
+            # Queue stays full: the flusher is behind, write the rest ourselves
+            self.direct_writes += len(rows) - queued
+            await self._write(rows[queued:])
+        finally:
+            self.enqueued += queued
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "queue_capacity": VOTE_QUEUE_SIZE,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "direct_writes": self.direct_writes,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._flush_ms_total / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+    async def _run(self):
+        # Queued votes are decisions already answered: they go first for a connection
+        admission.set_priority(admission.HIGH)
+        while True:
+            rows = self._batch = [await self.queue.get()]
+            # asyncio.timeout rather than wait_for: on 3.11 wait_for can swallow
+            # the cancel of stop() when the get completes at the same moment
+            try:
+                async with asyncio.timeout(VOTE_FLUSH_INTERVAL):
+                    while len(rows) < VOTE_BATCH_SIZE:
+                        rows.append(await self.queue.get())
+            except TimeoutError:
+                pass
+            for attempt in range(VOTE_FLUSH_RETRIES):
+                self._flushing = asyncio.ensure_future(self._flush(rows))
+                rows = self._batch = await asyncio.shield(self._flushing)
+                self._flushing = None
+                if not rows:
+                    break
+                await asyncio.sleep(2 ** attempt)
+            else:
+                self._spool(rows)
+            self._batch = []
+
+    async def _groups(self, rows: List[VoteRow]) -> List[Tuple[object, List[VoteRow]]]:
+        """(pool, rows) per node holding the rows' sessions; one group without a route."""
+        if self.route is None:
+            return [(self.pool, rows)]
+        pools, groups = {}, {}
+        for row in rows:
+            if row[1] not in pools:
+                pools[row[1]] = await self.route(row[1])
+            groups.setdefault(pools[row[1]], []).append(row)
+        return list(groups.items())
+
+    async def _write(self, rows: List[VoteRow]):
+        for pool, group in await self._groups(rows):
+            async with pool.acquire() as conn:
+                await insert_votes(conn, group)
+
+    async def _flush(self, rows: List[VoteRow]) -> List[VoteRow]:
+        """Writes a batch; returns the rows that could not be written."""
+        started = time.perf_counter()
+        try:
+            groups = await self._groups(rows)
+        except Exception as e:
+            self.flush_failures += 1
+            print(f"Vote flush of {len(rows)} rows failed: {e}")
+            return rows
+        failed = []
+        for pool, group in groups:
+            try:
+                async with pool.acquire() as conn:
+                    await insert_votes(conn, group)
+            except Exception as e:
+                self.flush_failures += 1
+                print(f"Vote flush of {len(group)} rows failed: {e}")
+                failed.extend(group)
+        if len(failed) == len(rows):
+            return failed
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed += len(rows) - len(failed)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._flush_ms_total += elapsed_ms
+        return failed
+
+    def _drain(self) -> List[VoteRow]:
+        rows = []
+        while self.queue is not None and not self.queue.empty():
+            rows.append(self.queue.get_nowait())
+        return rows
+
+    def _spool(self, rows: List[VoteRow]):
+        os.makedirs(VOTE_SPOOL_DIR, exist_ok=True)
+        path = os.path.join(VOTE_SPOOL_DIR, f"votes-{os.getpid()}.ndjson")
+        with open(path, "ab") as f:
+            for row in rows:
+                f.write(orjson.dumps(row) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.spooled += len(rows)
+        print(f"Spooled {len(rows)} votes to {path}")
+
+    async def _replay_spool(self):
+        for path in sorted(glob.glob(os.path.join(VOTE_SPOOL_DIR, "votes-*.ndjson"))):
+            # Claim the file first so another worker starting now skips it
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            rows = []
+            with open(claimed, "rb") as f:
+                for line in f:
+                    vote_id, session_id, card_id, decision, round, mode, ts = orjson.loads(line)
+                    rows.append((
+                        uuid.UUID(vote_id), uuid.UUID(session_id), uuid.UUID(card_id),
+                        decision, round, mode, datetime.fromisoformat(ts),
+                    ))
+            os.remove(claimed)
+            for start in range(0, len(rows), VOTE_BATCH_SIZE):
+                failed = await self._flush(rows[start:start + VOTE_BATCH_SIZE])
+                if failed:
+                    # Keep what is left for the next start
+                    self._spool(failed + rows[start + VOTE_BATCH_SIZE:])
+                    return
+            self.replayed += len(rows)
+            print(f"Replayed {len(rows)} spooled votes from {path}")
+
+
+writer = VoteWriter()
+
+
+async def record(session_id, mode: str, decisions: Iterable[Tuple[str, str, int]]):
+    """
+    Votes (card_id, decision, round) cast in session mode `mode` that the SQL
+    functions skipped because of pickme.defer_votes; no-op unless write-behind is on.
+    Like CURRENT_TIMESTAMP in one transaction, all rows of a call share a
+    timestamp (the win of a duel sorts before its loss, see jobs/fit_ratings.py).
+    """
+    if not VOTE_WRITE_BEHIND:
+        return
+    now = vote_timestamp()
+    await writer.submit(
+        vote_row(session_id, card_id, decision, round, mode, now) for card_id, decision, round in decisions
+    )
@@ -9,14 +9,28 @@ const api = axios.create({
   },
 });
 
+// Списки постраничные: курсор следующей страницы приходит в заголовке X-Next-Cursor
+export const nextCursor = (response) => response.headers['x-next-cursor'] || null;
+
 // Decks
-export const getDecks = (userId = null) => {
+export const getDecks = (userId = null, cursor = null) => {
   const params = userId ? { user_id: userId } : {};
+  if (cursor) params.cursor = cursor;
   return api.get('/decks', { params });
 };
 
+// Колоды для списка: число карточек, обложка и прогресс активной сессии
+export const getDeckSummaries = (userId = null, cursor = null) => {
+  const params = userId ? { user_id: userId } : {};
+  if (cursor) params.cursor = cursor;
+  return api.get('/decks/summary', { params });
+};
+
 export const getDeck = (id) => api.get(`/decks/${id}`);
 
+export const getDeckLeaderboard = (id, sort = 'win_rate', limit = null) =>
+  api.get(`/decks/${id}/leaderboard`, { params: limit ? { sort, limit } : { sort } });
+
 export const createDeck = (data) => api.post('/decks', data);
 
 export const updateDeck = (id, data) => api.put(`/decks/${id}`, data);
@@ -24,7 +38,17 @@ export const updateDeck = (id, data) => api.put(`/decks/${id}`, data);
 export const deleteDeck = (id) => api.delete(`/decks/${id}`);
 
 // Cards
-export const getCards = (deckId) => api.get(`/cards/deck/${deckId}`);
+// Все карточки колоды: проходим страницы по курсору
+export const getCards = async (deckId) => {
+  const cards = [];
+  let cursor = null;
+  do {
+    const response = await api.get(`/cards/deck/${deckId}`, { params: cursor ? { cursor } : {} });
+    cards.push(...response.data);
+    cursor = nextCursor(response);
+  } while (cursor);
+  return { data: cards };
+};
 
 export const getCard = (id) => api.get(`/cards/${id}`);
 
@@ -32,6 +56,12 @@ export const createCard = (data) => api.post('/cards', data);
 
 export const createCardsBulk = (deckId, cards) => api.post(`/cards/deck/${deckId}/bulk`, { cards });
 
+// Потоковый импорт: body — содержимое NDJSON- или CSV-файла (строка, Blob или File)
+export const importCards = (deckId, body, format = 'ndjson') =>
+  api.post(`/cards/deck/${deckId}/import`, body, {
+    headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' },
+  });
+
 export const updateCard = (id, data) => api.put(`/cards/${id}`, data);
 
 export const deleteCard = (id) => api.delete(`/cards/${id}`);
@@ -43,11 +73,36 @@ export const getActiveSession = (deckId) => api.get(`/sessions/deck/${deckId}/ac
 
 export const getSessionState = (sessionId) => api.get(`/sessions/${sessionId}/state`);
 
+// Push изменений сессии (SSE) вместо опроса /state.
+// onEvent получает snapshot/update-дельты и resync (нужно перечитать /state).
+// Возвращает функцию отписки
+export const subscribeSessionEvents = (sessionId, onEvent) => {
+  const source = new EventSource(`${API_URL}/sessions/${sessionId}/events`);
+  const handle = (e) => onEvent(JSON.parse(e.data));
+  source.addEventListener('update', handle);
+  source.addEventListener('resync', handle);
+  return () => source.close();
+};
+
 export const recordDecision = (sessionId, cardId, decision, round = 1) => 
   api.post(`/sessions/${sessionId}/decision`, { card_id: cardId, decision, round });
 
+// Compact-ответ: изменившаяся карта, счетчики и несколько следующих карточек
+export const recordDecisionCompact = (sessionId, cardId, decision, round = 1, nextCards = 3) =>
+  api.post(`/sessions/${sessionId}/decision`, { card_id: cardId, decision, round }, {
+    params: { view: 'compact', next_cards: nextCards },
+  });
+
+// Пакет решений из офлайн-очереди: [{ card_id, decision, round }, ...]
+export const recordDecisions = (sessionId, decisions) =>
+  api.post(`/sessions/${sessionId}/decisions`, { decisions });
+
 export const getDuelPair = (sessionId) => api.post(`/sessions/${sessionId}/duel`);
 
+// Исход батла одним запросом: ответ содержит следующую пару или победителя
+export const resolveDuel = (sessionId, winnerId, loserId, round = 1) =>
+  api.post(`/sessions/${sessionId}/duel/resolve`, { winner_id: winnerId, loser_id: loserId, round });
+
 export const startDuel = (sessionId) => api.post(`/sessions/${sessionId}/start-duel`);
 
 export const returnToSwipe = (sessionId) => api.post(`/sessions/${sessionId}/return-to-swipe`);
@@ -1,11 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getDecks, deleteDeck } from '../api';
+import { getDeckSummaries, deleteDeck, nextCursor } from '../api';
 import './DeckList.css';
 
 function DeckList() {
   const [decks, setDecks] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [cursor, setCursor] = useState(null);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -15,8 +16,9 @@ function DeckList() {
   const loadDecks = async () => {
     try {
       setLoading(true);
-      const response = await getDecks();
+      const response = await getDeckSummaries();
       setDecks(response.data);
+      setCursor(nextCursor(response));
     } catch (error) {
       console.error('Error loading decks:', error);
     } finally {
@@ -24,6 +26,16 @@ function DeckList() {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      const response = await getDeckSummaries(null, cursor);
+      setDecks([...decks, ...response.data]);
+      setCursor(nextCursor(response));
+    } catch (error) {
+      console.error('Error loading decks:', error);
+    }
+  };
+
   const handleDelete = async (id, e) => {
     e.stopPropagation();
     if (window.confirm('Are you sure you want to delete this deck?')) {
@@ -84,11 +96,31 @@ function DeckList() {
                   </button>
                 </div>
               </div>
+              {deck.cover_image_url && (
+                <img className="deck-cover" src={deck.cover_image_url} alt={deck.title} />
+              )}
               {deck.description && <p className="deck-description">{deck.description}</p>}
+              <div className="deck-stats">
+                <span>{deck.card_count} cards</span>
+                {deck.active_session && (
+                  <span>
+                    In progress: {deck.active_session.remaining_count} left,{' '}
+                    {deck.active_session.smashed_count} smashed
+                  </span>
+                )}
+              </div>
             </div>
           ))}
         </div>
       )}
+
+      {cursor && (
+        <div className="deck-list-more">
+          <button className="btn btn-secondary" onClick={loadMore}>
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 }
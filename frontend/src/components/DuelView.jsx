@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
-import { getSessionState, getDuelPair, recordDecision } from '../api';
+import { getSessionState, getDuelPair, resolveDuel } from '../api';
 import './DuelView.css';
 
 function DuelView() {
@@ -68,28 +68,21 @@ function DuelView() {
     try {
       setProcessing(true);
 
-      // записываем решения последовательно, чтобы избежать race condition
-      // Сначала записываем решение для выбранной карты (smash)
-      await recordDecision(sessionId, chosenCard.id, 'smash', round);
-      // Затем записываем решение для не выбранной карты (pass)
-      await recordDecision(sessionId, otherCard.id, 'pass', round);
+      // Один запрос: сервер записывает smash для выбранной карты и pass
+      // для второй, а в ответе сразу присылает следующую пару или победителя
+      const response = await resolveDuel(sessionId, chosenCard.id, otherCard.id, round);
+      const result = response.data;
 
-      // обновляем состояние сессии
-      const stateResponse = await getSessionState(sessionId);
-      const session = stateResponse.data;
-
-      // если сессия завершена или осталась одна карта — редирект на победителя
-      if (session.status === 'finished') {
-        navigate(`/session/${sessionId}/winner`);
-      } else if (session.remainingCards && session.remainingCards.length === 1) {
-        // Если осталась одна карта, завершаем сессию и идем к победителю
+      // если сессия завершена — редирект на победителя
+      if (result.status === 'finished') {
         navigate(`/session/${sessionId}/winner`);
-      } else if (session.remainingCards && session.remainingCards.length < 2) {
+      } else if (!result.card1 || !result.card2) {
         // Если нет достаточно карт для батла, возвращаем в окно выбора
         navigate(`/session/${sessionId}/swipe-complete`);
       } else {
         setRound(prev => prev + 1);
-        await loadDuelPair();
+        setCard1(result.card1);
+        setCard2(result.card2);
       }
     } catch (error) {
       console.error('Error recording choice:', error);
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
-import { createSession, getSessionState, recordDecision } from '../api';
+import { createSession, getSessionState, recordDecisionCompact, subscribeSessionEvents } from '../api';
 import './SwipeView.css';
 
 function SwipeView() {
@@ -9,7 +9,7 @@ function SwipeView() {
 
   const [sessionId, setSessionId] = useState(null);
   const [currentCard, setCurrentCard] = useState(null);
-  const [remainingCards, setRemainingCards] = useState([]);
+  const [remainingCount, setRemainingCount] = useState(0);
   const [loading, setLoading] = useState(true);
   const [processing, setProcessing] = useState(false);
   
@@ -18,6 +18,7 @@ function SwipeView() {
   const [isDragging, setIsDragging] = useState(false);
   const startPosRef = useRef({ x: 0, y: 0 });
   const cardRef = useRef(null);
+  const remainingCountRef = useRef(0);
 
   const loadSessionState = useCallback(async (sid) => {
     try {
@@ -25,7 +26,7 @@ function SwipeView() {
       const session = response.data;
       const cards = session.remainingCards || [];
 
-      setRemainingCards(cards);
+      setRemainingCount(cards.length);
       
       if (cards.length > 0) {
         setCurrentCard(cards[0]);
@@ -74,18 +75,36 @@ function SwipeView() {
     initializeSession();
   }, [initializeSession]);
 
+  useEffect(() => {
+    remainingCountRef.current = remainingCount;
+  }, [remainingCount]);
+
+  // Изменения с другого устройства: перечитываем состояние, только если оно разошлось с нашим
+  useEffect(() => {
+    if (!sessionId) return undefined;
+    return subscribeSessionEvents(sessionId, (event) => {
+      if (event.type === 'resync') {
+        loadSessionState(sessionId);
+      } else if (event.action !== 'snapshot' && event.counts.remaining !== remainingCountRef.current) {
+        loadSessionState(sessionId);
+      } else if (event.mode === 'duel' || event.status === 'finished') {
+        navigate(`/session/${sessionId}/swipe-complete`);
+      }
+    });
+  }, [sessionId, loadSessionState, navigate]);
+
   const handleDecision = useCallback(async (decision) => {
     if (!currentCard || processing) return;
 
     try {
       setProcessing(true);
-      const response = await recordDecision(sessionId, currentCard.id, decision, 1);
+      const response = await recordDecisionCompact(sessionId, currentCard.id, decision, 1);
       
-      // Update state from response
+      // Update state from compact response: counts + next cards only
       const session = response.data;
-      const cards = session.remainingCards || [];
+      const cards = session.nextCards || [];
 
-      setRemainingCards(cards);
+      setRemainingCount(session.counts ? session.counts.remaining : cards.length);
 
       if (cards.length > 0) {
         setCurrentCard(cards[0]);
@@ -199,7 +218,7 @@ function SwipeView() {
         <h2>Swipe to Choose</h2>
         <div className="header-right">
           <div className="progress">
-            {remainingCards.length} cards remaining
+            {remainingCount} cards remaining
           </div>
           {sessionId && (
             <button 